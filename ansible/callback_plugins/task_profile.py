@@ -0,0 +1,458 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+
+DOCUMENTATION = r'''
+---
+name: task_profile
+type: aggregate
+short_description: Records the wall time spent per task, role, include and loop item of a playbook run.
+description:
+    - This callback plugin records the wall time spent per task (and per host), role, include and loop item,
+    - counts the 'until' retries of each task and accumulates the time spent waiting (in 'wait_for', 'pause'
+    - and 'k8s_wait_for' tasks and between 'until' retries).
+    - At the end of the playbook run, a JSON profile is written to the output directory and optionally
+    - a Prometheus textfile per playbook (for the node exporter textfile collector) is written.
+    - The slowest tasks are displayed along with the differences to the baseline profile of the same playbook.
+    - The first profile written for a playbook becomes its baseline profile (unless a baseline profile exists already).
+    - Only profiles of complete playbook runs (without failed or unreachable hosts and not limited by tags)
+    - become baseline profiles.
+version_added: "1.0"
+requirements:
+    - enable in configuration
+options:
+    output_dir:
+        description:
+            - The directory the JSON profiles (and the baseline profiles) are written to.
+        default: '~/.ansible/task_profiles'
+        type: path
+        env:
+            - name: TASK_PROFILE_OUTPUT_DIR
+        ini:
+            - section: callback_task_profile
+              key: output_dir
+    prometheus_textfile_dir:
+        description:
+            - The directory the Prometheus textfiles are written to (none are written if not set).
+            - The textfile of a playbook is named 'ocp_kvm_ipi_playbook_<playbook>.prom'.
+        default: null
+        type: path
+        env:
+            - name: TASK_PROFILE_PROMETHEUS_TEXTFILE_DIR
+        ini:
+            - section: callback_task_profile
+              key: prometheus_textfile_dir
+    top_tasks:
+        description:
+            - The number of slowest tasks (and of tasks with the largest differences to the baseline profile) to be displayed.
+        default: 20
+        type: int
+        env:
+            - name: TASK_PROFILE_TOP_TASKS
+        ini:
+            - section: callback_task_profile
+              key: top_tasks
+    update_baseline:
+        description:
+            - Whether the profile of this playbook run replaces the baseline profile of the playbook
+            - (if the playbook run is complete).
+        default: false
+        type: bool
+        env:
+            - name: TASK_PROFILE_UPDATE_BASELINE
+        ini:
+            - section: callback_task_profile
+              key: update_baseline
+'''
+
+
+import datetime
+import json
+import os
+import time
+from ansible import context
+from ansible.plugins.callback import CallbackBase
+
+
+# the (short and fully qualified) names of the include actions
+INCLUDE_ACTIONS = ['include_tasks', 'include_role', 'ansible.builtin.include_tasks', 'ansible.builtin.include_role']
+
+# the (short and fully qualified) names of the actions whose time is spent waiting,
+# mapped to the name of the result field containing the time (in seconds) spent waiting
+WAIT_ACTIONS = {
+    'wait_for': 'elapsed',
+    'ansible.builtin.wait_for': 'elapsed',
+    'pause': 'delta',
+    'ansible.builtin.pause': 'delta',
+    'k8s_wait_for': 'elapsed',
+}
+
+# the version of the JSON profile format
+PROFILE_VERSION = 1
+
+# the prefix of the metrics written to the Prometheus textfile
+METRICS_PREFIX = 'ocp_kvm_ipi_playbook'
+
+
+class CallbackModule(CallbackBase):
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = 'aggregate'
+    CALLBACK_NAME = 'task_profile'
+    CALLBACK_NEEDS_ENABLED = True
+
+    def __init__(self, *args, **kwargs):
+        super(CallbackModule, self).__init__(*args, **kwargs)
+
+        self.playbook = None
+        self.started = None
+        self.start_time = None
+
+        # task details in the order the tasks have been started, keyed by task uuid
+        self.tasks = {}
+
+        # the time of the last event of each task on each host, keyed by (task uuid, host name)
+        self.marks = {}
+
+    def set_options(self, task_keys=None, var_options=None, direct=None):
+        super(CallbackModule, self).set_options(task_keys=task_keys, var_options=var_options, direct=direct)
+
+        self.output_dir = os.path.expanduser(self.get_option('output_dir'))
+        self.prometheus_textfile_dir = self.get_option('prometheus_textfile_dir')
+        self.top_tasks = self.get_option('top_tasks')
+        self.update_baseline = self.get_option('update_baseline')
+
+    def v2_playbook_on_start(self, playbook):
+        self.playbook = os.path.splitext(os.path.basename(playbook._file_name))[0]
+        self.started = datetime.datetime.now(datetime.timezone.utc)
+        self.start_time = time.monotonic()
+
+    def v2_runner_on_start(self, host, task):
+        now = time.monotonic()
+        details = self._task_details(task)
+
+        details['hosts'][host.get_name()] = {
+            'start': now,
+            'end': None,
+            'status': 'running',
+            'retries': 0,
+            'waited': 0.0,
+            'items': [],
+        }
+        self.marks[(task._uuid, host.get_name())] = now
+
+    def v2_runner_on_ok(self, result):
+        self._task_finished(result, 'ok')
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        self._task_finished(result, 'failed')
+
+    def v2_runner_on_skipped(self, result):
+        self._task_finished(result, 'skipped')
+
+    def v2_runner_on_unreachable(self, result):
+        self._task_finished(result, 'unreachable')
+
+    def v2_runner_item_on_ok(self, result):
+        self._item_finished(result, 'ok')
+
+    def v2_runner_item_on_failed(self, result):
+        self._item_finished(result, 'failed')
+
+    def v2_runner_item_on_skipped(self, result):
+        self._item_finished(result, 'skipped')
+
+    def v2_runner_retry(self, result):
+        host = self._host(result)
+        if host is None:
+            return
+
+        host['retries'] += 1
+        host['waited'] += self._retry_delay(result._task)
+
+    def v2_playbook_on_stats(self, stats):
+        if self.playbook is None:
+            return
+
+        profile = self._profile(stats)
+        baseline = None
+
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+
+            profile_file = os.path.join(self.output_dir, '{}-{}.json'.format(self.playbook, self.started.strftime('%Y%m%dT%H%M%SZ')))
+            self._write(profile_file, json.dumps(profile, indent=2))
+
+            baseline_file = os.path.join(self.output_dir, '{}.baseline.json'.format(self.playbook))
+            if os.path.exists(baseline_file):
+                with open(baseline_file, 'r') as f:
+                    baseline = json.load(f)
+
+            # the profile of an incomplete playbook run isn't comparable to the profiles of subsequent runs
+            if (baseline is None or self.update_baseline) and self._is_complete(profile):
+                self._write(baseline_file, json.dumps(profile, indent=2))
+        except (OSError, ValueError) as e:
+            self._display.warning('task_profile: unable to write playbook profile: {}'.format(e))
+
+        if self.prometheus_textfile_dir:
+            try:
+                os.makedirs(self.prometheus_textfile_dir, exist_ok=True)
+                textfile = os.path.join(self.prometheus_textfile_dir, '{}_{}.prom'.format(METRICS_PREFIX, self.playbook))
+                self._write(textfile, self._metrics(profile))
+            except OSError as e:
+                self._display.warning('task_profile: unable to write Prometheus textfile: {}'.format(e))
+
+        self._display_profile(profile, baseline)
+
+    def _task_details(self, task):
+        if task._uuid not in self.tasks:
+            include = self._parent_include(task)
+
+            self.tasks[task._uuid] = {
+                'name': task.get_name(),
+                'role': task._role.get_name() if task._role else '',
+                'include': include.get_name() if include else '',
+                'path': task.get_path(),
+                'action': task.action,
+                'hosts': {},
+            }
+
+        return self.tasks[task._uuid]
+
+    def _parent_include(self, task):
+        parent = task._parent
+        while parent is not None:
+            if getattr(parent, 'action', None) in INCLUDE_ACTIONS:
+                return parent
+            parent = getattr(parent, '_parent', None)
+
+        return None
+
+    def _host(self, result):
+        details = self.tasks.get(result._task._uuid)
+        if details is None:
+            return None
+
+        return details['hosts'].get(result._host.get_name())
+
+    def _task_finished(self, result, status):
+        host = self._host(result)
+        if host is None:
+            return
+
+        host['end'] = time.monotonic()
+        host['status'] = status
+
+        # the retries reported by 'v2_runner_retry' are authoritative, 'attempts' covers plugins that don't call it
+        attempts = result._result.get('attempts')
+        if isinstance(attempts, int) and attempts - 1 > host['retries']:
+            host['waited'] += (attempts - 1 - host['retries']) * self._retry_delay(result._task)
+            host['retries'] = attempts - 1
+
+        field = WAIT_ACTIONS.get(result._task.action)
+        if field:
+            if host['items']:
+                host['waited'] += sum(i['waited'] for i in host['items'])
+            else:
+                host['waited'] += self._waited(result._result, field)
+
+    def _item_finished(self, result, status):
+        host = self._host(result)
+        if host is None:
+            return
+
+        key = (result._task._uuid, result._host.get_name())
+        now = time.monotonic()
+
+        # loop items are executed one after the other, so each item took the time since the previous one finished
+        field = WAIT_ACTIONS.get(result._task.action)
+        host['items'].append({
+            'item': self._get_item_label(result._result),
+            'status': status,
+            'duration': round(now - self.marks.get(key, now), 3),
+            'waited': self._waited(result._result, field) if field else 0.0,
+        })
+        self.marks[key] = now
+
+    def _retry_delay(self, task):
+        try:
+            return float(task.delay)
+        except (TypeError, ValueError):
+            return 0.0
+
+    def _waited(self, result, field):
+        try:
+            return float(result.get(field) or 0)
+        except (TypeError, ValueError):
+            return 0.0
+
+    def _profile(self, stats):
+        now = time.monotonic()
+        tasks = []
+        roles = {}
+        includes = {}
+
+        for details in self.tasks.values():
+            starts = [h['start'] for h in details['hosts'].values()]
+            ends = [h['end'] or now for h in details['hosts'].values()]
+            duration = round(max(ends) - min(starts), 3)
+
+            tasks.append({
+                'key': self._task_key(details),
+                'name': details['name'],
+                'role': details['role'],
+                'include': details['include'],
+                'path': details['path'],
+                'action': details['action'],
+                'start': round(min(starts) - self.start_time, 3),
+                'duration': duration,
+                'retries': sum(h['retries'] for h in details['hosts'].values()),
+                'waited': round(sum(h['waited'] for h in details['hosts'].values()), 3),
+                'hosts': dict(
+                    (name, {
+                        'status': h['status'],
+                        'duration': round((h['end'] or now) - h['start'], 3),
+                        'retries': h['retries'],
+                        'waited': round(h['waited'], 3),
+                        'items': h['items'],
+                    }) for name, h in details['hosts'].items()
+                ),
+            })
+
+            # the time spent in an include task itself is negligible, the included tasks are accounted for separately
+            if details['role']:
+                self._accumulate(roles, details['role'], min(starts), max(ends))
+            if details['include']:
+                self._accumulate(includes, details['include'], min(starts), max(ends))
+
+        return {
+            'version': PROFILE_VERSION,
+            'playbook': self.playbook,
+            'started': self.started.isoformat(),
+            'duration': round(now - self.start_time, 3),
+            'failed': any(stats.failures.values()),
+            'unreachable': any(stats.dark.values()),
+            'limited_by_tags': self._is_limited_by_tags(),
+            'retries': sum(t['retries'] for t in tasks),
+            'waited': round(sum(t['waited'] for t in tasks), 3),
+            'roles': self._wall_times(roles),
+            'includes': self._wall_times(includes),
+            'tasks': tasks,
+        }
+
+    def _is_limited_by_tags(self):
+        return set(context.CLIARGS.get('tags') or ['all']) != set(['all']) or bool(context.CLIARGS.get('skip_tags'))
+
+    def _is_complete(self, profile):
+        return not (profile['failed'] or profile['unreachable'] or profile['limited_by_tags'])
+
+    def _task_key(self, details):
+        return '{} : {}'.format(details['role'], details['name']) if details['role'] else details['name']
+
+    def _accumulate(self, intervals, name, start, end):
+        intervals.setdefault(name, []).append((start, end))
+
+    def _wall_times(self, intervals):
+
+        # overlapping tasks (e.g. of different hosts with strategy 'free') are only accounted for once
+        wall_times = {}
+        for name, spans in intervals.items():
+            total, current_start, current_end = 0.0, None, None
+            for start, end in sorted(spans):
+                if current_end is None or start > current_end:
+                    if current_end is not None:
+                        total += current_end - current_start
+                    current_start, current_end = start, end
+                else:
+                    current_end = max(current_end, end)
+            total += current_end - current_start
+            wall_times[name] = round(total, 3)
+
+        return wall_times
+
+    def _aggregate(self, profile):
+
+        # tasks run multiple times (e.g. included repeatedly) are summed up under the same key
+        durations = {}
+        for task in profile.get('tasks', []):
+            durations[task['key']] = durations.get(task['key'], 0.0) + task['duration']
+
+        return durations
+
+    def _display_profile(self, profile, baseline):
+        durations = self._aggregate(profile)
+
+        self._display.banner('TASK PROFILE ({})'.format(profile['playbook']))
+        self._display.display('total: {:.1f}s, until retries: {}, time spent waiting: {:.1f}s'.format(
+            profile['duration'], profile['retries'], profile['waited']))
+        if not self._is_complete(profile):
+            self._display.display('incomplete playbook run (failed or unreachable hosts, or limited by tags), not used as baseline profile')
+
+        self._display.display('slowest tasks:')
+        for key, duration in sorted(durations.items(), key=lambda d: d[1], reverse=True)[:self.top_tasks]:
+            self._display.display('  {:>9.1f}s  {}'.format(duration, key))
+
+        if profile['roles']:
+            self._display.display('roles:')
+            for role, duration in sorted(profile['roles'].items(), key=lambda r: r[1], reverse=True):
+                self._display.display('  {:>9.1f}s  {}'.format(duration, role))
+
+        if baseline is None:
+            return
+
+        baseline_durations = self._aggregate(baseline)
+        deltas = dict((key, durations.get(key, 0.0) - baseline_durations.get(key, 0.0)) for key in set(durations) | set(baseline_durations))
+
+        self._display.display('differences to baseline profile of {} (total: {:+.1f}s, until retries: {:+d}, time spent waiting: {:+.1f}s):'.format(
+            baseline.get('started', 'unknown'),
+            profile['duration'] - baseline.get('duration', 0.0),
+            profile['retries'] - baseline.get('retries', 0),
+            profile['waited'] - baseline.get('waited', 0.0)))
+        for key, delta in sorted(deltas.items(), key=lambda d: abs(d[1]), reverse=True)[:self.top_tasks]:
+            if round(delta, 1) == 0:
+                break
+            marker = ' (new)' if key not in baseline_durations else ' (gone)' if key not in durations else ''
+            self._display.display('  {:>+9.1f}s  {}{}'.format(delta, key, marker))
+
+    def _metrics(self, profile):
+        labels = 'playbook="{}"'.format(self._escape(profile['playbook']))
+
+        lines = [
+            '# HELP {}_duration_seconds Wall time of the last playbook run.'.format(METRICS_PREFIX),
+            '# TYPE {}_duration_seconds gauge'.format(METRICS_PREFIX),
+            '{}_duration_seconds{{{}}} {}'.format(METRICS_PREFIX, labels, profile['duration']),
+            '# HELP {}_retries Number of until retries of the last playbook run.'.format(METRICS_PREFIX),
+            '# TYPE {}_retries gauge'.format(METRICS_PREFIX),
+            '{}_retries{{{}}} {}'.format(METRICS_PREFIX, labels, profile['retries']),
+            '# HELP {}_waited_seconds Time spent waiting during the last playbook run.'.format(METRICS_PREFIX),
+            '# TYPE {}_waited_seconds gauge'.format(METRICS_PREFIX),
+            '{}_waited_seconds{{{}}} {}'.format(METRICS_PREFIX, labels, profile['waited']),
+            '# HELP {}_started_timestamp_seconds Start time of the last playbook run.'.format(METRICS_PREFIX),
+            '# TYPE {}_started_timestamp_seconds gauge'.format(METRICS_PREFIX),
+            '{}_started_timestamp_seconds{{{}}} {}'.format(METRICS_PREFIX, labels, int(self.started.timestamp())),
+            '# HELP {}_role_duration_seconds Wall time per role of the last playbook run.'.format(METRICS_PREFIX),
+            '# TYPE {}_role_duration_seconds gauge'.format(METRICS_PREFIX),
+        ]
+        for role, duration in sorted(profile['roles'].items()):
+            lines.append('{}_role_duration_seconds{{{},role="{}"}} {}'.format(METRICS_PREFIX, labels, self._escape(role), duration))
+
+        lines.extend([
+            '# HELP {}_task_duration_seconds Wall time per task of the last playbook run.'.format(METRICS_PREFIX),
+            '# TYPE {}_task_duration_seconds gauge'.format(METRICS_PREFIX),
+        ])
+        for key, duration in sorted(self._aggregate(profile).items()):
+            lines.append('{}_task_duration_seconds{{{},task="{}"}} {}'.format(METRICS_PREFIX, labels, self._escape(key), round(duration, 3)))
+
+        return '\n'.join(lines) + '\n'
+
+    def _escape(self, value):
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    def _write(self, path, content):
+
+        # written atomically, so readers (e.g. the node exporter) never see a partially written file
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp, 'w') as f:
+            f.write(content)
+        os.replace(tmp, path)
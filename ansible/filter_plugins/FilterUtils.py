@@ -1,5 +1,11 @@
 #!/usr/bin/python3
 
+from ansible.errors import AnsibleFilterError
+
+# the statuses of the conditions of k8s objects
+K8S_CONDITION_STATUSES = frozenset(['True', 'False', 'Unknown'])
+
+
 class FilterModule(object):
     '''
     Custom Ansible Jinja2 filter plugin that contains
@@ -11,6 +17,7 @@ class FilterModule(object):
             'atindex': self.atindex,
             'avg': self.avg,
             'get_resources': self.get_resources,
+            'select_resources': self.select_resources,
             'all': self.all,
             'cexmode': self.cexmode,
             'parse_version': self.parse_version,
@@ -66,6 +73,42 @@ class FilterModule(object):
         except Exception:
             return ""
 
+    '''
+    Jinja2 filter that extracts the names of all k8s objects from a list
+    of k8s objects based on the states of these objects (in a single pass).
+    Malformed k8s objects let the filter fail, so they can never be mistaken
+    for healthy ones.
+
+    Parameters:
+    - input: a list of k8s objects (usually the 'resources' returned by 'k8s_info')
+    - conditions: a dictionary mapping the names of the states that are to be looked up (called 'type'
+      in the k8s resource descriptor) to the values of these states (can be multiple values, delimited
+      by "|", or a list); an object is selected if any of its states matches, a state missing from an
+      object is considered to be "Unknown"
+    '''
+    def select_resources(self, input, conditions):
+        # the conditions are compiled once for the whole list
+        compiled = []
+        for state, status in conditions.items():
+            compiled.append((state, frozenset(status.split('|') if isinstance(status, str) else status)))
+
+        if not isinstance(input, list):
+            raise AnsibleFilterError('select_resources: unexpected list of k8s objects: {!r}'.format(input))
+
+        out = []
+        for i in input:
+            try:
+                name = i['metadata']['name']
+                states = dict((c['type'], c['status']) for c in (i.get('status') or {}).get('conditions') or [])
+                if not K8S_CONDITION_STATUSES.issuperset(states.values()):
+                    raise ValueError('unexpected condition status')
+            except (AttributeError, KeyError, TypeError, ValueError) as e:
+                raise AnsibleFilterError('select_resources: malformed k8s object {!r}: {!r}'.format(i, e))
+
+            if any(states.get(state, 'Unknown') in status for state, status in compiled):
+                out.append(name)
+        return out
+
     '''
     Jinja2 filter that makes the Python all() function available to Ansible.
     Returns True if all elements of a given list are True (or if the list is empty).
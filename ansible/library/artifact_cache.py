@@ -0,0 +1,493 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+DOCUMENTATION = r'''
+---
+module: artifact_cache
+short_description: Download artifacts (e.g. client tarballs and RHCOS images) via a persistent content-addressed cache.
+description:
+    - This module provides artifacts (e.g. client tarballs and RHCOS images) at the given destinations
+    - using a persistent cache on the KVM host which survives cluster cleanups.
+    - Artifacts are stored in the cache by their SHA256 checksum and are looked up by checksum (if known beforehand)
+    - or by URL (revalidated against the server using the ETag / Last-Modified response headers).
+    - Artifacts not (or no longer) present in the cache are downloaded concurrently. Interrupted downloads are resumed
+    - (using HTTP range requests) and retried with exponential backoff.
+    - The checksums of downloaded artifacts are verified against the given checksum or the release metadata
+    - (a 'sha256sum.txt' file as published on the OpenShift mirror) if available. An artifact not matching its checksum
+    - is downloaded again from scratch once (without backoff), the module fails if it doesn't match its checksum again.
+    - The least recently used artifacts are evicted from the cache once it exceeds its maximum size.
+version_added: "1.0"
+options:
+    artifacts:
+        description:
+            - The artifacts to be provided.
+            - Each item is a dictionary with the following keys
+            - url - the download URL of the artifact.
+            - dest - the destination path of the artifact.
+            - checksum - the SHA256 checksum of the artifact (optional).
+            - checksum_url - the URL of a 'sha256sum.txt' file containing the SHA256 checksum of the artifact (optional).
+            - If a checksum is given (or found), the artifact is verified against it.
+        required: true
+        default: null
+    cache_dir:
+        description:
+            - The location of the cache directory.
+        required: false
+        default: '/var/cache/ocp-kvm-ipi'
+    max_size:
+        description:
+            - The maximum size of the cache (e.g. '20G').
+            - Artifacts provided by the current module invocation are never evicted.
+        required: false
+        default: '20G'
+    hardlink:
+        description:
+            - Whether the destination files are hard-linked to the cache (if possible) instead of being copied.
+            - Hard-linked files share the SELinux label of the cache, so files that are to be served e.g. by a web server should be copied.
+        required: false
+        default: true
+    parallel:
+        description:
+            - The maximum number of concurrent downloads.
+        required: false
+        default: 4
+    retries:
+        description:
+            - The number of times a failed download is retried.
+            - Checksum mismatches aren't subject to these retries (see above).
+        required: false
+        default: 8
+    timeout:
+        description:
+            - The timeout (in seconds) of each individual HTTP request.
+        required: false
+        default: 300
+notes:
+    - Hard-linked destination files must not be modified in place.
+requirements: []
+'''
+
+EXAMPLES = r'''
+# download the OpenShift client tarballs
+artifact_cache:
+  artifacts:
+    - url: 'https://mirror.openshift.com/pub/openshift-v4/s390x/clients/ocp/stable-4.12/openshift-client-linux.tar.gz'
+      dest: '/tmp/ocpclient/ocp_client.tar.gz'
+      checksum_url: 'https://mirror.openshift.com/pub/openshift-v4/s390x/clients/ocp/stable-4.12/sha256sum.txt'
+    - url: 'https://mirror.openshift.com/pub/openshift-v4/s390x/clients/ocp/stable-4.12/opm-linux.tar.gz'
+      dest: '/tmp/ocpclient/opm_linux.tar.gz'
+      checksum_url: 'https://mirror.openshift.com/pub/openshift-v4/s390x/clients/ocp/stable-4.12/sha256sum.txt'
+  cache_dir: '/var/cache/ocp-kvm-ipi'
+'''
+
+RETURN = r'''
+artifacts:
+    description: List containing the result for each artifact (in the given order).
+    returned: success
+    type: list
+    elements: dictionary
+    contains:
+        url:
+            description: The download URL of the artifact.
+            returned: success
+            type: string
+            sample: 'https://mirror.openshift.com/pub/openshift-v4/s390x/clients/ocp/stable-4.12/opm-linux.tar.gz'
+        dest:
+            description: The destination path of the artifact.
+            returned: success
+            type: string
+            sample: '/tmp/ocpclient/opm_linux.tar.gz'
+        sha256:
+            description: The SHA256 checksum of the artifact.
+            returned: success
+            type: string
+            sample: '3b4f...'
+        size:
+            description: The size (in bytes) of the artifact.
+            returned: success
+            type: int
+            sample: 31457280
+        cache_hit:
+            description: Whether the artifact has been taken from the cache.
+            returned: success
+            type: bool
+            sample: true
+        verified:
+            description: Whether the artifact has been verified against a known checksum.
+            returned: success
+            type: bool
+            sample: true
+        downloaded:
+            description: The number of bytes downloaded.
+            returned: success
+            type: int
+            sample: 0
+        resumed:
+            description: Whether an interrupted download has been resumed.
+            returned: success
+            type: bool
+            sample: false
+        duration:
+            description: The time (in seconds) it took to provide the artifact.
+            returned: success
+            type: float
+            sample: 0.1
+cache:
+    description: Dictionary containing the state of the cache.
+    returned: success
+    type: dictionary
+    sample: { 'size': 1073741824, 'evicted': [] }
+'''
+
+
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPException
+from urllib.error import HTTPError, URLError
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.urls import open_url
+
+
+# the size (in bytes) of the chunks artifacts are downloaded and hashed in
+READ_CHUNK_SIZE = 1024 * 1024
+
+# the backoff (in seconds) between download attempts
+BACKOFF_INITIAL = 2
+BACKOFF_MAX = 60
+
+
+class ArtifactCacheException(Exception):
+    def __init__(self, message='Unable to provide artifact'):
+        self.message = message
+        super().__init__(self.message)
+
+
+class ChecksumMismatchException(ArtifactCacheException):
+    pass
+
+
+class ArtifactCacheModule(object):
+    def __init__(self, module):
+        self.module = module
+        self.args = self.module.params
+
+        self.changed = False
+        self.artifacts = []
+        self.cache = {}
+
+        self.objects_dir = os.path.join(self.args['cache_dir'], 'objects')
+        self.partial_dir = os.path.join(self.args['cache_dir'], 'partial')
+        self.index_file = os.path.join(self.args['cache_dir'], 'index.json')
+        self.index = {}
+        self.checksum_files = {}
+        self.url_locks = dict((a.get('url'), threading.Lock()) for a in self.args['artifacts'] if isinstance(a, dict))
+
+        self.process()
+
+    def process(self):
+        for a in self.args['artifacts']:
+            if not isinstance(a, dict) or not a.get('url') or not a.get('dest'):
+                self.module.fail_json('Invalid artifact: {}'.format(a))
+
+        try:
+            for d in [self.objects_dir, self.partial_dir]:
+                os.makedirs(d, mode=0o755, exist_ok=True)
+        except OSError as e:
+            self.module.fail_json('Unable to create cache directory {}: {}'.format(self.args['cache_dir'], e))
+
+        # concurrent module invocations (e.g. against the same KVM host) must not modify the cache at the same time
+        with open(os.path.join(self.args['cache_dir'], '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            self.index = self._read_index()
+
+            try:
+                with ThreadPoolExecutor(max_workers=max(1, self.args['parallel'])) as executor:
+                    self.artifacts = list(executor.map(self._provide_artifact, self.args['artifacts']))
+            except ArtifactCacheException as e:
+                self._write_index()
+                self.module.fail_json('Unable to provide artifacts: {}'.format(e))
+
+            self.cache = self._evict(set(a['sha256'] for a in self.artifacts))
+            self._write_index()
+
+    def _provide_artifact(self, artifact):
+
+        # the same artifact may be requested for multiple destinations, it's downloaded only once
+        with self.url_locks[artifact['url']]:
+            return self._provide_artifact_locked(artifact)
+
+    def _provide_artifact_locked(self, artifact):
+        started = time.monotonic()
+        url = artifact['url']
+        result = {'url': url, 'dest': artifact['dest'], 'cache_hit': False, 'downloaded': 0, 'resumed': False}
+
+        expected = self._expected_checksum(artifact)
+        entry = self.index.get('urls', {}).get(url)
+
+        # artifacts with a known checksum are looked up by checksum (regardless of the URL they've been downloaded from),
+        # all other artifacts are looked up by URL and revalidated against the server
+        sha256 = None
+        if expected and os.path.isfile(self._object_path(expected)):
+            sha256 = expected
+        elif not expected and entry and os.path.isfile(self._object_path(entry['sha256'])) and self._is_fresh(url, entry):
+            sha256 = entry['sha256']
+
+        if sha256:
+            result['cache_hit'] = True
+        elif self.module.check_mode:
+            self.changed = True
+            result.update({'sha256': expected, 'size': None, 'verified': bool(expected), 'duration': 0.0})
+            return result
+        else:
+            sha256, headers, downloaded, resumed = self._download(url, expected)
+            result.update({'downloaded': downloaded, 'resumed': resumed})
+            entry = {'sha256': sha256, 'etag': headers.get('ETag'), 'last_modified': headers.get('Last-Modified')}
+
+        self.index.setdefault('urls', {})[url] = dict(entry or {}, sha256=sha256)
+        self.index.setdefault('objects', {})[sha256] = {'last_used': time.time(), 'url': url}
+
+        self._install(sha256, artifact['dest'])
+
+        result.update({
+            'sha256': sha256,
+            'size': os.path.getsize(self._object_path(sha256)),
+            'verified': bool(expected),
+            'duration': round(time.monotonic() - started, 1),
+        })
+
+        return result
+
+    def _expected_checksum(self, artifact):
+        if artifact.get('checksum'):
+            return artifact['checksum'].split(':')[-1].strip().lower()
+
+        if not artifact.get('checksum_url'):
+            return None
+
+        # the release metadata is fetched once per module invocation (multiple artifacts usually share it)
+        checksum_url = artifact['checksum_url']
+        if checksum_url not in self.checksum_files:
+            try:
+                self.checksum_files[checksum_url] = self._fetch(checksum_url).read().decode('utf-8')
+            except (HTTPError, URLError, OSError):
+                # not all download locations provide release metadata, the artifact is looked up by URL in that case
+                self.checksum_files[checksum_url] = ''
+
+        name = os.path.basename(artifact['url'])
+        for line in self.checksum_files[checksum_url].splitlines():
+            parts = line.split()
+            if len(parts) == 2 and parts[1].lstrip('*') == name:
+                return parts[0].lower()
+
+        return None
+
+    def _is_fresh(self, url, entry):
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        if not headers:
+            return False
+
+        try:
+            response = self._fetch(url, headers=headers, method='HEAD')
+            return response.headers.get('ETag') == entry.get('etag') and response.headers.get('Last-Modified') == entry.get('last_modified')
+        except HTTPError as e:
+            return e.code == 304
+        except (URLError, OSError):
+            # the server can't be reached, the cached artifact is still the best we've got
+            return True
+
+    def _download(self, url, expected):
+        partial_file = os.path.join(self.partial_dir, hashlib.sha256(url.encode('utf-8')).hexdigest())
+        backoff = BACKOFF_INITIAL
+        downloaded = 0
+        resumed = False
+        mismatched = False
+
+        for attempt in range(self.args['retries'] + 1):
+            try:
+                offset = os.path.getsize(partial_file) if os.path.isfile(partial_file) else 0
+
+                response = self._fetch(url, headers={'Range': 'bytes={}-'.format(offset)} if offset else {})
+
+                # servers not supporting range requests return the whole artifact
+                if offset and response.getcode() == 206:
+                    resumed = True
+                else:
+                    offset = 0
+
+                length = response.headers.get('Content-Length')
+                received = 0
+
+                with open(partial_file, 'ab' if offset else 'wb') as f:
+                    while True:
+                        chunk = response.read(READ_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                        received += len(chunk)
+                downloaded += received
+
+                # the partial file is kept, the next attempt resumes the download
+                if length and received < int(length):
+                    raise ArtifactCacheException('Connection closed after {} of {} bytes'.format(received, length))
+
+                sha256 = self._hash_file(partial_file)
+                if expected and sha256 != expected:
+                    os.remove(partial_file)
+                    raise ChecksumMismatchException('Checksum mismatch for {} (expected {}, got {})'.format(url, expected, sha256))
+
+                os.chmod(partial_file, 0o644)
+                os.rename(partial_file, self._object_path(sha256))
+
+                return sha256, response.headers, downloaded, resumed
+            except HTTPError as e:
+                # a range beyond the end of the artifact means the partial file is stale
+                if e.code == 416 and os.path.isfile(partial_file):
+                    os.remove(partial_file)
+                elif 400 <= e.code < 500 and e.code not in [408, 429]:
+                    raise ArtifactCacheException('Unable to download {}: {}'.format(url, e))
+                error = e
+            except ChecksumMismatchException as e:
+                # a corrupted download (e.g. a resumed one) is downloaded again from scratch once, without backoff - an
+                # artifact not matching its checksum again isn't the expected one, further retries won't change that
+                if mismatched:
+                    raise
+                mismatched = True
+                error = e
+                continue
+            except (ArtifactCacheException, HTTPException, URLError, OSError) as e:
+                error = e
+
+            if attempt < self.args['retries']:
+                time.sleep(backoff)
+                backoff = min(backoff * 2, BACKOFF_MAX)
+
+        raise ArtifactCacheException('Unable to download {}: {}'.format(url, error))
+
+    def _fetch(self, url, headers=None, method='GET'):
+        return open_url(url, headers=headers or {}, method=method, timeout=self.args['timeout'], follow_redirects='all')
+
+    def _hash_file(self, path):
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+                h.update(chunk)
+
+        return h.hexdigest()
+
+    def _object_path(self, sha256):
+        return os.path.join(self.objects_dir, sha256)
+
+    def _install(self, sha256, dest):
+        src = self._object_path(sha256)
+
+        try:
+            if os.path.isfile(dest) and os.path.samefile(src, dest):
+                return
+            if os.path.isfile(dest) and os.path.getsize(dest) == os.path.getsize(src) and self._hash_file(dest) == sha256:
+                return
+
+            self.changed = True
+            if self.module.check_mode:
+                return
+
+            fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(dest))
+            os.close(fd)
+            os.remove(tmp_file)
+
+            # hard-link the artifact to avoid copying gigabytes (if the destination is on the same filesystem)
+            try:
+                if not self.args['hardlink']:
+                    raise OSError(errno.EPERM, 'hard links disabled')
+                os.link(src, tmp_file)
+            except OSError as e:
+                if e.errno not in [errno.EXDEV, errno.EPERM, errno.EMLINK]:
+                    raise
+                shutil.copyfile(src, tmp_file)
+                os.chmod(tmp_file, 0o644)
+
+            os.rename(tmp_file, dest)
+        except OSError as e:
+            raise ArtifactCacheException('Unable to install {}: {}'.format(dest, e))
+
+    def _evict(self, in_use):
+        objects = self.index.setdefault('objects', {})
+
+        # objects not (or no longer) known to the index are evicted first
+        sizes = {}
+        for name in os.listdir(self.objects_dir):
+            sizes[name] = os.path.getsize(self._object_path(name))
+            objects.setdefault(name, {'last_used': 0})
+        for sha256 in list(objects):
+            if sha256 not in sizes:
+                del objects[sha256]
+
+        size = sum(sizes.values())
+        evicted = []
+
+        for sha256 in sorted(objects, key=lambda s: objects[s]['last_used']):
+            if size <= self.args['max_size']:
+                break
+            if sha256 in in_use:
+                continue
+
+            if not self.module.check_mode:
+                os.remove(self._object_path(sha256))
+            size -= sizes[sha256]
+            evicted.append(objects.pop(sha256).get('url', sha256))
+
+        self.index['urls'] = dict((u, e) for u, e in self.index.get('urls', {}).items() if e['sha256'] in objects)
+
+        return {'size': size, 'evicted': evicted}
+
+    def _read_index(self):
+        try:
+            with open(self.index_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_index(self):
+        if self.module.check_mode:
+            return
+
+        fd, tmp_file = tempfile.mkstemp(dir=self.args['cache_dir'])
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.index, f)
+        os.rename(tmp_file, self.index_file)
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec = dict(
+            artifacts = dict(type='list', elements='dict', required=True),
+            cache_dir = dict(type='path', default='/var/cache/ocp-kvm-ipi', required=False),
+            max_size = dict(type='bytes', default='20G', required=False),
+            hardlink = dict(type='bool', default=True, required=False),
+            parallel = dict(type='int', default=4, required=False),
+            retries = dict(type='int', default=8, required=False),
+            timeout = dict(type='int', default=300, required=False),
+        ),
+        supports_check_mode=True
+    )
+
+    result = ArtifactCacheModule(module)
+
+    module.exit_json(changed=result.changed, artifacts=result.artifacts, cache=result.cache)
+
+
+if __name__ == '__main__':
+    main()
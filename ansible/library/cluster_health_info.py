@@ -0,0 +1,371 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+DOCUMENTATION = r'''
+---
+module: cluster_health_info
+short_description: Determine the health state of an OpenShift cluster.
+description:
+    - This module determines the health state of an OpenShift cluster (non-ready Nodes,
+    - unavailable ClusterOperators and firing Prometheus alerts).
+    - The credentials are loaded once and a single HTTP session (with a single OAuth access token) is used for all requests,
+    - the individual health probes are run concurrently.
+version_added: "1.0"
+options:
+    kubeconfig:
+        description:
+            - The location of the kubeconfig file of the OpenShift cluster (used for the API server URL and CA certificates).
+        required: true
+        default: null
+    password_file:
+        description:
+            - The location of the file containing the password of the user.
+            - Defaults to the 'kubeadmin-password' file next to the kubeconfig file.
+        required: false
+        default: null
+    username:
+        description:
+            - The name of the user to log in as (to query the Prometheus alerts).
+        required: false
+        default: 'kubeadmin'
+    ignored_alerts:
+        description:
+            - The names of the Prometheus alerts that are to be ignored.
+        required: false
+        default: [ 'Watchdog', 'AlertmanagerReceiversNotConfigured', 'ClusterNotUpgradeable', 'InsightsRecommendationActive' ]
+    token_cache:
+        description:
+            - The location of a file used to cache the OAuth access token across module invocations.
+            - If not given, a new OAuth access token is requested and revoked again for every module invocation.
+        required: false
+        default: null
+    timeout:
+        description:
+            - The timeout (in seconds) of each individual HTTP request.
+        required: false
+        default: 30
+notes: []
+requirements:
+    - requests
+'''
+
+EXAMPLES = r'''
+# determine the health state of the OpenShift cluster
+cluster_health_info:
+  kubeconfig: '/root/ocp4-workdir/auth/kubeconfig'
+
+# ignore additional alerts
+cluster_health_info:
+  kubeconfig: '/root/ocp4-workdir/auth/kubeconfig'
+  ignored_alerts:
+    - 'Watchdog'
+    - 'KubeCPUOvercommit'
+'''
+
+RETURN = r'''
+cluster_health:
+    description: Dictionary containing the health state of the OpenShift cluster.
+    returned: success
+    type: dictionary
+    contains:
+        operational:
+            description: Whether the OpenShift cluster is fully operational (all probes succeeded and found nothing).
+            returned: success
+            type: bool
+            sample: true
+        nonready_nodes:
+            description: The names of the non-ready Nodes.
+            returned: success
+            type: list
+            sample: []
+        unavailable_cos:
+            description: The names of the unavailable ClusterOperators.
+            returned: success
+            type: list
+            sample: []
+        alerts:
+            description: The names of the firing Prometheus alerts (not ignored, silenced or inhibited).
+            returned: success
+            type: list
+            sample: [ 'KubePodCrashLooping' ]
+        probes:
+            description: Dictionary containing the result of each individual health probe.
+            returned: success
+            type: dictionary
+            sample: { 'nodes': { 'success': true, 'latency': 0.12, 'error': '' } }
+'''
+
+
+import base64
+import hashlib
+import os
+import tempfile
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlparse
+from ansible.module_utils.basic import AnsibleModule, missing_required_lib
+
+REQUESTS_IMPORT_ERROR = None
+try:
+    import requests
+except ImportError:
+    REQUESTS_IMPORT_ERROR = traceback.format_exc()
+
+
+OAUTH_CLIENT_ID = 'openshift-challenging-client'
+PROMETHEUS_ROUTE_PATH = '/apis/route.openshift.io/v1/namespaces/openshift-monitoring/routes/prometheus-k8s'
+
+# the statuses of the conditions of k8s objects
+K8S_CONDITION_STATUSES = frozenset(['True', 'False', 'Unknown'])
+
+# the conditions selecting non-ready Nodes and unavailable ClusterOperators (see '_select_resources')
+NONREADY_NODE_CONDITIONS = {'Ready': 'False|Unknown'}
+UNAVAILABLE_CO_CONDITIONS = {'Available': 'False|Unknown'}
+
+
+class ClusterHealthException(Exception):
+    def __init__(self, message='Unable to determine the health state of the cluster'):
+        self.message = message
+        super().__init__(self.message)
+
+
+class ClusterHealthInfoModule(object):
+    def __init__(self, module):
+        self.module = module
+        self.args = self.module.params
+
+        self.changed = False
+        self.cluster_health = {}
+
+        self.server = None
+        self.ca_file = None
+        self.session = None
+
+        self.process()
+
+    def process(self):
+        token = None
+        cached = False
+
+        try:
+            self._load_kubeconfig()
+
+            self.session = requests.Session()
+
+            token, cached = self._get_token()
+            self.session.headers['Authorization'] = 'Bearer {}'.format(token)
+
+            # run all health probes concurrently, sharing the session (and its connection pool)
+            probes = {
+                'nodes': self._probe_nodes,
+                'cluster_operators': self._probe_cluster_operators,
+                'alerts': self._probe_alerts,
+            }
+            with ThreadPoolExecutor(max_workers=len(probes)) as executor:
+                futures = dict((name, executor.submit(self._run_probe, probe)) for name, probe in probes.items())
+                results = dict((name, future.result()) for name, future in futures.items())
+
+            self.cluster_health = {
+                'nonready_nodes': results['nodes']['value'],
+                'unavailable_cos': results['cluster_operators']['value'],
+                'alerts': results['alerts']['value'],
+                'probes': dict((name, dict((k, v) for k, v in r.items() if k != 'value')) for name, r in results.items()),
+            }
+            self.cluster_health['operational'] = all(r['success'] and not r['value'] for r in results.values())
+        except (ClusterHealthException, requests.RequestException) as e:
+            self.module.fail_json('Unable to determine the health state of the cluster: {}'.format(e))
+        finally:
+            if token and not cached and not self.args['token_cache']:
+                self._revoke_token(token)
+            if self.session:
+                self.session.close()
+            if self.ca_file:
+                os.remove(self.ca_file)
+
+    def _load_kubeconfig(self):
+        import yaml
+
+        try:
+            with open(self.args['kubeconfig'], 'r') as f:
+                kubeconfig = yaml.load(f, Loader=yaml.SafeLoader)
+
+            cluster = kubeconfig['clusters'][0]['cluster']
+            self.server = cluster['server'].rstrip('/')
+            ca_data = base64.b64decode(cluster['certificate-authority-data'])
+        except (OSError, KeyError, IndexError, TypeError, ValueError, yaml.YAMLError) as e:
+            raise ClusterHealthException('Unable to read kubeconfig {}: {}'.format(self.args['kubeconfig'], e))
+
+        fd, self.ca_file = tempfile.mkstemp(suffix='cacert')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(ca_data)
+
+    def _get_token(self):
+
+        # a cached OAuth access token is reused as long as it's still valid
+        token_cache = self.args['token_cache']
+        if token_cache and os.path.isfile(token_cache):
+            with open(token_cache, 'r') as f:
+                token = f.read().strip()
+
+            response = self._request('GET', self.server + '/apis/user.openshift.io/v1/users/~', headers={'Authorization': 'Bearer {}'.format(token)})
+            if response.status_code == 200:
+                return token, True
+
+        token = self._request_token()
+
+        if token_cache:
+            fd = os.open(token_cache, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                f.write(token)
+
+        return token, False
+
+    def _request_token(self):
+        password_file = self.args['password_file'] or os.path.join(os.path.dirname(self.args['kubeconfig']), 'kubeadmin-password')
+        try:
+            with open(password_file, 'r') as f:
+                password = f.read().strip()
+        except OSError as e:
+            raise ClusterHealthException('Unable to read password file {}: {}'.format(password_file, e))
+
+        # the OAuth server is exposed via the cluster ingress, its certificate is not necessarily signed by the API server CA
+        # (same as 'community.okd.openshift_auth' with 'validate_certs: false')
+        response = self._request('GET', self.server + '/.well-known/oauth-authorization-server')
+        response.raise_for_status()
+        authorization_endpoint = response.json()['authorization_endpoint']
+
+        response = self._request(
+            'GET',
+            authorization_endpoint,
+            params={'client_id': OAUTH_CLIENT_ID, 'response_type': 'token'},
+            auth=(self.args['username'], password),
+            headers={'X-CSRF-Token': 'xxx'},
+            allow_redirects=False,
+            verify=False,
+        )
+
+        # the OAuth access token is part of the fragment of the redirect location
+        fragment = parse_qs(urlparse(response.headers.get('Location', '')).fragment)
+        if 'access_token' not in fragment:
+            raise ClusterHealthException('Unable to log in as {} (HTTP status {})'.format(self.args['username'], response.status_code))
+
+        return fragment['access_token'][0]
+
+    def _revoke_token(self, token):
+
+        # OAuth access tokens prefixed with 'sha256~' are stored under the hash of the actual token
+        name = token
+        if token.startswith('sha256~'):
+            digest = hashlib.sha256(token[len('sha256~'):].encode('utf-8')).digest()
+            name = 'sha256~' + base64.urlsafe_b64encode(digest).decode('utf-8').rstrip('=')
+
+        # revoking the OAuth access token must never let the module fail
+        try:
+            self._request('DELETE', self.server + '/apis/oauth.openshift.io/v1/oauthaccesstokens/' + name)
+        except requests.RequestException:
+            pass
+
+    def _run_probe(self, probe):
+        started = time.monotonic()
+
+        try:
+            value = probe()
+            error = ''
+        except (ClusterHealthException, requests.RequestException, KeyError, TypeError, ValueError) as e:
+            value = []
+            error = str(e)
+
+        return {
+            'success': not error,
+            'latency': round(time.monotonic() - started, 3),
+            'error': error,
+            'value': value,
+        }
+
+    def _request(self, method, url, **kwargs):
+
+        # the CA certificates of the kubeconfig are passed with each request, as a CA bundle given via the environment
+        # (e.g. 'REQUESTS_CA_BUNDLE') would take precedence over the CA certificates of the session
+        kwargs.setdefault('verify', self.ca_file)
+        kwargs.setdefault('timeout', self.args['timeout'])
+
+        return self.session.request(method, url, **kwargs)
+
+    def _get_json(self, url, **kwargs):
+        response = self._request('GET', url, **kwargs)
+        if response.status_code != 200:
+            raise ClusterHealthException('GET {} returned HTTP status {}'.format(url, response.status_code))
+
+        return response.json()
+
+    def _probe_nodes(self):
+        nodes = self._get_json(self.server + '/api/v1/nodes')
+        return self._select_resources(nodes['items'], NONREADY_NODE_CONDITIONS)
+
+    def _probe_cluster_operators(self):
+        cluster_operators = self._get_json(self.server + '/apis/config.openshift.io/v1/clusteroperators')
+        return self._select_resources(cluster_operators['items'], UNAVAILABLE_CO_CONDITIONS)
+
+    def _probe_alerts(self):
+        route = self._get_json(self.server + PROMETHEUS_ROUTE_PATH)
+        alerts = self._get_json('https://{}/api/v1/alerts'.format(route['spec']['host']), params={'silenced': 'False', 'inhibited': 'False'})
+
+        ignored_alerts = set(self.args['ignored_alerts'])
+        alert_names = [a['labels']['alertname'] for a in alerts['data']['alerts'] if a['labels']['alertname'] not in ignored_alerts]
+
+        # the same alert may fire multiple times (e.g. for different namespaces)
+        return sorted(set(alert_names))
+
+    @staticmethod
+    def _select_resources(items, conditions):
+
+        # the same selection as the 'select_resources' filter (filter_plugins/FilterUtils.py): the conditions are compiled
+        # once, k8s objects lacking a condition are considered to be 'Unknown', malformed k8s objects let the health probe
+        # fail (instead of being skipped, so they can never be mistaken for healthy ones)
+        compiled = []
+        for state, status in conditions.items():
+            compiled.append((state, frozenset(status.split('|') if isinstance(status, str) else status)))
+
+        if not isinstance(items, list):
+            raise ClusterHealthException('Unexpected list of k8s objects: {!r}'.format(items))
+
+        out = []
+        for i in items:
+            try:
+                name = i['metadata']['name']
+                states = dict((c['type'], c['status']) for c in (i.get('status') or {}).get('conditions') or [])
+                if not K8S_CONDITION_STATUSES.issuperset(states.values()):
+                    raise ValueError('unexpected condition status')
+            except (AttributeError, KeyError, TypeError, ValueError) as e:
+                raise ClusterHealthException('Malformed k8s object {!r}: {!r}'.format(i, e))
+
+            if any(states.get(state, 'Unknown') in status for state, status in compiled):
+                out.append(name)
+
+        return out
+
+def main():
+    module = AnsibleModule(
+        argument_spec = dict(
+            kubeconfig = dict(type='path', required=True),
+            password_file = dict(type='path', required=False, no_log=False),
+            username = dict(type='str', default='kubeadmin', required=False),
+            ignored_alerts = dict(type='list', elements='str', default=['Watchdog', 'AlertmanagerReceiversNotConfigured', 'ClusterNotUpgradeable', 'InsightsRecommendationActive'], required=False),
+            token_cache = dict(type='path', required=False, no_log=False),
+            timeout = dict(type='int', default=30, required=False),
+        ),
+        supports_check_mode=True
+    )
+
+    if REQUESTS_IMPORT_ERROR:
+        module.fail_json(msg=missing_required_lib('requests'), exception=REQUESTS_IMPORT_ERROR)
+
+    result = ClusterHealthInfoModule(module)
+
+    module.exit_json(changed=result.changed, cluster_health=result.cluster_health)
+
+
+if __name__ == '__main__':
+    main()
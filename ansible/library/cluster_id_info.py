@@ -0,0 +1,196 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+DOCUMENTATION = r'''
+---
+module: cluster_id_info
+short_description: Determine the ID and UID of an OpenShift cluster from the openshift-install state file.
+description:
+    - This module determines the ID (infrastructure name) and UID of an OpenShift cluster
+    - from the state file written by openshift-install ('.openshift_install_state.json').
+    - As the state file can be quite large (it embeds the ignition configs), it is stream-parsed on the host
+    - and only the cluster ID asset is decoded.
+    - The result is cached next to the state file and reused for as long as the state file remains unchanged
+    - (same modification time and size).
+version_added: "1.0"
+options:
+    state_file:
+        description:
+            - The location of the openshift-install state file.
+        required: true
+        default: null
+    cache_file:
+        description:
+            - The location of the cache file.
+            - Defaults to '.openshift_install_state.cluster_id.json' next to the state file.
+        required: false
+        default: null
+notes: []
+requirements: []
+'''
+
+EXAMPLES = r'''
+# determine the cluster ID
+cluster_id_info:
+  state_file: '/root/ocp4-workdir/.openshift_install_state.json'
+'''
+
+RETURN = r'''
+cluster_id:
+    description: The ID (infrastructure name) of the OpenShift cluster.
+    returned: success
+    type: string
+    sample: 'ocp1-qf2b5'
+cluster_uid:
+    description: The UID of the OpenShift cluster.
+    returned: success
+    type: string
+    sample: 'f9d5b816-c9ed-4c89-8577-c0718bffeb1a'
+cached:
+    description: Whether the result has been taken from the cache file.
+    returned: success
+    type: bool
+    sample: true
+'''
+
+
+import json
+import os
+import tempfile
+from ansible.module_utils.basic import AnsibleModule
+
+
+CLUSTER_ID_ASSET_KEY = '"*installconfig.ClusterID"'
+CACHE_FILE_NAME = '.openshift_install_state.cluster_id.json'
+
+# the size (in bytes) of the chunks the state file is read in
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+class ClusterIdInfoModule(object):
+    def __init__(self, module):
+        self.module = module
+        self.args = self.module.params
+
+        self.changed = False
+        self.cluster_id = None
+        self.cluster_uid = None
+        self.cached = False
+
+        self.process()
+
+    def process(self):
+        state_file = self.args['state_file']
+        cache_file = self.args['cache_file'] or os.path.join(os.path.dirname(state_file), CACHE_FILE_NAME)
+
+        try:
+            st = os.stat(state_file)
+        except OSError as e:
+            self.module.fail_json('Unable to access openshift-install state file {}: {}'.format(state_file, e))
+
+        cache_key = {'mtime_ns': st.st_mtime_ns, 'size': st.st_size}
+
+        cache = self._read_cache(cache_file)
+        if cache and cache.get('key') == cache_key:
+            self.cluster_id = cache['cluster_id']
+            self.cluster_uid = cache['cluster_uid']
+            self.cached = True
+            return
+
+        asset = self._read_cluster_id_asset(state_file)
+        self.cluster_id = asset.get('InfraID')
+        self.cluster_uid = asset.get('UUID')
+
+        if not self.cluster_id:
+            self.module.fail_json('Cluster ID not found in openshift-install state file {}'.format(state_file))
+
+        self._write_cache(cache_file, {'key': cache_key, 'cluster_id': self.cluster_id, 'cluster_uid': self.cluster_uid})
+
+    def _read_cluster_id_asset(self, state_file):
+        decoder = json.JSONDecoder()
+        buf = ''
+        value_start = -1
+
+        try:
+            with open(state_file, 'r') as f:
+                while True:
+                    chunk = f.read(READ_CHUNK_SIZE)
+
+                    if value_start < 0:
+                        # only the tail of the previous chunk needs to be kept to find a key spanning two chunks
+                        buf = buf[-2 * len(CLUSTER_ID_ASSET_KEY):] + chunk
+                        value_start = self._find_value_start(buf)
+                    else:
+                        buf += chunk
+
+                    if value_start >= 0:
+                        try:
+                            return decoder.raw_decode(buf, value_start)[0]
+                        except ValueError:
+                            # the value spans the next chunk
+                            if not chunk:
+                                raise
+
+                    if not chunk:
+                        break
+        except (OSError, ValueError) as e:
+            self.module.fail_json('Unable to parse openshift-install state file {}: {}'.format(state_file, e))
+
+        self.module.fail_json('Cluster ID not found in openshift-install state file {}'.format(state_file))
+
+    def _find_value_start(self, buf):
+        pos = buf.find(CLUSTER_ID_ASSET_KEY)
+
+        while pos >= 0:
+            # skip occurrences within (escaped) JSON strings
+            if pos == 0 or buf[pos - 1] != '\\':
+                colon = buf.find(':', pos + len(CLUSTER_ID_ASSET_KEY))
+                if colon < 0:
+                    return -1
+
+                value_start = colon + 1
+                while value_start < len(buf) and buf[value_start].isspace():
+                    value_start += 1
+
+                return value_start if value_start < len(buf) else -1
+
+            pos = buf.find(CLUSTER_ID_ASSET_KEY, pos + 1)
+
+        return -1
+
+    def _read_cache(self, cache_file):
+        try:
+            with open(cache_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_cache(self, cache_file, content):
+
+        # the cache is merely an optimization, failing to write it must never let the module fail
+        try:
+            fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(cache_file))
+            with os.fdopen(fd, 'w') as f:
+                json.dump(content, f)
+            os.rename(tmp_file, cache_file)
+        except OSError:
+            pass
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec = dict(
+            state_file = dict(type='path', required=True),
+            cache_file = dict(type='path', required=False),
+        ),
+        supports_check_mode=True
+    )
+
+    result = ClusterIdInfoModule(module)
+
+    module.exit_json(changed=result.changed, cluster_id=result.cluster_id, cluster_uid=result.cluster_uid, cached=result.cached)
+
+
+if __name__ == '__main__':
+    main()
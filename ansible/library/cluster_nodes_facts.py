@@ -0,0 +1,267 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+DOCUMENTATION = r'''
+---
+module: cluster_nodes_facts
+short_description: Determine the libvirt domains (cluster nodes) belonging to an OpenShift cluster.
+description:
+    - This module enumerates the libvirt domains belonging to an OpenShift cluster via a single libvirt connection
+    - and sets facts containing the cluster nodes, their roles and network details.
+    - The role of a cluster node is recorded in the metadata of its libvirt domain. Libvirt domains without
+    - such metadata (e.g. domains created by openshift-install or the machine API) are classified by name once
+    - and their metadata is updated accordingly.
+    - The MAC and IP addresses of the cluster nodes are taken from the DHCP host entries of the cluster network.
+    - The result is cached and reused until libvirt domains of the cluster are defined or undefined
+    - or the cluster network changes.
+    - The cluster nodes are listed in the order libvirt lists the libvirt domains (same as 'community.libvirt.virt'
+    - with 'command=list_vms'), as other roles refer to the cluster worker nodes by their index (e.g. 'assign_to_worker' of the crypto role).
+    - In check mode the metadata of the libvirt domains isn't updated (and no change is reported).
+version_added: "1.0"
+options:
+    cluster_id:
+        description:
+            - The ID (infrastructure name) of the OpenShift cluster.
+            - The names of all libvirt domains belonging to the cluster start with it.
+        required: true
+        default: null
+    network:
+        description:
+            - The name of the libvirt network used by the cluster.
+            - Defaults to the cluster ID.
+        required: false
+        default: null
+    cache_file:
+        description:
+            - The location of the cache file.
+            - The result is not cached if not given.
+        required: false
+        default: null
+    uri:
+        description:
+            - The libvirt connection URI.
+        required: false
+        default: 'qemu:///system'
+notes: []
+requirements:
+    - libvirt-python
+'''
+
+EXAMPLES = r'''
+# determine the cluster nodes
+cluster_nodes_facts:
+  cluster_id: 'ocp1-qf2b5'
+  cache_file: '/root/ocp4-workdir/.cluster_nodes.json'
+'''
+
+RETURN = r'''
+ansible_facts:
+    description: Facts containing the cluster nodes.
+    returned: success
+    type: complex
+    contains:
+        cluster_nodes:
+            description: List containing the details of each cluster node (in the order listed by libvirt).
+            returned: success
+            type: list
+            elements: dictionary
+            sample: [ { 'name': 'ocp1-qf2b5-master-0', 'role': 'master', 'uuid': '...', 'mac': '52:54:00:aa:bb:cc', 'ip': '192.168.126.11' } ]
+        master_domains:
+            description: The names of the libvirt domains of the cluster master nodes.
+            returned: success
+            type: list
+            sample: [ 'ocp1-qf2b5-master-0' ]
+        worker_domains:
+            description: The names of the libvirt domains of the cluster worker nodes.
+            returned: success
+            type: list
+            sample: [ 'ocp1-qf2b5-worker-0-456r9' ]
+cached:
+    description: Whether the result has been taken from the cache file.
+    returned: success
+    type: bool
+    sample: true
+'''
+
+
+import hashlib
+import json
+import os
+import tempfile
+import traceback
+import xml.etree.ElementTree as ET
+from ansible.module_utils.basic import AnsibleModule, missing_required_lib
+
+LIBVIRT_IMPORT_ERROR = None
+try:
+    import libvirt
+except ImportError:
+    LIBVIRT_IMPORT_ERROR = traceback.format_exc()
+
+
+CLUSTER_NODE_METADATA_NAMESPACE = 'https://github.com/ibm-s390-cloud/ocp-kvm-ipi-automation/cluster-node'
+CLUSTER_NODE_METADATA_KEY = 'kvmipi'
+CLUSTER_NODE_METADATA_TEMPLATE = '<node cluster="{}" role="{}"/>'
+
+CLUSTER_NODE_ROLES = ['bootstrap', 'master', 'worker']
+
+
+class ClusterNodesFactsModule(object):
+    def __init__(self, module):
+        self.module = module
+        self.args = self.module.params
+
+        self.changed = False
+        self.cluster_nodes = []
+        self.cached = False
+
+        self.process()
+
+    def process(self):
+        conn = None
+
+        try:
+            conn = libvirt.open(self.args['uri'])
+
+            prefix = '{}-'.format(self.args['cluster_id'])
+            domains = [d for d in conn.listAllDomains(0) if d.name().startswith(prefix)]
+            dhcp_hosts, network_xml = self._get_dhcp_hosts(conn)
+
+            # the cache is keyed by the libvirt domains of the cluster (defining or undefining one changes the key) and the cluster network
+            cache_key = hashlib.sha256(json.dumps(sorted([d.name(), d.UUIDString()] for d in domains) + [network_xml]).encode('utf-8')).hexdigest()
+
+            cache = self._read_cache()
+            if cache and cache.get('key') == cache_key:
+                self.cluster_nodes = cache['cluster_nodes']
+                self.cached = True
+                return
+
+            for domain in domains:
+                self.cluster_nodes.append(self._get_cluster_node(domain, dhcp_hosts))
+
+            self._write_cache({'key': cache_key, 'cluster_nodes': self.cluster_nodes})
+        except libvirt.libvirtError as e:
+            self.module.fail_json('Unable to determine cluster nodes: {}'.format(e))
+        finally:
+            if conn:
+                conn.close()
+
+    def _get_dhcp_hosts(self, conn):
+        try:
+            network = conn.networkLookupByName(self.args['network'] or self.args['cluster_id'])
+        except libvirt.libvirtError:
+            return {}, ''
+
+        network_xml = network.XMLDesc(0)
+
+        dhcp_hosts = {}
+        for host in ET.fromstring(network_xml).findall('ip/dhcp/host'):
+            if host.get('mac'):
+                dhcp_hosts[host.get('mac').lower()] = host.attrib
+            if host.get('name'):
+                dhcp_hosts[host.get('name').split('.')[0]] = host.attrib
+
+        return dhcp_hosts, network_xml
+
+    def _get_cluster_node(self, domain, dhcp_hosts):
+        domain_xml = ET.fromstring(domain.XMLDesc(libvirt.VIR_DOMAIN_XML_INACTIVE))
+
+        role = self._get_role(domain, domain_xml)
+
+        mac = None
+        network = self.args['network'] or self.args['cluster_id']
+        for interface in domain_xml.findall("devices/interface[@type='network']"):
+            source = interface.find('source')
+            address = interface.find('mac')
+            if source is not None and source.get('network') == network and address is not None:
+                mac = address.get('address').lower()
+                break
+
+        # the DHCP host entries of the cluster network are looked up by MAC address first, then by name
+        dhcp_host = dhcp_hosts.get(mac) or dhcp_hosts.get(domain.name()) or {}
+
+        return {
+            'name': domain.name(),
+            'role': role,
+            'uuid': domain.UUIDString(),
+            'mac': mac or dhcp_host.get('mac'),
+            'ip': dhcp_host.get('ip'),
+        }
+
+    def _get_role(self, domain, domain_xml):
+        metadata = domain_xml.find('metadata/{{{}}}node'.format(CLUSTER_NODE_METADATA_NAMESPACE))
+        if metadata is not None and metadata.get('role') in CLUSTER_NODE_ROLES:
+            return metadata.get('role')
+
+        # libvirt domains are named '<cluster id>-<role>-...'
+        name_parts = domain.name()[len(self.args['cluster_id']) + 1:].split('-')
+        role = name_parts[0] if name_parts[0] in CLUSTER_NODE_ROLES else None
+        if role is None:
+            return None
+
+        # record the role in the metadata of the libvirt domain so it doesn't depend on the name anymore
+        # (the facts are determined the same way in check mode, without changing the libvirt domain though)
+        if not self.module.check_mode:
+            domain.setMetadata(
+                libvirt.VIR_DOMAIN_METADATA_ELEMENT,
+                CLUSTER_NODE_METADATA_TEMPLATE.format(self.args['cluster_id'], role),
+                CLUSTER_NODE_METADATA_KEY,
+                CLUSTER_NODE_METADATA_NAMESPACE,
+                libvirt.VIR_DOMAIN_AFFECT_CONFIG
+            )
+            self.changed = True
+
+        return role
+
+    def _read_cache(self):
+        if not self.args['cache_file']:
+            return None
+
+        try:
+            with open(self.args['cache_file'], 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_cache(self, content):
+        if not self.args['cache_file'] or self.module.check_mode:
+            return
+
+        # the cache is merely an optimization, failing to write it must never let the module fail
+        try:
+            fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(self.args['cache_file']))
+            with os.fdopen(fd, 'w') as f:
+                json.dump(content, f)
+            os.rename(tmp_file, self.args['cache_file'])
+        except OSError:
+            pass
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec = dict(
+            cluster_id = dict(type='str', required=True),
+            network = dict(type='str', required=False),
+            cache_file = dict(type='path', required=False),
+            uri = dict(type='str', default='qemu:///system', required=False),
+        ),
+        supports_check_mode=True
+    )
+
+    if LIBVIRT_IMPORT_ERROR:
+        module.fail_json(msg=missing_required_lib('libvirt-python'), exception=LIBVIRT_IMPORT_ERROR)
+
+    result = ClusterNodesFactsModule(module)
+
+    ansible_facts = {
+        'cluster_nodes': result.cluster_nodes,
+        'master_domains': [n['name'] for n in result.cluster_nodes if n['role'] == 'master'],
+        'worker_domains': [n['name'] for n in result.cluster_nodes if n['role'] == 'worker'],
+    }
+
+    module.exit_json(changed=result.changed, ansible_facts=ansible_facts, cached=result.cached)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,392 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+DOCUMENTATION = r'''
+---
+module: k8s_wait_for
+short_description: Wait for k8s objects to reach a given state.
+description:
+    - This module waits until all given predicates hold for the selected k8s objects.
+    - The k8s objects are listed once and then watched (via the k8s watch API), so the module returns as soon as
+    - all predicates hold instead of sleeping for a fixed period of time or polling at fixed intervals.
+    - Lost connections (e.g. while the API server is unavailable) are re-established with exponential backoff.
+    - Only transient errors (connection errors, HTTP status 5xx and 429 as well as expired watches (410 Gone)) are retried,
+    - all other errors (e.g. an invalid kubeconfig file, an unknown resource type or HTTP status 401 and 403) let the module fail immediately.
+version_added: "1.0"
+options:
+    kubeconfig:
+        description:
+            - The location of the kubeconfig file.
+        required: true
+        default: null
+    predicates:
+        description:
+            - The predicates that are to be waited for (all of them are waited for concurrently).
+            - Each item is a dictionary with the following keys
+            - api_version - the API version of the k8s objects (default 'v1').
+            - kind - the kind of the k8s objects.
+            - namespace - the namespace of the k8s objects (optional).
+            - name - the name of the k8s object (optional, mutually exclusive with 'label_selector').
+            - label_selector - the label selector of the k8s objects (optional, at least one object needs to match).
+            - conditions - a list of conditions (dictionaries with the keys 'type', 'status' and optionally 'reason') all of which need to be present.
+            - fields - a list of fields (dictionaries with the key 'path' (a dotted string or a list of keys) and optionally 'value'),
+            - each of which needs to exist (and match the given value, if any).
+            - rollout - whether the rollout of the k8s objects (Deployment, StatefulSet or DaemonSet) needs to be complete.
+            - The k8s objects merely need to exist if neither 'conditions', 'fields' nor 'rollout' are given.
+        required: true
+        default: null
+    timeout:
+        description:
+            - The maximum time (in seconds) to wait for all predicates to hold.
+        required: false
+        default: 600
+notes: []
+requirements:
+    - kubernetes
+'''
+
+EXAMPLES = r'''
+# wait for a MachineSet to be scaled up
+k8s_wait_for:
+  kubeconfig: '/root/ocp4-workdir/auth/kubeconfig'
+  predicates:
+    - api_version: 'machine.openshift.io/v1beta1'
+      kind: MachineSet
+      namespace: openshift-machine-api
+      name: 'ocp1-qf2b5-worker-0'
+      fields:
+        - path: 'status.readyReplicas'
+          value: 4
+
+# wait for the ingress router to be rolled out and an operator to be installed
+k8s_wait_for:
+  kubeconfig: '/root/ocp4-workdir/auth/kubeconfig'
+  predicates:
+    - api_version: 'apps/v1'
+      kind: Deployment
+      namespace: openshift-ingress
+      name: router-default
+      rollout: true
+    - api_version: 'operators.coreos.com/v1alpha1'
+      kind: ClusterServiceVersion
+      namespace: openshift-nfd
+      label_selector: 'operators.coreos.com/nfd.openshift-nfd'
+      fields:
+        - path: 'status.phase'
+          value: 'Succeeded'
+'''
+
+RETURN = r'''
+predicates:
+    description: List containing the result for each predicate (in the given order).
+    returned: success
+    type: list
+    elements: dictionary
+    contains:
+        kind:
+            description: The kind of the k8s objects.
+            returned: success
+            type: string
+            sample: 'MachineSet'
+        description:
+            description: A short description of the k8s objects the predicate refers to.
+            returned: success
+            type: string
+            sample: 'MachineSet openshift-machine-api/ocp1-qf2b5-worker-0'
+        satisfied:
+            description: Whether the predicate holds.
+            returned: success
+            type: bool
+            sample: true
+        elapsed:
+            description: The time (in seconds) it took for the predicate to hold.
+            returned: success
+            type: float
+            sample: 42.5
+        reconnects:
+            description: The number of times the k8s objects had to be listed again (e.g. due to lost connections).
+            returned: success
+            type: int
+            sample: 0
+'''
+
+
+import queue
+import threading
+import time
+import traceback
+from ansible.module_utils.basic import AnsibleModule, missing_required_lib
+
+KUBERNETES_IMPORT_ERROR = None
+try:
+    import urllib3
+    from kubernetes import config, dynamic
+    from kubernetes.client.exceptions import ApiException
+except ImportError:
+    KUBERNETES_IMPORT_ERROR = traceback.format_exc()
+
+
+# the backoff (in seconds) between attempts to re-establish lost connections
+BACKOFF_INITIAL = 1
+BACKOFF_MAX = 30
+
+# the maximum duration (in seconds) of a single watch request
+WATCH_TIMEOUT = 300
+
+ROLLOUT_KINDS = ['Deployment', 'StatefulSet', 'DaemonSet']
+
+# the HTTP status codes of transient errors (besides 5xx), i.e. the requests are retried
+TRANSIENT_HTTP_STATUS = [410, 429]
+
+
+class K8sWaitForException(Exception):
+    def __init__(self, message='Unable to wait for k8s objects'):
+        self.message = message
+        super().__init__(self.message)
+
+
+class K8sWaitForModule(object):
+    def __init__(self, module):
+        self.module = module
+        self.args = self.module.params
+
+        self.changed = False
+        self.predicates = []
+
+        self.client = None
+        self.deadline = None
+
+        self.process()
+
+    def process(self):
+        for p in self.args['predicates']:
+            self._validate_predicate(p)
+
+        self.deadline = time.monotonic() + self.args['timeout']
+
+        try:
+            self.client = self._get_client()
+            self.predicates = self._wait_for_predicates(self.args['predicates'])
+        except K8sWaitForException as e:
+            self.module.fail_json('Unable to wait for k8s objects: {}'.format(e))
+
+        unsatisfied = [p for p in self.predicates if not p['satisfied']]
+        if unsatisfied:
+            self.module.fail_json(
+                'Timed out after {} seconds waiting for {}'.format(self.args['timeout'], ', '.join(p['description'] for p in unsatisfied)),
+                predicates=self.predicates
+            )
+
+    def _validate_predicate(self, p):
+        if not isinstance(p, dict) or 'kind' not in p:
+            self.module.fail_json('Invalid predicate: {}'.format(p))
+        if p.get('name') and p.get('label_selector'):
+            self.module.fail_json('Invalid predicate (name and label_selector are mutually exclusive): {}'.format(p))
+        if p.get('rollout') and p['kind'] not in ROLLOUT_KINDS:
+            self.module.fail_json('Invalid predicate (rollout is only supported for {}): {}'.format(', '.join(ROLLOUT_KINDS), p))
+
+    def _is_transient(self, e):
+        if isinstance(e, ApiException):
+            return e.status is not None and (e.status >= 500 or e.status in TRANSIENT_HTTP_STATUS)
+
+        return isinstance(e, (urllib3.exceptions.HTTPError, ConnectionError, TimeoutError))
+
+    def _get_client(self):
+        backoff = BACKOFF_INITIAL
+
+        # the API server may not be reachable (yet), e.g. while the cluster nodes are starting up
+        while True:
+            try:
+                return dynamic.DynamicClient(config.new_client_from_config(config_file=self.args['kubeconfig']))
+            except Exception as e:
+                if not self._is_transient(e):
+                    raise K8sWaitForException('Unable to connect to the API server using kubeconfig {}: {}'.format(self.args['kubeconfig'], e))
+                if time.monotonic() + backoff >= self.deadline:
+                    raise K8sWaitForException('API server not reachable: {}'.format(e))
+
+            time.sleep(backoff)
+            backoff = min(backoff * 2, BACKOFF_MAX)
+
+    def _wait_for_predicates(self, predicates):
+        results = [None] * len(predicates)
+        done = queue.Queue()
+
+        def wait_for_predicate(index, p):
+            try:
+                done.put((index, self._wait_for_predicate(p)))
+            except Exception as e:
+                done.put((index, e))
+
+        # all predicates are waited for concurrently, the first non-transient error ends the waiting
+        # (the threads waiting for the other predicates are daemon threads, they don't keep the module from exiting)
+        for index, p in enumerate(predicates):
+            threading.Thread(target=wait_for_predicate, args=(index, p), daemon=True).start()
+
+        for _ in predicates:
+            index, result = done.get()
+            if isinstance(result, Exception):
+                raise result
+            results[index] = result
+
+        return results
+
+    def _wait_for_predicate(self, p):
+        description = '{} {}'.format(p['kind'], '/'.join(x for x in [p.get('namespace'), p.get('name') or p.get('label_selector')] if x))
+        started = time.monotonic()
+        reconnects = -1
+        backoff = BACKOFF_INITIAL
+        resource = None
+
+        while time.monotonic() < self.deadline:
+            reconnects += 1
+
+            try:
+                if resource is None:
+                    resource = self.client.resources.get(api_version=p.get('api_version', 'v1'), kind=p['kind'])
+
+                # list the k8s objects first, then watch for changes starting at the version of the list
+                objects, resource_version = self._list_objects(resource, p)
+                backoff = BACKOFF_INITIAL
+
+                if self._holds(p, objects):
+                    return self._result(p, description, True, started, reconnects)
+
+                for event in self.client.watch(
+                    resource,
+                    namespace=p.get('namespace'),
+                    label_selector=p.get('label_selector'),
+                    field_selector='metadata.name={}'.format(p['name']) if p.get('name') else None,
+                    resource_version=resource_version,
+                    timeout=max(1, min(WATCH_TIMEOUT, int(self.deadline - time.monotonic()))),
+                ):
+                    if event['type'] == 'ERROR':
+                        status = ApiException(status=event['raw_object'].get('code'), reason=event['raw_object'].get('message'))
+                        if status.status is not None and not self._is_transient(status):
+                            raise status
+
+                        # e.g. the resource version is too old (410 Gone), list the k8s objects again
+                        break
+
+                    obj = event['raw_object']
+                    if event['type'] == 'DELETED':
+                        objects.pop(obj['metadata']['name'], None)
+                    else:
+                        objects[obj['metadata']['name']] = obj
+
+                    if self._holds(p, objects):
+                        return self._result(p, description, True, started, reconnects)
+
+                    if time.monotonic() >= self.deadline:
+                        break
+            except Exception as e:
+
+                # lost connections are retried with exponential backoff, other errors won't go away by retrying
+                if not self._is_transient(e):
+                    raise K8sWaitForException('Unable to wait for {}: {}'.format(description, e))
+
+                if time.monotonic() + backoff < self.deadline:
+                    time.sleep(backoff)
+                backoff = min(backoff * 2, BACKOFF_MAX)
+
+        return self._result(p, description, False, started, max(reconnects, 0))
+
+    def _list_objects(self, resource, p):
+
+        # a single k8s object is listed as well (the list version is needed to watch a possibly not yet existing k8s object)
+        collection = self.client.get(
+            resource,
+            namespace=p.get('namespace'),
+            label_selector=p.get('label_selector'),
+            field_selector='metadata.name={}'.format(p['name']) if p.get('name') else None,
+        ).to_dict()
+
+        return dict((i['metadata']['name'], i) for i in collection.get('items') or []), collection['metadata']['resourceVersion']
+
+    def _holds(self, p, objects):
+        if not objects:
+            return False
+
+        return all(self._object_holds(p, obj) for obj in objects.values())
+
+    def _object_holds(self, p, obj):
+        conditions = (obj.get('status') or {}).get('conditions') or []
+        for expected in p.get('conditions') or []:
+            if not any(self._condition_matches(expected, c) for c in conditions):
+                return False
+
+        for field in p.get('fields') or []:
+            found, value = self._get_field(obj, field['path'])
+            if not found or ('value' in field and value != field['value'] and str(value) != str(field['value'])):
+                return False
+
+        if p.get('rollout') and not self._rollout_complete(obj, p['kind']):
+            return False
+
+        return True
+
+    def _condition_matches(self, expected, condition):
+        return all(str(condition.get(k)) == str(expected[k]) for k in ['type', 'status', 'reason'] if k in expected)
+
+    def _get_field(self, obj, path):
+        if isinstance(path, str):
+            path = path.split('.')
+
+        value = obj
+        for key in path:
+            if not isinstance(value, dict) or key not in value:
+                return False, None
+            value = value[key]
+
+        return True, value
+
+    def _rollout_complete(self, obj, kind):
+        spec = obj.get('spec') or {}
+        status = obj.get('status') or {}
+
+        if status.get('observedGeneration', 0) < obj['metadata'].get('generation', 0):
+            return False
+
+        if kind == 'DaemonSet':
+            desired = status.get('desiredNumberScheduled', 0)
+            return status.get('updatedNumberScheduled', 0) == desired and status.get('numberAvailable', 0) == desired
+
+        replicas = spec.get('replicas', 1)
+        if status.get('updatedReplicas', 0) != replicas or status.get('replicas', 0) != replicas:
+            return False
+
+        if kind == 'StatefulSet':
+            return status.get('readyReplicas', 0) == replicas and status.get('currentRevision') == status.get('updateRevision')
+
+        return status.get('availableReplicas', 0) == replicas
+
+    def _result(self, p, description, satisfied, started, reconnects):
+        return {
+            'kind': p['kind'],
+            'description': description,
+            'satisfied': satisfied,
+            'elapsed': round(time.monotonic() - started, 1),
+            'reconnects': reconnects,
+        }
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec = dict(
+            kubeconfig = dict(type='path', required=True),
+            predicates = dict(type='list', elements='dict', required=True),
+            timeout = dict(type='int', default=600, required=False),
+        ),
+        supports_check_mode=True
+    )
+
+    if KUBERNETES_IMPORT_ERROR:
+        module.fail_json(msg=missing_required_lib('kubernetes'), exception=KUBERNETES_IMPORT_ERROR)
+
+    result = K8sWaitForModule(module)
+
+    module.exit_json(changed=result.changed, predicates=result.predicates)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+DOCUMENTATION = r'''
+---
+module: libvirt_domain_power
+short_description: Start or shut down multiple libvirt domains at once.
+description:
+    - This module starts or shuts down the given libvirt domains concurrently via a single libvirt connection.
+    - Instead of polling the list of libvirt domains at fixed intervals, it waits for the corresponding
+    - libvirt domain lifecycle events and returns as soon as all libvirt domains reached the requested state.
+    - Libvirt domains already in the requested state are skipped.
+version_added: "1.0"
+options:
+    domains:
+        description:
+            - The names of the libvirt domains.
+        required: true
+        default: null
+    state:
+        description:
+            - The requested state of the libvirt domains.
+        required: true
+        default: null
+        choices: [ 'running', 'shutdown' ]
+    timeout:
+        description:
+            - The maximum time (in seconds) to wait for all libvirt domains to reach the requested state.
+        required: false
+        default: 300
+    destroy_on_timeout:
+        description:
+            - Whether to forcefully stop (destroy) libvirt domains that did not shut down in time.
+            - Only used together with state 'shutdown'.
+        required: false
+        default: false
+    uri:
+        description:
+            - The libvirt connection URI.
+        required: false
+        default: 'qemu:///system'
+notes: []
+requirements:
+    - libvirt-python
+'''
+
+EXAMPLES = r'''
+# shut down all cluster nodes at once
+libvirt_domain_power:
+  domains: '{{ worker_domains + master_domains }}'
+  state: shutdown
+
+# start all cluster nodes at once
+libvirt_domain_power:
+  domains: '{{ master_domains + worker_domains }}'
+  state: running
+
+# check against the libvirt test driver
+libvirt_domain_power:
+  domains:
+    - 'test'
+  state: shutdown
+  uri: 'test:///default'
+'''
+
+RETURN = r'''
+domains:
+    description: List containing the power state transition details for each libvirt domain.
+    returned: success
+    type: list
+    elements: dictionary
+    contains:
+        name:
+            description: The name of the libvirt domain.
+            returned: success
+            type: string
+            sample: 'ocp1-qf2b5-worker-0-456r9'
+        changed:
+            description: Whether the libvirt domain had to be started or shut down.
+            returned: success
+            type: bool
+            sample: true
+        state:
+            description: The state of the libvirt domain when the module finished.
+            returned: success
+            type: string
+            sample: 'shutdown'
+        duration:
+            description: The time (in seconds) the libvirt domain took to reach the requested state.
+            returned: success
+            type: float
+            sample: 12.3
+        destroyed:
+            description: Whether the libvirt domain had to be forcefully stopped.
+            returned: success
+            type: bool
+            sample: false
+elapsed:
+    description: The time (in seconds) all libvirt domains took to reach the requested state.
+    returned: success
+    type: float
+    sample: 14.1
+'''
+
+
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from ansible.module_utils.basic import AnsibleModule, missing_required_lib
+
+LIBVIRT_IMPORT_ERROR = None
+try:
+    import libvirt
+except ImportError:
+    LIBVIRT_IMPORT_ERROR = traceback.format_exc()
+
+
+# the interval (in seconds) at which the libvirt domain state is checked in case a lifecycle event got lost
+EVENT_FALLBACK_INTERVAL = 5
+
+# the default event loop implementation is registered (and run) once per process
+EVENT_LOOP_LOCK = threading.Lock()
+EVENT_LOOP_THREAD = None
+
+
+def start_event_loop():
+    global EVENT_LOOP_THREAD
+
+    with EVENT_LOOP_LOCK:
+        if EVENT_LOOP_THREAD is None:
+            libvirt.virEventRegisterDefaultImpl()
+
+            EVENT_LOOP_THREAD = threading.Thread(target=run_event_loop, daemon=True)
+            EVENT_LOOP_THREAD.start()
+
+
+def run_event_loop():
+    while True:
+        libvirt.virEventRunDefaultImpl()
+
+
+class LibvirtDomainPowerModule(object):
+    def __init__(self, module):
+        self.module = module
+        self.args = self.module.params
+
+        self.changed = False
+        self.domains = []
+        self.elapsed = 0.0
+
+        self.lock = threading.Lock()
+        self.transitions = {}
+
+        self.process()
+
+    def process(self):
+        conn = None
+        callback_id = None
+
+        try:
+            # the default event loop implementation must be registered before the connection is opened
+            start_event_loop()
+            conn = libvirt.open(self.args['uri'])
+
+            callback_id = conn.domainEventRegisterAny(None, libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE, self._lifecycle_event, None)
+
+            self._change_power_state(conn)
+        except libvirt.libvirtError as e:
+            self.module.fail_json('Unable to change power state of libvirt domains: {}'.format(e))
+        finally:
+            if conn:
+                if callback_id is not None:
+                    conn.domainEventDeregisterAny(callback_id)
+                conn.close()
+
+        self.changed = any(d['changed'] for d in self.domains)
+
+    def _lifecycle_event(self, conn, domain, event, detail, opaque):
+        if event == libvirt.VIR_DOMAIN_EVENT_STARTED:
+            state = 'running'
+        elif event == libvirt.VIR_DOMAIN_EVENT_STOPPED:
+            state = 'shutdown'
+        else:
+            return
+
+        with self.lock:
+            transition = self.transitions.get(domain.name())
+            if transition and transition['state'] == state and not transition['done'].is_set():
+                transition['finished'] = time.monotonic()
+                transition['done'].set()
+
+    def _change_power_state(self, conn):
+        state = self.args['state']
+        started = time.monotonic()
+
+        # libvirt domains already in the requested state are skipped
+        targets = []
+        for domain_name in self.args['domains']:
+            domain = conn.lookupByName(domain_name)
+            if (domain.isActive() == 1) == (state == 'running'):
+                self.domains.append({'name': domain_name, 'changed': False, 'state': state, 'duration': 0.0, 'destroyed': False})
+                continue
+
+            targets.append(domain)
+
+        if not targets or self.module.check_mode:
+            for domain in targets:
+                self.domains.append({'name': domain.name(), 'changed': True, 'state': state, 'duration': 0.0, 'destroyed': False})
+            return
+
+        with self.lock:
+            for domain in targets:
+                self.transitions[domain.name()] = {'state': state, 'started': time.monotonic(), 'finished': None, 'done': threading.Event()}
+
+        # issue all requests at once (starting a libvirt domain blocks until the domain is running)
+        with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+            for future in [executor.submit(self._request_power_state, domain, state) for domain in targets]:
+                future.result()
+
+        deadline = started + self.args['timeout']
+        for domain in targets:
+            destroyed = False
+
+            if not self._wait_for_transition(domain, state, deadline):
+                if state == 'shutdown' and self.args['destroy_on_timeout']:
+                    domain.destroy()
+                    destroyed = True
+                    self._finish_transition(domain)
+                else:
+                    self.module.fail_json('Libvirt domain {} did not reach state {} within {} seconds'.format(domain.name(), state, self.args['timeout']))
+
+            transition = self.transitions[domain.name()]
+            self.domains.append({
+                'name': domain.name(),
+                'changed': True,
+                'state': state,
+                'duration': round(transition['finished'] - transition['started'], 1),
+                'destroyed': destroyed,
+            })
+
+        self.elapsed = round(time.monotonic() - started, 1)
+
+    def _request_power_state(self, domain, state):
+        if state == 'running':
+            domain.create()
+            self._finish_transition(domain)
+        else:
+            domain.shutdown()
+
+    def _wait_for_transition(self, domain, state, deadline):
+        transition = self.transitions[domain.name()]
+
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+
+            if transition['done'].wait(min(remaining, EVENT_FALLBACK_INTERVAL)):
+                return True
+
+            # in case the lifecycle event got lost, check the libvirt domain state directly
+            if (domain.isActive() == 1) == (state == 'running'):
+                self._finish_transition(domain)
+                return True
+
+    def _finish_transition(self, domain):
+        with self.lock:
+            transition = self.transitions[domain.name()]
+            if not transition['done'].is_set():
+                transition['finished'] = time.monotonic()
+                transition['done'].set()
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec = dict(
+            domains = dict(type='list', elements='str', required=True),
+            state = dict(type='str', choices=['running', 'shutdown'], required=True),
+            timeout = dict(type='int', default=300, required=False),
+            destroy_on_timeout = dict(type='bool', default=False, required=False),
+            uri = dict(type='str', default='qemu:///system', required=False),
+        ),
+        supports_check_mode=True
+    )
+
+    if LIBVIRT_IMPORT_ERROR:
+        module.fail_json(msg=missing_required_lib('libvirt-python'), exception=LIBVIRT_IMPORT_ERROR)
+
+    result = LibvirtDomainPowerModule(module)
+
+    module.exit_json(changed=result.changed, domains=result.domains, elapsed=result.elapsed)
+
+
+if __name__ == '__main__':
+    main()
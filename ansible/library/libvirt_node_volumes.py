@@ -0,0 +1,214 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+DOCUMENTATION = r'''
+---
+module: libvirt_node_volumes
+short_description: Inspect (and optionally preallocate) the root volumes of OpenShift cluster nodes.
+description:
+    - This module determines the root volumes of the given libvirt domains (cluster nodes).
+    - The root volumes of cluster nodes created by openshift-install (masters) and by the machine API (workers)
+    - are qcow2 overlays sharing a single RHCOS base volume per cluster. The module reports the backing store of
+    - each root volume, the data actually written to it as well as the size of the shared base volumes.
+    - Optionally, disk space for the full capacity of the overlays of write-heavy cluster nodes can be
+    - preallocated (reserved beyond the end of the file without changing its size, same as 'preallocation=falloc'),
+    - which avoids fragmentation and running out of disk space while the cluster node is running.
+version_added: "1.0"
+options:
+    domains:
+        description:
+            - The names of the libvirt domains (cluster nodes).
+        required: true
+        default: null
+    preallocate:
+        description:
+            - The names of the libvirt domains whose root volumes are to be preallocated.
+        required: false
+        default: []
+    uri:
+        description:
+            - The libvirt connection URI.
+        required: false
+        default: 'qemu:///system'
+notes: []
+requirements:
+    - libvirt-python
+    - fallocate (util-linux)
+'''
+
+EXAMPLES = r'''
+# report the root volumes of the cluster worker nodes and preallocate them
+libvirt_node_volumes:
+  domains:
+    - ocp1-qf2b5-worker-0-456r9
+    - ocp1-qf2b5-worker-0-8ab3x
+  preallocate:
+    - ocp1-qf2b5-worker-0-456r9
+    - ocp1-qf2b5-worker-0-8ab3x
+'''
+
+RETURN = r'''
+volumes:
+    description: List containing the root volume details for each libvirt domain (in the given order).
+    returned: success
+    type: list
+    elements: dictionary
+    contains:
+        domain:
+            description: The name of the libvirt domain.
+            returned: success
+            type: string
+            sample: 'ocp1-qf2b5-worker-0-456r9'
+        path:
+            description: The path of the root volume.
+            returned: success
+            type: string
+            sample: '/var/lib/libvirt/openshift-images/ocp1-qf2b5/ocp1-qf2b5-worker-0-456r9'
+        capacity:
+            description: The capacity (in bytes) of the root volume.
+            returned: success
+            type: int
+            sample: 137438953472
+        size:
+            description: The size (in bytes) of the root volume file (for a qcow2 overlay, the data written to it).
+            returned: success
+            type: int
+            sample: 4294967296
+        allocation:
+            description: The disk space (in bytes) allocated by the root volume (i.e. written to it or preallocated).
+            returned: success
+            type: int
+            sample: 4294967296
+        backing_store:
+            description: The path of the backing store of the root volume (if it's an overlay).
+            returned: success
+            type: string
+            sample: '/var/lib/libvirt/openshift-images/ocp1-qf2b5/ocp1-qf2b5-base'
+        preallocated:
+            description: Whether disk space for the full capacity of the root volume is allocated.
+            returned: success
+            type: bool
+            sample: false
+base_volumes:
+    description: Dictionary containing the disk space (in bytes) allocated by each backing store shared by the root volumes.
+    returned: success
+    type: dictionary
+    sample: { '/var/lib/libvirt/openshift-images/ocp1-qf2b5/ocp1-qf2b5-base': 3221225472 }
+'''
+
+
+import os
+import traceback
+import xml.etree.ElementTree as ET
+from ansible.module_utils.basic import AnsibleModule, missing_required_lib
+
+LIBVIRT_IMPORT_ERROR = None
+try:
+    import libvirt
+except ImportError:
+    LIBVIRT_IMPORT_ERROR = traceback.format_exc()
+
+
+class LibvirtNodeVolumesModule(object):
+    def __init__(self, module):
+        self.module = module
+        self.args = self.module.params
+
+        self.changed = False
+        self.volumes = []
+        self.base_volumes = {}
+
+        self.process()
+
+    def process(self):
+        conn = None
+
+        try:
+            conn = libvirt.open(self.args['uri'])
+
+            for name in self.args['domains']:
+                volume = self._get_root_volume(conn, name)
+
+                if name in self.args['preallocate'] and not volume['preallocated']:
+                    self._preallocate(volume)
+
+                self.volumes.append(volume)
+        except libvirt.libvirtError as e:
+            self.module.fail_json('Unable to determine cluster node volumes: {}'.format(e))
+        finally:
+            if conn:
+                conn.close()
+
+    def _get_root_volume(self, conn, name):
+        domain = conn.lookupByName(name)
+        domain_xml = ET.fromstring(domain.XMLDesc(libvirt.VIR_DOMAIN_XML_INACTIVE))
+
+        # the root volume is the first disk of the libvirt domain
+        source = domain_xml.find("devices/disk[@device='disk']/source")
+        if source is None:
+            self.module.fail_json('Libvirt domain {} has no disk'.format(name))
+
+        if source.get('pool') and source.get('volume'):
+            vol = conn.storagePoolLookupByName(source.get('pool')).storageVolLookupByName(source.get('volume'))
+        else:
+            vol = conn.storageVolLookupByPath(source.get('file'))
+
+        capacity = vol.info()[1]
+        vol_xml = ET.fromstring(vol.XMLDesc(0))
+
+        backing_store = vol_xml.findtext('backingStore/path')
+        if backing_store and backing_store not in self.base_volumes:
+            self.base_volumes[backing_store] = self._allocation(backing_store)
+
+        st = os.stat(vol.path())
+        allocation = st.st_blocks * 512
+
+        return {
+            'domain': name,
+            'path': vol.path(),
+            'capacity': capacity,
+            'size': st.st_size,
+            'allocation': allocation,
+            'backing_store': backing_store,
+            'preallocated': allocation >= capacity,
+        }
+
+    def _allocation(self, path):
+        return os.stat(path).st_blocks * 512
+
+    def _preallocate(self, volume):
+        self.changed = True
+        if self.module.check_mode:
+            return
+
+        # the qcow2 overlay grows at its end, the disk space beyond its end is reserved without changing its size
+        # (so the running libvirt domain isn't affected)
+        rc, stdout, stderr = self.module.run_command(['fallocate', '--keep-size', '--length', str(volume['capacity']), volume['path']])
+        if rc != 0:
+            self.module.fail_json('Unable to preallocate root volume {}: {}'.format(volume['path'], stderr))
+
+        volume['allocation'] = self._allocation(volume['path'])
+        volume['preallocated'] = True
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec = dict(
+            domains = dict(type='list', elements='str', required=True),
+            preallocate = dict(type='list', elements='str', default=[], required=False),
+            uri = dict(type='str', default='qemu:///system', required=False),
+        ),
+        supports_check_mode=True
+    )
+
+    if LIBVIRT_IMPORT_ERROR:
+        module.fail_json(msg=missing_required_lib('libvirt-python'), exception=LIBVIRT_IMPORT_ERROR)
+
+    result = LibvirtNodeVolumesModule(module)
+
+    module.exit_json(changed=result.changed, volumes=result.volumes, base_volumes=result.base_volumes)
+
+
+if __name__ == '__main__':
+    main()
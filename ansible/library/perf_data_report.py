@@ -0,0 +1,461 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+DOCUMENTATION = r'''
+---
+module: perf_data_report
+short_description: Process the system performance data collected by nmon / njmon during an OpenShift cluster installation.
+description:
+    - This module stream-parses the nmon (CSV) or njmon (JSON) output files of a data collection directory
+    - into a compact time series per sampling interval (CPU utilization incl. steal time, memory usage,
+    - disk and network throughput of the KVM host).
+    - The time series is aligned with the milestones of the OpenShift cluster installation (taken from the
+    - openshift-install log file and / or passed explicitly), a summary per installation phase is created and
+    - both are written to a gzip-compressed JSON archive.
+version_added: "1.0"
+options:
+    data_dir:
+        description:
+            - The directory containing the nmon / njmon output files.
+        required: true
+        default: null
+    format:
+        description:
+            - The format of the output files ('nmon' or 'njmon').
+        required: true
+        default: null
+    install_log:
+        description:
+            - The location of the openshift-install log file the installation milestones are taken from.
+        required: false
+        default: null
+    milestones:
+        description:
+            - Dictionary containing additional installation milestones (name -> ISO 8601 timestamp).
+        required: false
+        default: {}
+    dest:
+        description:
+            - The location of the gzip-compressed JSON archive to be written.
+        required: true
+        default: null
+notes:
+    - nmon timestamps are interpreted in the local time zone of the KVM host.
+requirements: []
+'''
+
+EXAMPLES = r'''
+# process the nmon output files of a cluster installation
+perf_data_report:
+  data_dir: '/root/ocp4-workdir'
+  format: nmon
+  install_log: '/root/ocp4-workdir/.openshift_install.log'
+  milestones:
+    masters_ready: '2023-03-01T10:31:12Z'
+    clusterversion_available: '2023-03-01T10:52:40Z'
+  dest: '/var/lib/ocp-kvm-ipi/perf-data/ocp1-qf2b5-nmon.json.gz'
+'''
+
+RETURN = r'''
+dest:
+    description: The location of the archive written.
+    returned: success
+    type: string
+    sample: '/var/lib/ocp-kvm-ipi/perf-data/ocp1-qf2b5-nmon.json.gz'
+files:
+    description: The nmon / njmon output files processed.
+    returned: success
+    type: list
+    sample: [ '/root/ocp4-workdir/kvmhost_230301_1012.nmon' ]
+samples:
+    description: The number of samples (sampling intervals) processed.
+    returned: success
+    type: int
+    sample: 287
+milestones:
+    description: The installation milestones (name -> ISO 8601 timestamp), in chronological order.
+    returned: success
+    type: dictionary
+    sample: { 'infrastructure_creation': '2023-03-01T10:12:40+00:00', 'install_complete': '2023-03-01T10:58:02+00:00' }
+phases:
+    description: List containing the summary of each installation phase (the time between two consecutive milestones).
+    returned: success
+    type: list
+    elements: dictionary
+    sample: [ { 'phase': 'api_up -> bootstrap_complete', 'duration': 842, 'samples': 84, 'cpu_busy_avg': 71.2 } ]
+report:
+    description: The summary per installation phase as human readable lines.
+    returned: success
+    type: list
+    sample: [ 'api_up -> bootstrap_complete (842s): cpu busy avg 71.2% / max 98.1%, steal avg 3.4% / max 12.0%, ...' ]
+'''
+
+
+import datetime
+import glob
+import gzip
+import json
+import os
+import re
+import time
+from ansible.module_utils.basic import AnsibleModule
+
+
+# the columns of the time series (one row per sampling interval)
+COLUMNS = [
+    'timestamp', 'cpu_user', 'cpu_sys', 'cpu_wait', 'cpu_idle', 'cpu_steal',
+    'mem_total_mb', 'mem_used_mb', 'disk_read_kbs', 'disk_write_kbs', 'net_rx_kbs', 'net_tx_kbs'
+]
+
+# the openshift-install log messages marking the installation milestones (the first match of each wins)
+INSTALL_LOG_MILESTONES = [
+    ('infrastructure_creation', re.compile(r'^Creating infrastructure resources')),
+    ('api_up', re.compile(r'^API v\S+ up')),
+    ('bootstrap_complete', re.compile(r'^(Bootstrap status: complete|It is now safe to remove the bootstrap resources)')),
+    ('install_complete', re.compile(r'^Install complete')),
+]
+
+INSTALL_LOG_LINE = re.compile(r'^time="(?P<time>[^"]+)" level=\w+ msg="(?P<msg>.*)"')
+
+# the njmon output files are named '<hostname>_<date>_<time>.json'
+NJMON_FILE = re.compile(r'^.+_\d{6,8}_\d{4,6}\.json$')
+
+# partitions, device mapper and loop devices are not accounted for separately (their I/O shows on the whole disks already)
+PARTITION = re.compile(r'^(?P<disk>.+?)p?\d+$')
+IGNORED_DISKS = re.compile(r'^(dm-|loop|ram|sr)')
+
+# the number of bytes read from njmon output files at once
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+class PerfDataReportException(Exception):
+    def __init__(self, message='performance data could not be processed'):
+        self.message = message
+        super().__init__(self.message)
+
+
+class PerfDataReportModule(object):
+    def __init__(self, module):
+        self.module = module
+        self.args = self.module.params
+
+        self.changed = False
+        self.files = []
+        self.samples = []
+        self.milestones = {}
+        self.iso_milestones = {}
+        self.phases = []
+        self.report = []
+
+        self.process()
+
+    def process(self):
+        if self.args['format'] == 'nmon':
+            self.files = sorted(glob.glob(os.path.join(self.args['data_dir'], '*.nmon')))
+        else:
+            self.files = sorted(
+                os.path.join(self.args['data_dir'], f) for f in os.listdir(self.args['data_dir']) if NJMON_FILE.match(f)
+            )
+
+        try:
+            for f in self.files:
+                if self.args['format'] == 'nmon':
+                    self.samples.extend(self._parse_nmon(f))
+                else:
+                    self.samples.extend(self._parse_njmon(f))
+        except (OSError, UnicodeDecodeError) as e:
+            self.module.fail_json('Unable to read performance data: {}'.format(e))
+        self.samples.sort(key=lambda s: s[0])
+
+        try:
+            self.milestones = self._get_milestones()
+        except PerfDataReportException as e:
+            self.module.fail_json(e.message)
+        self.iso_milestones = self._iso_milestones()
+
+        self.phases = self._summarize()
+        self.report = [self._report_line(p) for p in self.phases]
+
+        self.changed = True
+        if self.module.check_mode:
+            return
+
+        archive = {
+            'format': self.args['format'],
+            'files': [os.path.basename(f) for f in self.files],
+            'milestones': self.iso_milestones,
+            'phases': self.phases,
+            'columns': COLUMNS,
+            'samples': self.samples,
+        }
+
+        try:
+            os.makedirs(os.path.dirname(self.args['dest']), exist_ok=True)
+            tmp = '{}.tmp'.format(self.args['dest'])
+            with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+                json.dump(archive, f, separators=(',', ':'))
+            os.replace(tmp, self.args['dest'])
+        except OSError as e:
+            self.module.fail_json('Unable to write performance data archive {}: {}'.format(self.args['dest'], e))
+
+    def _parse_nmon(self, path):
+        headers = {}
+        current = None
+        samples = []
+
+        # the lines of each snapshot follow its 'ZZZZ' line (the lines of a snapshot are collected until the next one starts)
+        with open(path, 'r', errors='replace') as f:
+            for line in f:
+                fields = line.rstrip('\r\n').split(',')
+                if len(fields) < 3:
+                    continue
+
+                section = fields[0]
+                if section == 'ZZZZ':
+                    if current:
+                        samples.append(self._nmon_sample(headers, current))
+                    current = {'tag': fields[1], 'timestamp': self._nmon_timestamp(fields)}
+                elif not fields[1].startswith('T') or not fields[1][1:].isdigit():
+                    headers[section] = fields[2:]
+                elif current is not None and fields[1] == current['tag'] and section in headers:
+                    current[section] = dict(zip(headers[section], fields[2:]))
+
+        if current:
+            samples.append(self._nmon_sample(headers, current))
+
+        return [s for s in samples if s[0] is not None]
+
+    def _nmon_timestamp(self, fields):
+        try:
+            return time.mktime(time.strptime('{} {}'.format(fields[2], fields[3]), '%H:%M:%S %d-%b-%Y'))
+        except (IndexError, ValueError):
+            return None
+
+    def _nmon_sample(self, headers, snapshot):
+        cpu = snapshot.get('CPU_ALL', {})
+        mem = snapshot.get('MEM', {})
+        net = snapshot.get('NET', {})
+
+        mem_total = self._number(mem.get('memtotal'))
+        mem_used = mem_total - self._number(mem.get('memfree')) - self._number(mem.get('cached')) - self._number(mem.get('buffers'))
+
+        return [
+            snapshot['timestamp'],
+            self._number(cpu.get('User%')),
+            self._number(cpu.get('Sys%')),
+            self._number(cpu.get('Wait%')),
+            self._number(cpu.get('Idle%')),
+            self._number(cpu.get('Steal%')),
+            round(mem_total, 1),
+            round(mem_used, 1),
+            round(self._sum_disks(snapshot.get('DISKREAD', {})), 1),
+            round(self._sum_disks(snapshot.get('DISKWRITE', {})), 1),
+            round(sum(self._number(v) for k, v in net.items() if k.endswith('-read-KB/s') and not k.startswith('lo-')), 1),
+            round(sum(self._number(v) for k, v in net.items() if k.endswith('-write-KB/s') and not k.startswith('lo-')), 1),
+        ]
+
+    def _parse_njmon(self, path):
+        decoder = json.JSONDecoder()
+        samples = []
+        buffer = ''
+
+        # njmon writes one JSON object per snapshot, which are decoded one after the other without reading the whole file
+        with open(path, 'r', errors='replace') as f:
+            while True:
+                chunk = f.read(READ_CHUNK_SIZE)
+                buffer += chunk
+
+                while True:
+                    buffer = buffer.lstrip(' \t\r\n,[]')
+                    if not buffer:
+                        break
+                    try:
+                        obj, end = decoder.raw_decode(buffer)
+                    except ValueError:
+                        if not chunk:
+                            buffer = ''
+                        break
+                    buffer = buffer[end:]
+
+                    for snapshot in (obj.get('samples', [obj]) if isinstance(obj, dict) else []):
+                        sample = self._njmon_sample(snapshot)
+                        if sample[0] is not None:
+                            samples.append(sample)
+
+                if not chunk:
+                    break
+
+        return samples
+
+    def _njmon_sample(self, snapshot):
+        timestamp = snapshot.get('timestamp', {})
+        cpu = snapshot.get('cpu_total', {})
+        mem = snapshot.get('proc_meminfo', {})
+        disks = snapshot.get('disks', {})
+        nics = dict((k, v) for k, v in snapshot.get('network_interfaces', {}).items() if k != 'lo')
+
+        # njmon reports the memory in KB
+        mem_total = self._number(mem.get('MemTotal')) / 1024
+        mem_used = mem_total - self._number(mem.get('MemAvailable', mem.get('MemFree'))) / 1024
+
+        return [
+            self._parse_timestamp(timestamp.get('UTC') or timestamp.get('datetime')),
+            self._number(cpu.get('user')) + self._number(cpu.get('nice')),
+            self._number(cpu.get('sys')) + self._number(cpu.get('hardirq')) + self._number(cpu.get('softirq')),
+            self._number(cpu.get('iowait')),
+            self._number(cpu.get('idle')),
+            self._number(cpu.get('steal')),
+            round(mem_total, 1),
+            round(mem_used, 1),
+            round(self._sum_disks(dict((k, v.get('rkb')) for k, v in disks.items())), 1),
+            round(self._sum_disks(dict((k, v.get('wkb')) for k, v in disks.items())), 1),
+            round(sum(self._number(v.get('ibytes')) for v in nics.values()) / 1024, 1),
+            round(sum(self._number(v.get('obytes')) for v in nics.values()) / 1024, 1),
+        ]
+
+    def _sum_disks(self, values):
+        total = 0.0
+        for disk, value in values.items():
+            if IGNORED_DISKS.match(disk):
+                continue
+            partition = PARTITION.match(disk)
+            if partition and partition.group('disk') in values:
+                continue
+            total += self._number(value)
+
+        return total
+
+    def _number(self, value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return 0.0
+
+    def _parse_timestamp(self, value):
+        if not value:
+            return None
+
+        try:
+            ts = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=datetime.timezone.utc)
+
+        return ts.timestamp()
+
+    def _get_milestones(self):
+        milestones = {}
+
+        if self.args['install_log'] and os.path.exists(self.args['install_log']):
+            with open(self.args['install_log'], 'r', errors='replace') as f:
+                for line in f:
+                    m = INSTALL_LOG_LINE.match(line)
+                    if not m:
+                        continue
+                    for name, pattern in INSTALL_LOG_MILESTONES:
+                        if pattern.match(m.group('msg')):
+
+                            # the log file accumulates the runs of openshift-install, only the milestones of the last installation count
+                            if name == 'infrastructure_creation':
+                                milestones = {}
+                            milestones.setdefault(name, self._parse_timestamp(m.group('time')))
+
+        for name, value in self.args['milestones'].items():
+            ts = self._parse_timestamp(value)
+            if value and ts is None:
+                raise PerfDataReportException('Invalid timestamp for installation milestone {}: {}'.format(name, value))
+            if ts is not None:
+                milestones[name] = ts
+
+        return dict(sorted(((k, v) for k, v in milestones.items() if v is not None), key=lambda m: m[1]))
+
+    def _iso_milestones(self):
+        return dict((k, datetime.datetime.fromtimestamp(v, datetime.timezone.utc).isoformat()) for k, v in self.milestones.items())
+
+    def _summarize(self):
+        if not self.samples:
+            return []
+
+        # the phases are the periods between consecutive milestones, plus the periods before the first and after the last one
+        boundaries = [('collection_start', self.samples[0][0])]
+        boundaries.extend((k, v) for k, v in self.milestones.items() if self.samples[0][0] < v < self.samples[-1][0])
+        boundaries.append(('collection_end', self.samples[-1][0] + 1))
+
+        phases = [self._phase('overall', self.samples[0][0], self.samples[-1][0] + 1)]
+        for (start_name, start), (end_name, end) in zip(boundaries, boundaries[1:]):
+            phases.append(self._phase('{} -> {}'.format(start_name, end_name), start, end))
+
+        return phases
+
+    def _phase(self, name, start, end):
+        rows = [s for s in self.samples if start <= s[0] < end]
+        summary = {
+            'phase': name,
+            'start': datetime.datetime.fromtimestamp(start, datetime.timezone.utc).isoformat(),
+            'duration': int(round(end - start)),
+            'samples': len(rows),
+        }
+        if not rows:
+            return summary
+
+        def column(name):
+            i = COLUMNS.index(name)
+            return [r[i] for r in rows]
+
+        busy = [100.0 - v for v in column('cpu_idle')]
+        for key, values in [
+            ('cpu_busy', busy),
+            ('cpu_steal', column('cpu_steal')),
+            ('cpu_wait', column('cpu_wait')),
+            ('mem_used_mb', column('mem_used_mb')),
+            ('disk_read_kbs', column('disk_read_kbs')),
+            ('disk_write_kbs', column('disk_write_kbs')),
+            ('net_rx_kbs', column('net_rx_kbs')),
+            ('net_tx_kbs', column('net_tx_kbs')),
+        ]:
+            summary['{}_avg'.format(key)] = round(sum(values) / len(values), 1)
+            summary['{}_max'.format(key)] = round(max(values), 1)
+
+        return summary
+
+    def _report_line(self, phase):
+        if not phase['samples']:
+            return '{} ({}s): no samples'.format(phase['phase'], phase['duration'])
+
+        return (
+            '{phase} ({duration}s): cpu busy avg {cpu_busy_avg}% / max {cpu_busy_max}%, '
+            'steal avg {cpu_steal_avg}% / max {cpu_steal_max}%, iowait avg {cpu_wait_avg}%, '
+            'memory used max {mem_used_mb_max} MB, disk read / write avg {disk_read_kbs_avg} / {disk_write_kbs_avg} KB/s, '
+            'network rx / tx avg {net_rx_kbs_avg} / {net_tx_kbs_avg} KB/s'
+        ).format(**phase)
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec = dict(
+            data_dir = dict(type='path', required=True),
+            format = dict(type='str', choices=['nmon', 'njmon'], required=True),
+            install_log = dict(type='path', default=None, required=False),
+            milestones = dict(type='dict', default={}, required=False),
+            dest = dict(type='path', required=True),
+        ),
+        supports_check_mode=True
+    )
+
+    result = PerfDataReportModule(module)
+
+    module.exit_json(
+        changed=result.changed,
+        dest=module.params['dest'],
+        files=result.files,
+        samples=len(result.samples),
+        milestones=result.iso_milestones,
+        phases=result.phases,
+        report=result.report
+    )
+
+
+if __name__ == '__main__':
+    main()
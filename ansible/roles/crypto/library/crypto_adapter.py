@@ -14,19 +14,53 @@ options:
         description:
             - The crypto adapter to be configured / deconfigured / enabled / disabled.
             - Must be specified fully qualified using the following notation: '<CARD>.<DOMAIN>'.
-        required: true
+            - Mutually exclusive with 'adapters'.
+        required: false
+        default: null
+    adapters:
+        description:
+            - A list of crypto adapters to be converged within a single module run.
+            - Each item is either a fully qualified crypto adapter ID ('<CARD>.<DOMAIN>')
+            - or a dictionary with an 'id' (or 'adapter') key and optional 'state' and 'driver' keys
+            - that override the module-level 'state' and 'driver' options for that crypto adapter.
+            - Items of the 'crypto_adapters' host variable can be passed as-is.
+            - Mutually exclusive with 'adapter'.
+        required: false
         default: null
     state:
         description:
             - The desired state of the crypto adapter on the s390x host.
+            - Multiple states can be given as a list, they are applied one after another (e.g. [ "configured", "enabled" ]).
         choices: [ "configured", "deconfigured", "enabled", "disabled" ]
-        default: "enabled"
+        default: [ "enabled" ]
     driver:
         description:
             - The device driver the crypto adapter on the s390x host will be assigned to.
         choices: [ "zcrypt", "other" ]
         default "zcrypt"
-notes: []
+    backend:
+        description:
+            - The source of the crypto adapter information.
+            - 'lszcrypt' parses the output of 'lszcrypt -V'.
+            - 'sysfs' reads the AP bus device attributes from sysfs directly and falls back to 'lszcrypt'
+            - if these are incomplete or do not cover all of the given crypto adapters.
+        choices: [ "lszcrypt", "sysfs" ]
+        default: "lszcrypt"
+    sysfs_root:
+        description:
+            - The mount point of sysfs used by the 'sysfs' backend and for updating the AP bus masks.
+        default: "/sys"
+    lock_file:
+        description:
+            - The lock file serializing the changes to the AP bus masks on the host
+            - (must be the same as used by the libvirt 'qemu' hook of the crypto role).
+        default: "/run/lock/libvirt-hook-qemu-vfio-ap.lock"
+notes:
+    - The crypto adapter information is fetched once per state transition step
+    - (plus once before the driver assignments are checked, if any crypto adapter state has been changed)
+    - regardless of the number of crypto adapters given.
+    - Driver assignments of all crypto adapters are changed with at most one write to each of the AP bus masks (apmask / aqmask).
+    - The AP bus masks are read, written and read back while holding an exclusive lock on 'lock_file'.
 requirements: []
 '''
 
@@ -60,39 +94,165 @@ EXAMPLES = r'''
 - crypto_adapter:
     adapter: '07.0029'
     driver: zcrypt
+
+# configure and enable multiple crypto adapters at once
+- crypto_adapter:
+    adapters:
+      - '07.0029'
+      - '07.002a'
+    state:
+      - configured
+      - enabled
+
+# configure and enable the given crypto adapters, handing one of them over to a different driver
+- crypto_adapter:
+    adapters:
+      - id: '07.0029'
+      - id: '07.002a'
+        driver: other
+    state:
+      - configured
+      - enabled
+'''
+
+RETURN = r'''
+adapters:
+    description: List containing the changes made to each of the given crypto adapters.
+    returned: success
+    type: list
+    elements: dictionary
+    contains:
+        adapter:
+            description: The crypto adapter ID.
+            returned: success
+            type: string
+            sample: '07.0029'
+        changed:
+            description: Whether the crypto adapter has been changed.
+            returned: success
+            type: bool
+            sample: true
+        states:
+            description: The state transitions that have been applied to the crypto adapter (in order).
+            returned: success
+            type: list
+            sample: [ 'configured' ]
+        driver:
+            description: The driver the crypto adapter has been handed over to (null if unchanged).
+            returned: success
+            type: string
+            sample: 'zcrypt'
 '''
 
 
-from enum import Enum
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.ap_masks import ApMasks, ApMaskException
+from ansible.module_utils.crypto_inventory import CryptoInventory, CryptoInventoryException
 
 
 class CryptoAdapterModule(object):
-
-    AdapterDetails = Enum('AdapterDetails', ['ADAPTER', 'TYPE', 'MODE', 'STATUS', 'REQUESTS', 'PENDING', 'HWTYPE', 'QDEPTH', 'FUNCTIONS', 'DRIVER'], start=0)
-
     def __init__(self, module):
         self.module = module
         self.args = self.module.params
 
         self.chzcrypt_cmd = self.module.get_bin_path('chzcrypt', required=True)
-        self.lszcrypt_cmd = self.module.get_bin_path('lszcrypt', required=True)
+        self.lszcrypt_cmd = self.module.get_bin_path('lszcrypt', required=self.args['backend'] == 'lszcrypt')
 
         self.changed = False
+        self.adapter_changes = {}
 
         self.process()
 
     def process(self):
-        adapter_device = self.args['adapter']
-        target_state = self.args['state']
-        target_driver = self.args['driver']
+        targets = self._get_targets()
+
+        for adapter_device in targets:
+            self.adapter_changes[adapter_device] = {
+                'adapter': adapter_device,
+                'changed': False,
+                'states': [],
+                'driver': None,
+            }
+
+        # a single 'lszcrypt' snapshot serves all crypto adapters;
+        # a new one is only taken after crypto adapter states have actually been changed
+        inventory = self._get_inventory(targets.keys())
+
+        # apply the state transitions step by step for all crypto adapters at once
+        number_of_steps = max([len(t['states']) for t in targets.values()] + [0])
+        for step in range(number_of_steps):
+            transitions = self._plan_state_transitions(targets, step, inventory)
+
+            for adapter_device, target_state in transitions:
+                self._change_adapter_state(adapter_device, target_state)
+
+            if transitions:
+                if self.module.check_mode:
+                    self._predict_adapter_states(inventory, transitions)
+                else:
+                    inventory = self._get_inventory(targets.keys())
+
+        self._change_adapter_drivers(self._plan_driver_transitions(targets, inventory))
+
+        self.changed = any(c['changed'] for c in self.adapter_changes.values())
+
+    def _get_targets(self):
+        targets = {}
+
+        default_states = self.args['state']
+        default_driver = self.args['driver']
+
+        if self.args['adapter']:
+            items = [self.args['adapter']]
+        else:
+            items = self.args['adapters']
+
+        for item in items:
+            if isinstance(item, dict):
+                adapter_device = item.get('id', item.get('adapter'))
+                states = item.get('state', default_states)
+                driver = item.get('driver', default_driver)
+            else:
+                adapter_device = item
+                states = default_states
+                driver = default_driver
+
+            if not isinstance(adapter_device, str) or len(adapter_device.split('.')) != 2:
+                self.module.fail_json('Invalid crypto adapter: {}'.format(adapter_device))
+
+            if isinstance(states, str):
+                states = [states]
 
-        self._toggle_adapter_state(adapter_device, target_state)
-        self._toggle_adapter_driver(adapter_device, target_driver)
+            for s in states:
+                if s not in ['configured', 'deconfigured', 'enabled', 'disabled']:
+                    self.module.fail_json('Invalid crypto adapter state: {} to {}'.format(adapter_device, s))
 
+            if driver not in ['zcrypt', 'other']:
+                self.module.fail_json('Invalid crypto adapter driver: {} to {}'.format(adapter_device, driver))
 
-    def _toggle_adapter_state(self, target_adapter, target_state):
-        current_state = self._get_adapter_detail(target_adapter, CryptoAdapterModule.AdapterDetails.STATUS.value)
+            targets[adapter_device] = {
+                'states': states,
+                'driver': driver,
+            }
+
+        return targets
+
+    def _plan_state_transitions(self, targets, step, inventory):
+        transitions = []
+
+        for adapter_device, target in targets.items():
+            if step >= len(target['states']):
+                continue
+
+            target_state = target['states'][step]
+            current_state = self._get_adapter_detail(inventory, adapter_device, 'status')
+
+            if self._needs_state_transition(adapter_device, current_state, target_state):
+                transitions.append((adapter_device, target_state))
+
+        return transitions
+
+    def _needs_state_transition(self, target_adapter, current_state, target_state):
 
         # supported state transitions:
         # deconfig -> configured
@@ -101,10 +261,9 @@ class CryptoAdapterModule(object):
 
         if current_state == 'deconfig':
             if target_state == 'configured':
-                self._change_adapter_state(target_adapter, target_state)
-                self.changed = True
+                return True
             if target_state == 'deconfigured':
-                self.changed = False
+                return False
             if target_state in ['enabled', 'disabled']:
 
                 # unsupported, critical
@@ -113,60 +272,74 @@ class CryptoAdapterModule(object):
             if target_state == 'configured':
 
                 # unsupported but not critical, simply do nothing
-                self.changed = False
+                return False
             if target_state == 'deconfigured':
-                self._change_adapter_state(target_adapter, target_state)
-                self.changed = True
+                return True
             if target_state == 'enabled':
-                self.changed = False
+                return False
             if target_state == 'disabled':
-                self._change_adapter_state(target_adapter, target_state)
-                self.changed = True
+                return True
         elif current_state == 'offline' :
             if target_state == 'configured':
 
                 # unsupported but not critical, simply do nothing
-                self.changed = False
+                return False
             if target_state == 'deconfigured':
-                self._change_adapter_state(target_adapter, target_state)
-                self.changed = True
+                return True
             if target_state == 'enabled':
-                self._change_adapter_state(target_adapter, target_state)
-                self.changed = True
+                return True
             if target_state == 'disabled':
-                self.changed = False
+                return False
         else:
             self.module.fail_json('Unknown crypto adapter state: {} is {}'.format(target_adapter, current_state))
 
+    def _predict_adapter_states(self, inventory, transitions):
 
-    def _toggle_adapter_driver(self, target_adapter, target_driver):
-        current_driver = self._get_adapter_detail(target_adapter, CryptoAdapterModule.AdapterDetails.DRIVER.value)
+        # used in check mode only: the crypto adapter states that would result from the given transitions
+        predicted_states = {
+            'configured': 'online',
+            'deconfigured': 'deconfig',
+            'enabled': 'online',
+            'disabled': 'offline',
+        }
 
-        # driver mapping:
-        # zcrypt -> cex*
-        # other -> -no-driver-
+        for adapter_device, target_state in transitions:
+            inventory.get(adapter_device)['status'] = predicted_states[target_state]
 
-        # supported driver transitions:
-        # cex* -> -no-driver-
-        # -no-driver- -> cex*
+    def _plan_driver_transitions(self, targets, inventory):
+        transitions = []
 
-        if current_driver.startswith('cex'):
-            if target_driver == 'zcrypt':
-                self.changed = False
-            else:
-                self._change_adapter_driver(target_adapter, target_driver, '-')
-                self.changed = True
-        elif 'no-driver' in current_driver:
-            if target_driver == 'zcrypt':
-                self._change_adapter_driver(target_adapter, target_driver, '+')
-                self.changed = True
+        for adapter_device, target in targets.items():
+            target_driver = target['driver']
+            current_driver = self._get_adapter_detail(inventory, adapter_device, 'driver')
+
+            # driver mapping:
+            # zcrypt -> cex*
+            # other -> -no-driver-
+
+            # supported driver transitions:
+            # cex* -> -no-driver-
+            # -no-driver- -> cex*
+
+            if current_driver.startswith('cex'):
+                if target_driver != 'zcrypt':
+                    transitions.append((adapter_device, target_driver, '-'))
+            elif 'no-driver' in current_driver:
+                if target_driver == 'zcrypt':
+                    transitions.append((adapter_device, target_driver, '+'))
             else:
-                self.changed = False
-        else:
-            self.module.fail_json('Unknown crypto adapter driver: {} is {}'.format(target_adapter, current_driver))
+                self.module.fail_json('Unknown crypto adapter driver: {} is {}'.format(adapter_device, current_driver))
+
+        return transitions
 
 
     def _change_adapter_state(self, adapter, target_state):
+        self.adapter_changes[adapter]['states'].append(target_state)
+        self.adapter_changes[adapter]['changed'] = True
+
+        if self.module.check_mode:
+            return
+
         try:
             if target_state == 'configured':
                 change_cmd = '{} --config-on {}'.format(self.chzcrypt_cmd, adapter)
@@ -185,94 +358,73 @@ class CryptoAdapterModule(object):
             self.module.fail_json('Unable to change state of crypto adapter: {} to {}'.format(adapter, target_state))
 
 
-    def _change_adapter_driver(self, adapter, target_driver, bitmode):
-        try:
-            card = adapter.split('.')[0]
-            domain = adapter.split('.')[1]
-
-            change_cmds = {}
+    def _change_adapter_drivers(self, transitions):
+        for adapter, target_driver, _ in transitions:
+            self.adapter_changes[adapter]['driver'] = target_driver
+            self.adapter_changes[adapter]['changed'] = True
 
-            # change the crypto adapter card driver assignment
-            card_cmd = 'echo {}{} > /sys/bus/ap/apmask'.format(bitmode, int(card))
-            change_cmds['card'] = card_cmd
+        if self.module.check_mode or not transitions:
+            return
 
-            # change the crypto adapter domain assignment
-            domain_cmd = 'echo {}{} > /sys/bus/ap/aqmask'.format(bitmode, int(domain))
-            change_cmds['domain'] = domain_cmd
+        # change the crypto adapter card and domain driver assignments of all crypto adapters at once
+        changes = [(adapter, bitmode) for adapter, _, bitmode in transitions]
 
-            for k, v in change_cmds.items():
-                rc, _, _ = self.module.run_command(v, use_unsafe_shell=True)
-
-                if rc != 0:
-                    raise Exception('Unable to change driver of crypto adapter {}: {} to {}'.format(k, adapter, target_driver))
-        except Exception as e:
-            self.module.fail_json(e)
+        try:
+            ApMasks(self.args['sysfs_root'], self.args['lock_file']).update(changes)
+        except ApMaskException as e:
+            self.module.fail_json('Unable to change driver of crypto adapters: {} ({})'.format(', '.join(a for a, _ in changes), e.message))
 
 
-    def _get_adapter_detail(self, target_adapter, detail_index):
+    def _get_adapter_detail(self, inventory, target_adapter, detail):
         adapter_detail = None
 
         try:
-            adapter_detail = ''
-            adapter_info = self._get_adapter_info(target_adapter)
-
-            adapter_detail = adapter_info[detail_index]
-
-            if not adapter_detail:
-                raise Exception
-        except Exception:
-            self.module.fail_json('Unable to determine crypto adapter detail: {}'.format(target_adapter))
+            adapter_detail = inventory.get_detail(target_adapter, detail)
+        except CryptoInventoryException as e:
+            self.module.fail_json(e.message)
 
         return adapter_detail
 
 
-    def _get_adapter_info(self, target_adapter):
-        adapter_info = []
-
-        list_cmd = '{} -V'.format(self.lszcrypt_cmd)
+    def _get_inventory(self, target_adapters):
+        inventory = None
 
-        rc, out, err = self.module.run_command(list_cmd)
-
-        if rc != 0:
-            self.module.fail_json('Unable to determine crypto adapter info: {}'.format(target_adapter))
-        else:
-            try:
-                out_lines = out.split("\n")
-
-                # skip the first two lines of the 'lszcrypt' output
-                i = 2
-
-                while i < len(out_lines):
-                    a = out_lines[i].split()
-
-                    if a[0] == target_adapter:
-                        adapter_info = a
-                        break
-
-                    i+=1
+        try:
+            inventory = CryptoInventory.load(self.module, self.lszcrypt_cmd, self.args['backend'], self.args['sysfs_root'], target_adapters)
+        except CryptoInventoryException:
+            self.module.fail_json('Unable to determine crypto adapter info: {}'.format(', '.join(target_adapters)))
 
-                # raise an exception if the target adapter could not be found
-                if not adapter_info:
-                    raise Exception
-            except Exception:
+        # fail if any of the target adapters could not be found
+        for target_adapter in target_adapters:
+            if target_adapter not in inventory:
                 self.module.fail_json('Unable to determine crypto adapter info: {}'.format(target_adapter))
 
-        return adapter_info
+        return inventory
 
 
 def main():
     module = AnsibleModule(
         argument_spec = dict(
-            adapter = dict(type='str', required=True),
-            state = dict(type='str', default='enabled', choices=['configured', 'deconfigured', 'enabled', 'disabled'], required=False),
+            adapter = dict(type='str', required=False),
+            adapters = dict(type='list', elements='raw', required=False),
+            state = dict(type='list', elements='str', default=['enabled'], choices=['configured', 'deconfigured', 'enabled', 'disabled'], required=False),
             driver = dict(type='str', default='zcrypt', choices=['zcrypt', 'other'], required=False),
+            backend = dict(type='str', default='lszcrypt', choices=['lszcrypt', 'sysfs'], required=False),
+            sysfs_root = dict(type='str', default='/sys', required=False),
+            lock_file = dict(type='path', default='/run/lock/libvirt-hook-qemu-vfio-ap.lock', required=False),
         ),
+        mutually_exclusive=[
+            ('adapter', 'adapters'),
+        ],
+        required_one_of=[
+            ('adapter', 'adapters'),
+        ],
         supports_check_mode=True
     )
 
     result = CryptoAdapterModule(module)
 
-    module.exit_json(changed=result.changed)
+    module.exit_json(changed=result.changed, adapters=list(result.adapter_changes.values()))
 
 
 if __name__ == '__main__':
@@ -15,8 +15,29 @@ options:
             - The ID of the crypto adapter to be queried for detailed information.
             - This ID can either be a crypto adapter card number, e.g. '07'
             - or a crypto adapter domain number, e.g. '07.0029'.
-        required: true
+            - Mutually exclusive with 'adapters'.
+        required: false
         default: null
+    adapters:
+        description:
+            - A list of crypto adapter IDs (cards or domains) to be queried for detailed information.
+            - Items can also be dictionaries with an 'id' key, e.g. the items of the 'crypto_adapters' host variable.
+            - All crypto adapters are looked up in the same 'lszcrypt' snapshot.
+            - Mutually exclusive with 'adapter'.
+        required: false
+        default: null
+    backend:
+        description:
+            - The source of the crypto adapter information.
+            - 'lszcrypt' parses the output of 'lszcrypt -V'.
+            - 'sysfs' reads the AP bus device attributes from sysfs directly and falls back to 'lszcrypt'
+            - if these are incomplete or do not cover all of the queried crypto adapters.
+        choices: [ "lszcrypt", "sysfs" ]
+        default: "lszcrypt"
+    sysfs_root:
+        description:
+            - The mount point of sysfs used by the 'sysfs' backend.
+        default: "/sys"
 notes: []
 requirements: []
 '''
@@ -29,12 +50,26 @@ EXAMPLES = r'''
 # get information for crypto adapter domain
 - crypto_adapter_info:
     adapter: '07.0029'
+
+# get information for multiple crypto adapters at once
+- crypto_adapter_info:
+    adapters:
+      - '07'
+      - '07.0029'
+      - '07.002a'
 '''
 
 RETURN = r'''
+adapters_info:
+    description:
+        - List of dictionaries containing the crypto adapter information (see 'adapter_info'), in the order given by 'adapters'.
+        - Crypto adapters that could not be found are omitted.
+    returned: success and 'adapters' was given
+    type: list
+    elements: dictionary
 adapter_info:
-    description: Dictionary containing the crypto adapter information.
-    returned: success
+    description: Dictionary containing the crypto adapter information (empty if the crypto adapter could not be found).
+    returned: success and 'adapter' was given
     type: dictionary
     contains:
         card:
@@ -87,10 +122,21 @@ adapter_info:
             returned: success
             type: string
             sample: 'cex4card'
+        domains:
+            description: The crypto adapter domains of the crypto adapter card (card IDs only).
+            returned: success
+            type: list
+            sample: [ '07.0029', '07.002a' ]
+        domain_status:
+            description: The number of crypto adapter domains per status of the crypto adapter card (card IDs only).
+            returned: success
+            type: dictionary
+            sample: { 'online': 2 }
 '''
 
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.crypto_inventory import CryptoInventory, CryptoInventoryException
 
 
 class CryptoAdapterInfoModule(object):
@@ -98,68 +144,63 @@ class CryptoAdapterInfoModule(object):
         self.module = module
         self.args = self.module.params
 
-        self.lszcrypt_cmd = self.module.get_bin_path('lszcrypt', required=True)
+        self.lszcrypt_cmd = self.module.get_bin_path('lszcrypt', required=self.args['backend'] == 'lszcrypt')
 
         self.changed = True
         self.adapter_info = {}
+        self.adapters_info = []
 
         self.process()
 
 
     def process(self):
-        adapter_device = self.args['adapter']
-        self.adapter_info = self._get_adapter_info(adapter_device)
-
-
-    def _get_adapter_info(self, target_adapter):
-        list_cmd = '{} -V'.format(self.lszcrypt_cmd)
-
-        adapter_info = {}
-        rc, out, _ = self.module.run_command(list_cmd)
-
-        if rc != 0:
-            return adapter_info
+        if self.args['adapter']:
+            adapter_devices = [self.args['adapter']]
         else:
-            out_lines = out.split("\n")
+            adapter_devices = [item['id'] if isinstance(item, dict) else item for item in self.args['adapters']]
 
-            # skip the first two lines of the 'lszcrypt' output
-            i = 2
+        inventory = self._get_inventory(adapter_devices)
 
-            while i < len(out_lines):
-                a = out_lines[i].split()
-                adapter = {
-                    'card': a[0],
-                    'type': a[1],
-                    'mode': a[2],
-                    'status': a[3],
-                    'requests': a[4],
-                    'pending': a[5],
-                    'hwtype': a[6],
-                    'qdepth': a[7],
-                    'functions': a[8],
-                    'driver': a[9]
-                }
+        if self.args['adapter']:
+            self.adapter_info = inventory.get(self.args['adapter']) or {}
+        else:
+            for adapter_device in adapter_devices:
+                adapter_info = inventory.get(adapter_device)
 
-                if adapter["card"] == target_adapter:
-                    adapter_info = adapter
-                    break
+                if adapter_info:
+                    self.adapters_info.append(adapter_info)
 
-                i = i + 1
 
-            return adapter_info
+    def _get_inventory(self, adapter_devices):
+        try:
+            return CryptoInventory.load(self.module, self.lszcrypt_cmd, self.args['backend'], self.args['sysfs_root'], adapter_devices)
+        except CryptoInventoryException:
+            return CryptoInventory({})
 
 
 def main():
     module = AnsibleModule(
         argument_spec = dict(
-            adapter = dict(type='str', required=True),
+            adapter = dict(type='str', required=False),
+            adapters = dict(type='list', elements='raw', required=False),
+            backend = dict(type='str', default='lszcrypt', choices=['lszcrypt', 'sysfs'], required=False),
+            sysfs_root = dict(type='str', default='/sys', required=False),
         ),
+        mutually_exclusive=[
+            ('adapter', 'adapters'),
+        ],
+        required_one_of=[
+            ('adapter', 'adapters'),
+        ],
         supports_check_mode=True
     )
 
     result = CryptoAdapterInfoModule(module)
 
-    module.exit_json(adapter_info=result.adapter_info, changed=result.changed)
+    if module.params['adapter']:
+        module.exit_json(adapter_info=result.adapter_info, changed=result.changed)
+    else:
+        module.exit_json(adapters_info=result.adapters_info, changed=result.changed)
 
 
 if __name__ == '__main__':
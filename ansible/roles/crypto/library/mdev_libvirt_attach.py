@@ -8,26 +8,55 @@ module: mdev_libvirt_attach
 short_description: Attach mediated devices to libvirt domains.
 description:
     - This module attaches mediated devices to libvirt domains on s390x hosts.
+    - The persistent domain definitions are updated via a single libvirt connection,
+    - mediated devices already present in a persistent domain definition are skipped.
 version_added: "1.0"
 options:
     device_index:
         description:
-            - The numeric index of the mediated device (zero-based).
-        required: true
-        default: null
+            - The numeric index of the mediated device (zero-based), used for its device alias ('ua-hostdev<index>').
+            - Only used together with 'device_uuid' and 'worker_name'.
+            - With 'assignments', the indexes of new mediated devices continue after the highest index of the
+            - device aliases present in the libvirt domain definition.
+        required: false
+        default: 0
     device_uuid:
         description:
             - The UUID of the mediated device.
-        required: true
+            - Mutually exclusive with 'assignments'.
+        required: false
         default: null
     worker_name:
         description:
             - The name of the libvirt domain to attach the mediated device to.
-        required: true
+            - Mutually exclusive with 'assignments'.
+        required: false
+        default: null
+    assignments:
+        description:
+            - A list of mediated device assignments, one per libvirt domain.
+            - Each item is a dictionary with the keys 'worker_name' (the name of the libvirt domain) and
+            - 'mdev_uuids' (the mediated device UUIDs to be attached, either as a list or as a dictionary
+            - mapping the UUIDs to crypto resources, e.g. the results of the 'mdev_uuid_gen' module).
+            - All other keys of an item are ignored.
+            - Mutually exclusive with 'device_uuid' and 'worker_name'.
+        required: false
         default: null
+    exclusive:
+        description:
+            - Whether to also detach all vfio-ap mediated devices not given for a libvirt domain.
+            - Only used together with 'assignments' (libvirt domains with no mediated devices given lose all of them).
+        required: false
+        default: false
+    uri:
+        description:
+            - The libvirt connection URI.
+        required: false
+        default: 'qemu:///system'
 notes:
     - Supports attaching multiple mediated devices to a libvirt domain although this is yet to supported by libvirt itself.
-requirements: []
+requirements:
+    - libvirt-python
 '''
 
 EXAMPLES = r'''
@@ -36,12 +65,50 @@ mdev_libvirt_attach:
   device_index: 0
   device_uuid: '34EF0DE3-AB1C-4ADC-AC6C-0741338B39EA'
   worker_name: 'ocp1-qf2b5-worker-0-456r9'
+
+# attach the mediated devices of all workers at once
+mdev_libvirt_attach:
+  assignments:
+    - worker_name: 'ocp1-qf2b5-worker-0-456r9'
+      mdev_uuids:
+        34EF0DE3-AB1C-4ADC-AC6C-0741338B39EA: '07.0029'
+    - worker_name: 'ocp1-qf2b5-worker-0-x8k2p'
+      mdev_uuids:
+        - '5D0E1A7C-3C4B-4F0A-9D0B-1E6F7A8B9C0D'
+
+# make the mediated devices of a worker match the given ones exactly
+mdev_libvirt_attach:
+  assignments:
+    - worker_name: 'ocp1-qf2b5-worker-0-456r9'
+      mdev_uuids:
+        34EF0DE3-AB1C-4ADC-AC6C-0741338B39EA: '07.0029'
+  exclusive: true
+'''
+
+RETURN = r'''
+attached_mdevs:
+    description: Dictionary containing the UUIDs of the mediated devices that have been attached, per libvirt domain.
+    returned: success
+    type: dictionary
+    sample: { 'ocp1-qf2b5-worker-0-456r9': [ '34EF0DE3-AB1C-4ADC-AC6C-0741338B39EA' ] }
+detached_mdevs:
+    description: Dictionary containing the UUIDs of the mediated devices that have been detached, per libvirt domain (exclusive mode only).
+    returned: success
+    type: dictionary
+    sample: { 'ocp1-qf2b5-worker-0-x8k2p': [ '5D0E1A7C-3C4B-4F0A-9D0B-1E6F7A8B9C0D' ] }
 '''
 
 
-import os
-import tempfile
-from ansible.module_utils.basic import AnsibleModule
+import re
+import traceback
+import xml.etree.ElementTree as ET
+from ansible.module_utils.basic import AnsibleModule, missing_required_lib
+
+LIBVIRT_IMPORT_ERROR = None
+try:
+    import libvirt
+except ImportError:
+    LIBVIRT_IMPORT_ERROR = traceback.format_exc()
 
 
 MEDIATED_DEVICE_XML_TEMPLATE = '''
@@ -49,66 +116,145 @@ MEDIATED_DEVICE_XML_TEMPLATE = '''
   <source>
     <address uuid='{}'/>
   </source>
-  <alias name='hostdev{}'/>
+  <alias name='ua-hostdev{}'/>
 </hostdev>
 '''
 
+# libvirt only keeps user-defined device aliases (prefixed with 'ua-') in persistent domain definitions
+DEVICE_ALIAS = re.compile(r'^ua-hostdev(\d+)$')
+
 
 class MdevLibvirtAttachModule(object):
     def __init__(self, module):
         self.module = module
         self.args = self.module.params
 
-        self.virsh_cmd = self.module.get_bin_path('virsh', required=True)
-
-        self.changed = True
+        self.changed = False
+        self.attached_mdevs = {}
+        self.detached_mdevs = {}
 
         self.process()
 
     def process(self):
-        device_index = self.args['device_index']
-        device_uuid = self.args['device_uuid']
-        worker_name = self.args['worker_name']
+        if self.args['assignments'] is not None:
+            assignments = self._get_assignments(self.args['assignments'])
+        else:
+            assignments = {self.args['worker_name']: [self.args['device_uuid']]}
 
-        self.mdev_uuids = self._attach_device(device_index, device_uuid, worker_name)
-
-    def _attach_device(self, device_index, device_uuid, worker_name):
-        device_xml = MEDIATED_DEVICE_XML_TEMPLATE.format(device_uuid, device_index)
-        temp_xml = None
-        rc = 0
+        conn = None
 
         try:
+            conn = libvirt.open(self.args['uri'])
+
+            for worker_name, device_uuids in assignments.items():
+                self._attach_devices(conn, worker_name, device_uuids)
+        except libvirt.libvirtError as e:
+            self.module.fail_json('Unable to attach mediated devices to workers: {}'.format(e))
+        finally:
+            if conn:
+                conn.close()
 
-            # save the XML to a temporary named file
-            temp_xml = tempfile.NamedTemporaryFile(mode='w+t', suffix='.xml', delete=False)
-            temp_xml.write(device_xml)
-            temp_xml.flush()
-            temp_xml.close()
+        self.changed = len(self.attached_mdevs) > 0 or len(self.detached_mdevs) > 0
 
-            attach_cmd = '{} attach-device --domain {} --file {} --config '.format(self.virsh_cmd, worker_name, temp_xml.name)
+    def _get_assignments(self, items):
+        assignments = {}
 
-            rc, _, _ = self.module.run_command(attach_cmd)
-        finally:
-            if temp_xml:
-                os.unlink(temp_xml.name)
+        for item in items:
+            if not isinstance(item, dict) or 'worker_name' not in item:
+                self.module.fail_json('Invalid mediated device assignment: {}'.format(item))
+
+            # mdev_uuids is either a list of UUIDs or a UUID to crypto resource mapping
+            device_uuids = list(item.get('mdev_uuids') or [])
+
+            # in exclusive mode libvirt domains without any mediated devices need to be looked at, too
+            if device_uuids or self.args['exclusive']:
+                assignments.setdefault(item['worker_name'], []).extend(device_uuids)
+
+        return assignments
+
+    def _attach_devices(self, conn, worker_name, device_uuids):
+        domain = conn.lookupByName(worker_name)
+        domain_xml = ET.fromstring(domain.XMLDesc(libvirt.VIR_DOMAIN_XML_INACTIVE))
+        devices = domain_xml.find('devices')
+
+        # mediated devices already present in the persistent domain definition are skipped
+        existing_uuids = set()
+        detached_uuids = []
+        wanted_uuids = set(u.lower() for u in device_uuids)
+
+        for hostdev in devices.findall('hostdev'):
+            if hostdev.get('type') == 'mdev':
+                address = hostdev.find('source/address')
+                if address is None or not address.get('uuid'):
+                    continue
 
-        if rc != 0:
-            self.module.fail_json('Unable to attach mediated device {} to worker {}'.format(device_uuid, worker_name))
+                # in exclusive mode vfio-ap mediated devices not given are detached
+                if self.args['exclusive'] and hostdev.get('model') == 'vfio-ap' and address.get('uuid').lower() not in wanted_uuids:
+                    devices.remove(hostdev)
+                    detached_uuids.append(address.get('uuid'))
+                    continue
+
+                existing_uuids.add(address.get('uuid').lower())
+
+        # the indexes of new device aliases continue after the highest one in use
+        # (mediated devices may have been detached from anywhere in between)
+        if self.args['assignments'] is not None:
+            device_index = 1 + max([-1] + [int(m.group(1)) for m in (DEVICE_ALIAS.match(a.get('name', '')) for a in devices.findall('*/alias')) if m])
+        else:
+            device_index = self.args['device_index']
+
+        attached_uuids = []
+        for device_uuid in device_uuids:
+            if device_uuid.lower() in existing_uuids:
+                continue
+
+            devices.append(ET.fromstring(MEDIATED_DEVICE_XML_TEMPLATE.format(device_uuid, device_index)))
+            existing_uuids.add(device_uuid.lower())
+            attached_uuids.append(device_uuid)
+            device_index += 1
+
+        if not attached_uuids and not detached_uuids:
+            return
+
+        # update the persistent domain definition once for all of its mediated devices
+        if not self.module.check_mode:
+            conn.defineXML(ET.tostring(domain_xml, encoding='unicode'))
+
+        if attached_uuids:
+            self.attached_mdevs[worker_name] = attached_uuids
+        if detached_uuids:
+            self.detached_mdevs[worker_name] = detached_uuids
 
 
 def main():
     module = AnsibleModule(
         argument_spec = dict(
-            device_index = dict(type='int', required=True),
-            device_uuid = dict(type='str', required=True),
-            worker_name = dict(type='str', required=True),
+            device_index = dict(type='int', default=0, required=False),
+            device_uuid = dict(type='str', required=False),
+            worker_name = dict(type='str', required=False),
+            assignments = dict(type='list', elements='dict', required=False),
+            exclusive = dict(type='bool', default=False, required=False),
+            uri = dict(type='str', default='qemu:///system', required=False),
         ),
+        mutually_exclusive=[
+            ('assignments', 'device_uuid'),
+            ('assignments', 'worker_name'),
+        ],
+        required_one_of=[
+            ('assignments', 'device_uuid'),
+        ],
+        required_together=[
+            ('device_uuid', 'worker_name'),
+        ],
         supports_check_mode=True
     )
 
+    if LIBVIRT_IMPORT_ERROR:
+        module.fail_json(msg=missing_required_lib('libvirt-python'), exception=LIBVIRT_IMPORT_ERROR)
+
     result = MdevLibvirtAttachModule(module)
 
-    module.exit_json(changed=result.changed)
+    module.exit_json(changed=result.changed, attached_mdevs=result.attached_mdevs, detached_mdevs=result.detached_mdevs)
 
 
 if __name__ == '__main__':
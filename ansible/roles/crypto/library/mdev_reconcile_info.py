@@ -0,0 +1,188 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+DOCUMENTATION = r'''
+---
+module: mdev_reconcile_info
+short_description: Determine the libvirt domains affected by mediated device changes.
+description:
+    - This module compares the planned mediated devices of libvirt domains on s390x hosts
+    - with the mediated devices recorded in the persistent and live domain definitions
+    - and the mediated devices present in the vfio_ap matrix.
+    - It determines which libvirt domains need to be cycled to match the plan.
+version_added: "1.0"
+options:
+    mdev_plan:
+        description:
+            - The mediated device plan as returned by the 'mdev_uuid_gen' module in planning mode.
+            - Each item is a dictionary with the keys 'worker_name', 'mdev_uuids' and (optionally) 'changed'.
+        required: true
+        default: null
+    uri:
+        description:
+            - The libvirt connection URI.
+        required: false
+        default: 'qemu:///system'
+    sysfs_root:
+        description:
+            - The mount point of sysfs.
+        required: false
+        default: '/sys'
+notes: []
+requirements:
+    - libvirt-python
+'''
+
+EXAMPLES = r'''
+# determine the libvirt domains affected by mediated device changes
+mdev_reconcile_info:
+  mdev_plan: '{{ mdev_uuid_gen_result.mdev_plan }}'
+'''
+
+RETURN = r'''
+affected_workers:
+    description: The names of the libvirt domains that need to be cycled.
+    returned: success
+    type: list
+    sample: [ 'ocp1-qf2b5-worker-0-456r9' ]
+workers:
+    description: List containing the reconciliation details for each libvirt domain in the plan.
+    returned: success
+    type: list
+    elements: dictionary
+    contains:
+        worker_name:
+            description: The name of the libvirt domain.
+            returned: success
+            type: string
+            sample: 'ocp1-qf2b5-worker-0-456r9'
+        active:
+            description: Whether the libvirt domain is running.
+            returned: success
+            type: bool
+            sample: true
+        affected:
+            description: Whether the libvirt domain needs to be cycled.
+            returned: success
+            type: bool
+            sample: true
+        reasons:
+            description:
+                - Why the libvirt domain needs to be cycled
+                - ('config' - the plan differs from the persisted mediated device configuration,
+                - 'definition' - the plan differs from the persistent domain definition,
+                - 'live' - the plan differs from the live domain definition,
+                - 'matrix' - planned mediated devices are missing from the vfio_ap matrix).
+            returned: success
+            type: list
+            sample: [ 'definition' ]
+'''
+
+
+import os
+import traceback
+import xml.etree.ElementTree as ET
+from ansible.module_utils.basic import AnsibleModule, missing_required_lib
+
+LIBVIRT_IMPORT_ERROR = None
+try:
+    import libvirt
+except ImportError:
+    LIBVIRT_IMPORT_ERROR = traceback.format_exc()
+
+
+SYS_DEVICES_VFIOAP_MATRIX = 'devices/vfio_ap/matrix'
+
+
+class MdevReconcileInfoModule(object):
+    def __init__(self, module):
+        self.module = module
+        self.args = self.module.params
+
+        self.changed = False
+        self.workers = []
+        self.affected_workers = []
+
+        self.process()
+
+    def process(self):
+        conn = None
+
+        try:
+            conn = libvirt.openReadOnly(self.args['uri'])
+
+            for item in self.args['mdev_plan']:
+                self.workers.append(self._get_worker_details(conn, item))
+        except libvirt.libvirtError as e:
+            self.module.fail_json('Unable to determine mediated devices of workers: {}'.format(e))
+        finally:
+            if conn:
+                conn.close()
+
+        self.affected_workers = [w['worker_name'] for w in self.workers if w['affected']]
+
+    def _get_worker_details(self, conn, item):
+        worker_name = item['worker_name']
+        planned_uuids = set(u.lower() for u in (item.get('mdev_uuids') or []))
+
+        domain = conn.lookupByName(worker_name)
+        active = domain.isActive() == 1
+
+        reasons = []
+
+        if item.get('changed', False):
+            reasons.append('config')
+
+        if self._get_domain_mdev_uuids(domain.XMLDesc(libvirt.VIR_DOMAIN_XML_INACTIVE)) != planned_uuids:
+            reasons.append('definition')
+
+        if active:
+            live_uuids = self._get_domain_mdev_uuids(domain.XMLDesc(0))
+
+            if live_uuids != planned_uuids:
+                reasons.append('live')
+
+            matrix_dir = os.path.join(self.args['sysfs_root'], SYS_DEVICES_VFIOAP_MATRIX)
+            if any(not os.path.exists(os.path.join(matrix_dir, u)) for u in live_uuids & planned_uuids):
+                reasons.append('matrix')
+
+        return {
+            'worker_name': worker_name,
+            'active': active,
+            'affected': len(reasons) > 0,
+            'reasons': reasons,
+        }
+
+    def _get_domain_mdev_uuids(self, domain_xml):
+        mdev_uuids = set()
+
+        for hostdev in ET.fromstring(domain_xml).findall('devices/hostdev'):
+            if hostdev.get('type') == 'mdev' and hostdev.get('model') == 'vfio-ap':
+                address = hostdev.find('source/address')
+                if address is not None and address.get('uuid'):
+                    mdev_uuids.add(address.get('uuid').lower())
+
+        return mdev_uuids
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec = dict(
+            mdev_plan = dict(type='list', elements='dict', required=True),
+            uri = dict(type='str', default='qemu:///system', required=False),
+            sysfs_root = dict(type='str', default='/sys', required=False),
+        ),
+        supports_check_mode=True
+    )
+
+    if LIBVIRT_IMPORT_ERROR:
+        module.fail_json(msg=missing_required_lib('libvirt-python'), exception=LIBVIRT_IMPORT_ERROR)
+
+    result = MdevReconcileInfoModule(module)
+
+    module.exit_json(affected_workers=result.affected_workers, workers=result.workers, changed=result.changed)
+
+
+if __name__ == '__main__':
+    main()
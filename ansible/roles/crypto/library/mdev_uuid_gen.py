@@ -8,18 +8,43 @@ module: mdev_uuid_gen
 short_description: Generates UUIDs to be used by mediated devices.
 description:
     - This module generates UUIDs to be used by mediated devices on s390x hosts.
+    - Either for a single libvirt domain (random UUIDs) or for all given libvirt domains at once (planning mode).
+    - In planning mode the UUIDs are stable across runs and the resulting plan is compared
+    - against the mediated device configuration files persisted by previous runs.
+    - Crypto resources assigned to a worker index without a corresponding libvirt domain are skipped (with a warning).
 version_added: "1.0"
 options:
     worker_index:
         description:
             - The numeric index of the libvirt domain (zero-based).
-        required: true
+            - Mutually exclusive with 'worker_domains'.
+        required: false
+        default: null
+    worker_domains:
+        description:
+            - The names of all worker libvirt domains, in the order the 'assign_to_worker' indexes refer to.
+            - Enables planning mode.
+            - Mutually exclusive with 'worker_index'.
+        required: false
         default: null
     resource_assignments:
         description:
             - The crypto resource assignment matrix.
         required: true
         default: null
+    cluster_id:
+        description:
+            - The ID of the OpenShift cluster the workers belong to.
+            - Used to derive stable (name-based) UUIDs in planning mode.
+            - Required in planning mode.
+        required: false
+        default: null
+    config_dir:
+        description:
+            - The directory containing the persisted mediated device configuration files (crypto_mdevs_<worker>.yaml).
+            - UUIDs already recorded for a worker and crypto resource are kept in planning mode.
+        required: false
+        default: null
 notes: []
 requirements: []
 '''
@@ -27,7 +52,7 @@ requirements: []
 RETURN = r'''
 mdev_uuids:
     description: Dictionary containing the mediated device UUIDs.
-    returned: success
+    returned: success and 'worker_index' was given
     type: dictionary
     contains:
         <uuid>:
@@ -35,6 +60,42 @@ mdev_uuids:
             returned: success
             type: string
             sample: '34EF0DE3-AB1C-4ADC-AC6C-0741338B39EA:07.0029'
+mdev_plan:
+    description: List containing the mediated device plan for each worker.
+    returned: success and 'worker_domains' was given
+    type: list
+    elements: dictionary
+    contains:
+        worker_name:
+            description: The name of the worker libvirt domain.
+            returned: success
+            type: string
+            sample: 'ocp1-qf2b5-worker-0-456r9'
+        worker_index:
+            description: The numeric index of the worker libvirt domain.
+            returned: success
+            type: int
+            sample: 0
+        mdev_uuids:
+            description: Dictionary containing the mediated device UUIDs (keys) and the corresponding crypto resources (values).
+            returned: success
+            type: dictionary
+            sample: { '34ef0de3-ab1c-4adc-ac6c-0741338b39ea': '07.0029' }
+        changed:
+            description: Whether the plan differs from the persisted mediated device configuration of the worker.
+            returned: success
+            type: bool
+            sample: false
+        added:
+            description: The mediated devices not yet present in the persisted configuration of the worker.
+            returned: success
+            type: dictionary
+            sample: {}
+        removed:
+            description: The mediated devices present in the persisted configuration of the worker but no longer planned.
+            returned: success
+            type: dictionary
+            sample: {}
 '''
 
 EXAMPLES = r'''
@@ -48,13 +109,33 @@ mdev_uuid_gen:
       assign_to_worker: 1
     - id: '07.002b'
       assign_to_worker: 2
+
+# plan all workers at once
+mdev_uuid_gen:
+  worker_domains:
+    - 'ocp1-qf2b5-worker-0-456r9'
+    - 'ocp1-qf2b5-worker-0-x8k2p'
+  cluster_id: 'ocp1-qf2b5'
+  config_dir: '/root/ocp4-workdir'
+  resource_assignments:
+    - id: '07.0029'
+      assign_to_worker: 0
+    - id: '07.002a'
+      assign_to_worker: 1
 '''
 
 
+import os
 import uuid
 from ansible.module_utils.basic import AnsibleModule
 
 
+# namespace for deriving name-based mediated device UUIDs (uuid5)
+MDEV_UUID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, 'https://github.com/ibm-s390-cloud/ocp-kvm-ipi-automation/crypto-mdevs')
+
+DOMAIN_MDEV_CONFIG_FILE_TEMPLATE = '{}/crypto_mdevs_{}.yaml'
+
+
 class MdevUuidGenModule(object):
     def __init__(self, module):
         self.module = module
@@ -62,14 +143,18 @@ class MdevUuidGenModule(object):
 
         self.changed = True
         self.mdev_uuids = []
+        self.mdev_plan = []
 
         self.process()
 
     def process(self):
-        worker_index = self.args['worker_index']
         resource_assignments = self.args['resource_assignments']
 
-        self.mdev_uuids = self._generate_mdev_uuids(worker_index, resource_assignments)
+        if self.args['worker_domains'] is not None:
+            self.mdev_plan = self._plan_mdev_uuids(self.args['worker_domains'], resource_assignments)
+            self.changed = any(p['changed'] for p in self.mdev_plan)
+        else:
+            self.mdev_uuids = self._generate_mdev_uuids(self.args['worker_index'], resource_assignments)
 
     def _generate_mdev_uuids(self, worker_index, resource_assignments):
         uuid_resource_mapping = {}
@@ -93,19 +178,95 @@ class MdevUuidGenModule(object):
 
         return uuid_resource_mapping
 
+    def _plan_mdev_uuids(self, worker_domains, resource_assignments):
+        cluster_id = self.args['cluster_id']
+
+        # group the crypto resources by worker in a single pass
+        resources_by_worker = {}
+        for a in resource_assignments:
+            worker_index = int(a['assign_to_worker'])
+
+            if not 0 <= worker_index < len(worker_domains):
+
+                # skip all items not assigned to any of the given workers (same as when generating UUIDs for a single worker)
+                self.module.warn('Crypto resource {} is assigned to unknown worker {}, skipping'.format(a['id'], worker_index))
+                continue
+
+            resources_by_worker.setdefault(worker_index, []).append(a['id'])
+
+        plan = []
+        for worker_index, worker_name in enumerate(worker_domains):
+            recorded_mdev_uuids = self._load_recorded_mdev_uuids(worker_name)
+            recorded_uuids_by_resource = {v: k for k, v in recorded_mdev_uuids.items()}
+
+            mdev_uuids = {}
+            for resource in resources_by_worker.get(worker_index, []):
+
+                # keep a UUID already recorded for the worker and crypto resource, derive a stable one otherwise
+                resource_uuid = recorded_uuids_by_resource.get(resource)
+                if not resource_uuid:
+                    resource_uuid = str(uuid.uuid5(MDEV_UUID_NAMESPACE, '{}/{}/{}'.format(cluster_id, worker_name, resource)))
+
+                mdev_uuids[resource_uuid] = resource
+
+            added = {k: v for k, v in mdev_uuids.items() if recorded_mdev_uuids.get(k) != v}
+            removed = {k: v for k, v in recorded_mdev_uuids.items() if mdev_uuids.get(k) != v}
+
+            plan.append({
+                'worker_name': worker_name,
+                'worker_index': worker_index,
+                'mdev_uuids': mdev_uuids,
+                'changed': bool(added or removed),
+                'added': added,
+                'removed': removed,
+            })
+
+        return plan
+
+    def _load_recorded_mdev_uuids(self, worker_name):
+        if not self.args['config_dir']:
+            return {}
+
+        config_file = DOMAIN_MDEV_CONFIG_FILE_TEMPLATE.format(self.args['config_dir'], worker_name)
+        if not os.path.isfile(config_file):
+            return {}
+
+        try:
+            import yaml
+
+            with open(config_file, 'r') as f:
+                return yaml.load(f, Loader=yaml.SafeLoader) or {}
+        except Exception as e:
+            self.module.fail_json('Unable to read mediated device configuration {}: {}'.format(config_file, e))
+
 
 def main():
     module = AnsibleModule(
         argument_spec = dict(
-            worker_index = dict(type='int', required=True),
+            worker_index = dict(type='int', required=False),
+            worker_domains = dict(type='list', elements='str', required=False),
             resource_assignments = dict(type='list', required=True),
+            cluster_id = dict(type='str', required=False),
+            config_dir = dict(type='path', required=False),
         ),
+        mutually_exclusive=[
+            ('worker_index', 'worker_domains'),
+        ],
+        required_one_of=[
+            ('worker_index', 'worker_domains'),
+        ],
+        required_by={
+            'worker_domains': 'cluster_id',
+        },
         supports_check_mode=True
     )
 
     result = MdevUuidGenModule(module)
 
-    module.exit_json(mdev_uuids=result.mdev_uuids, changed=result.changed)
+    if module.params['worker_domains'] is not None:
+        module.exit_json(mdev_plan=result.mdev_plan, changed=result.changed)
+    else:
+        module.exit_json(mdev_uuids=result.mdev_uuids, changed=result.changed)
 
 
 if __name__ == '__main__':
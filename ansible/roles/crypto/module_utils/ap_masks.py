@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+# Management of the AP bus adapter and usage domain masks (apmask / aqmask).
+#
+# Crypto adapters and domains whose bits are set in both masks are available
+# to the default (zcrypt) device drivers, crypto adapters or domains whose bits
+# are cleared are reserved for other device drivers (e.g. vfio_ap).
+#
+# Instead of writing relative changes ('+N' / '-N') one bit at a time, the
+# desired masks for all requested changes are computed upfront and written as
+# absolute bitmaps (at most one write per mask) which are then read back to
+# verify the result.
+#
+# Since absolute writes would silently revert concurrent changes made by others,
+# reading, writing and reading back the masks is serialized host-wide via an
+# exclusive lock on a lock file (shared by the crypto modules and the libvirt
+# 'qemu' hook).
+#
+# This file is used by the modules of the crypto role as well as by the libvirt
+# 'qemu' hook installed on the KVM host and therefore must not depend on anything
+# but the Python standard library.
+
+
+import fcntl
+import os
+
+
+AP_MASK_BITS = 256
+
+# the lock file serializing all changes to the AP bus masks (and the vfio_ap matrix) on the host
+AP_BUS_LOCK_FILE = '/run/lock/libvirt-hook-qemu-vfio-ap.lock'
+
+SYS_BUS_AP_APMASK = 'bus/ap/apmask'
+SYS_BUS_AP_AQMASK = 'bus/ap/aqmask'
+
+
+class ApMaskException(Exception):
+    def __init__(self, message='Unable to update the AP bus masks'):
+        self.message = message
+        super().__init__(self.message)
+
+
+def parse_mask(value):
+
+    # the masks are left-aligned: the leftmost bit denotes adapter / domain 0
+    digits = value.strip().lower()
+    if digits.startswith('0x'):
+        digits = digits[2:]
+
+    try:
+        return int(digits.ljust(AP_MASK_BITS // 4, '0')[:AP_MASK_BITS // 4], 16)
+    except ValueError:
+        raise ApMaskException('Invalid AP bus mask: {}'.format(value))
+
+
+def format_mask(mask):
+    return '0x{:0{}x}'.format(mask, AP_MASK_BITS // 4)
+
+
+def mask_bit(index):
+    if not 0 <= index < AP_MASK_BITS:
+        raise ApMaskException('Invalid AP bus mask index: {}'.format(index))
+
+    return 1 << (AP_MASK_BITS - 1 - index)
+
+
+def apply_mask_changes(apmask, aqmask, changes):
+
+    # changes is a list of (crypto resource, bitmode) tuples, e.g. ('07.0029', '-');
+    # they're applied in order, so the outcome is the same as writing them one after another
+    for crypto_resource, bitmode in changes:
+        try:
+            card, domain = [int(x, 16) for x in crypto_resource.split('.')]
+        except ValueError:
+            raise ApMaskException('Invalid crypto resource: {}'.format(crypto_resource))
+
+        if bitmode == '+':
+            apmask |= mask_bit(card)
+            aqmask |= mask_bit(domain)
+        elif bitmode == '-':
+            apmask &= ~mask_bit(card)
+            aqmask &= ~mask_bit(domain)
+        else:
+            raise ApMaskException('Invalid AP bus mask bitmode: {}'.format(bitmode))
+
+    return apmask, aqmask
+
+
+class ApBusLock(object):
+
+    # the lock files held by this process (location -> [lock file, nesting depth]);
+    # the lock is re-entrant within a process, so callers holding it can still use ApMasks
+    _held = {}
+
+    def __init__(self, location=AP_BUS_LOCK_FILE):
+        self.location = location
+
+    def __enter__(self):
+        held = ApBusLock._held.get(self.location)
+        if held:
+            held[1] += 1
+            return self
+
+        try:
+            lock_file = open(self.location, 'a')
+        except OSError as e:
+            raise ApMaskException('Unable to open AP bus lock file {}: {}'.format(self.location, e))
+
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        ApBusLock._held[self.location] = [lock_file, 1]
+        return self
+
+    def __exit__(self, *args):
+        held = ApBusLock._held[self.location]
+        held[1] -= 1
+
+        if held[1] == 0:
+            del ApBusLock._held[self.location]
+            fcntl.flock(held[0], fcntl.LOCK_UN)
+            held[0].close()
+
+
+class ApMasks(object):
+    def __init__(self, sysfs_root='/sys', lock_file=AP_BUS_LOCK_FILE):
+        self.apmask_file = os.path.join(sysfs_root, SYS_BUS_AP_APMASK)
+        self.aqmask_file = os.path.join(sysfs_root, SYS_BUS_AP_AQMASK)
+        self.lock_file = lock_file
+
+    def read(self):
+        return self._read_mask(self.apmask_file), self._read_mask(self.aqmask_file)
+
+    def plan(self, changes):
+        current = self.read()
+        desired = apply_mask_changes(current[0], current[1], changes)
+
+        return current, desired
+
+    def update(self, changes):
+        with ApBusLock(self.lock_file):
+            current, desired = self.plan(changes)
+
+            if current == desired:
+                return False
+
+            # only write the masks that actually need to change
+            if current[0] != desired[0]:
+                self._write_mask(self.apmask_file, desired[0])
+            if current[1] != desired[1]:
+                self._write_mask(self.aqmask_file, desired[1])
+
+            if self.read() != desired:
+                raise ApMaskException('AP bus masks do not match after update: {}, {}'.format(format_mask(desired[0]), format_mask(desired[1])))
+
+        return True
+
+    def _read_mask(self, mask_file):
+        try:
+            with open(mask_file, 'r') as f:
+                return parse_mask(f.read())
+        except OSError as e:
+            raise ApMaskException('Unable to read AP bus mask {}: {}'.format(mask_file, e))
+
+    def _write_mask(self, mask_file, mask):
+        try:
+            with open(mask_file, 'w') as f:
+                f.write(format_mask(mask))
+        except OSError as e:
+            raise ApMaskException('Unable to write AP bus mask {}: {}'.format(mask_file, e))
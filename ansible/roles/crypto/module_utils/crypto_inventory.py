@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+
+# Shared crypto adapter inventory used by the modules of the crypto role.
+#
+# The inventory is built from a single snapshot of the AP bus and indexes all
+# crypto adapter cards (e.g. '07') and crypto adapter domains (e.g. '07.0029')
+# by their ID. Card entries additionally carry a rollup of their domains.
+#
+# The snapshot is either taken from the output of 'lszcrypt -V' or read directly
+# from the AP bus device attributes in sysfs (no process spawns). The sysfs root
+# is configurable so that the sysfs backend can be pointed at any directory tree.
+#
+# This file must not depend on anything but the Python standard library.
+
+
+import os
+
+
+LSZCRYPT_FIELDS = ['card', 'type', 'mode', 'status', 'requests', 'pending', 'hwtype', 'qdepth', 'functions', 'driver']
+
+INVENTORY_BACKENDS = ['lszcrypt', 'sysfs']
+
+SYS_BUS_AP_DEVICES = 'bus/ap/devices'
+
+# AP function bits (as exposed via the 'ap_functions' sysfs attribute)
+# used to derive the mode of operation of a crypto adapter (same as lszcrypt)
+AP_FUNCTIONS_MODES = [
+    (0x04000000, 'EP11-Coproc'),
+    (0x08000000, 'Accelerator'),
+    (0x10000000, 'CCA-Coproc'),
+]
+
+
+class CryptoInventoryException(Exception):
+    def __init__(self, message='Unable to determine crypto adapter information'):
+        self.message = message
+        super().__init__(self.message)
+
+
+class CryptoInventory(object):
+    def __init__(self, adapters):
+        self.adapters = adapters
+        self._add_card_rollups()
+
+    @classmethod
+    def from_lszcrypt_output(cls, output):
+        adapters = {}
+
+        for line in output.split('\n'):
+            a = line.split()
+
+            # skip empty lines as well as the header lines of the 'lszcrypt' output
+            # (the first column is labeled 'CARD.DOMAIN' or 'CARD.DOM', depending on the s390-tools version)
+            if not a or a[0].startswith('CARD.') or a[0].startswith('-'):
+                continue
+
+            adapter = dict.fromkeys(LSZCRYPT_FIELDS, '')
+            adapter.update(zip(LSZCRYPT_FIELDS, a))
+
+            adapters[adapter['card']] = adapter
+
+        return cls(adapters)
+
+    @classmethod
+    def from_lszcrypt(cls, module, lszcrypt_cmd):
+        rc, out, err = module.run_command('{} -V'.format(lszcrypt_cmd))
+
+        if rc != 0:
+            raise CryptoInventoryException('Unable to run lszcrypt: {}, {}'.format(rc, err))
+
+        return cls.from_lszcrypt_output(out)
+
+    @classmethod
+    def from_sysfs(cls, sysfs_root='/sys'):
+        devices_dir = os.path.join(sysfs_root, SYS_BUS_AP_DEVICES)
+        adapters = {}
+
+        try:
+            device_names = os.listdir(devices_dir)
+        except OSError:
+            raise CryptoInventoryException('Unable to read AP bus devices: {}'.format(devices_dir))
+
+        cards = {}
+        for name in device_names:
+            if name.startswith('card'):
+                card_id = name[4:]
+                cards[card_id] = _read_sysfs_card(os.path.join(devices_dir, name), card_id)
+                adapters[card_id] = cards[card_id]
+
+        for name in device_names:
+            if '.' not in name:
+                continue
+
+            card = cards.get(name.split('.')[0])
+            if card is None:
+                raise CryptoInventoryException('Unable to read AP bus device: {} (missing card)'.format(name))
+
+            adapters[name] = _read_sysfs_queue(os.path.join(devices_dir, name), name, card)
+
+        return cls(adapters)
+
+    @classmethod
+    def load(cls, module, lszcrypt_cmd=None, backend='lszcrypt', sysfs_root='/sys', required_adapters=None):
+
+        # the sysfs backend falls back to lszcrypt if the AP bus device attributes
+        # in sysfs are incomplete or do not cover all of the required crypto adapters
+        if backend == 'sysfs':
+            try:
+                inventory = cls.from_sysfs(sysfs_root)
+
+                if all(a in inventory for a in (required_adapters or [])):
+                    return inventory
+            except CryptoInventoryException:
+                pass
+
+        if not lszcrypt_cmd:
+            raise CryptoInventoryException('Unable to run lszcrypt: command not found')
+
+        return cls.from_lszcrypt(module, lszcrypt_cmd)
+
+    def _add_card_rollups(self):
+        for card_id in self.cards():
+            self.adapters[card_id].update({
+                'domains': [],
+                'domain_status': {},
+            })
+
+        for domain_id in sorted(a for a in self.adapters if '.' in a):
+            card = self.adapters.get(domain_id.split('.')[0])
+
+            # domains may be listed without their card (e.g. when filtered by lszcrypt)
+            if card is None:
+                continue
+
+            status = self.adapters[domain_id]['status']
+            card['domains'].append(domain_id)
+            card['domain_status'][status] = card['domain_status'].get(status, 0) + 1
+
+    def cards(self):
+        return sorted(a for a in self.adapters if '.' not in a)
+
+    def domains(self, card_id=None):
+        if card_id is not None:
+            return list(self.adapters.get(card_id, {}).get('domains', []))
+
+        return sorted(a for a in self.adapters if '.' in a)
+
+    def get(self, adapter_id):
+        return self.adapters.get(adapter_id)
+
+    def get_detail(self, adapter_id, detail):
+        adapter = self.adapters.get(adapter_id)
+
+        if not adapter or not adapter.get(detail):
+            raise CryptoInventoryException('Unable to determine crypto adapter detail: {}'.format(adapter_id))
+
+        return adapter[detail]
+
+    def __contains__(self, adapter_id):
+        return adapter_id in self.adapters
+
+
+def _read_sysfs_attribute(device_dir, attribute, required=True):
+    try:
+        with open(os.path.join(device_dir, attribute), 'r') as f:
+            return f.read().strip()
+    except OSError:
+        if required:
+            raise CryptoInventoryException('Unable to read AP bus device attribute: {}/{}'.format(device_dir, attribute))
+        return None
+
+
+def _read_sysfs_driver(device_dir):
+    driver_link = os.path.join(device_dir, 'driver')
+
+    if not os.path.islink(driver_link):
+        return '-no-driver-'
+
+    return os.path.basename(os.readlink(driver_link))
+
+
+def _read_sysfs_status(device_dir, card_config='1'):
+
+    # older kernels only provide the 'config' attribute for cards, not for queues
+    config = _read_sysfs_attribute(device_dir, 'config', required=False)
+
+    if card_config == '0' or config == '0':
+        return 'deconfig'
+
+    if _read_sysfs_attribute(device_dir, 'online') == '1':
+        return 'online'
+
+    return 'offline'
+
+
+def _read_sysfs_pending(device_dir):
+    requestq_count = _read_sysfs_attribute(device_dir, 'requestq_count')
+    pendingq_count = _read_sysfs_attribute(device_dir, 'pendingq_count')
+
+    try:
+        return str(int(requestq_count) + int(pendingq_count))
+    except ValueError:
+        raise CryptoInventoryException('Unable to read AP bus device pending requests: {}'.format(device_dir))
+
+
+def _read_sysfs_card(device_dir, card_id):
+    functions = _read_sysfs_attribute(device_dir, 'ap_functions')
+
+    try:
+        function_bits = int(functions, 16)
+    except ValueError:
+        raise CryptoInventoryException('Unable to read AP bus device functions: {}'.format(device_dir))
+
+    mode = next((m for mask, m in AP_FUNCTIONS_MODES if function_bits & mask), 'Unknown')
+
+    return {
+        'card': card_id,
+        'type': _read_sysfs_attribute(device_dir, 'type'),
+        'mode': mode,
+        'status': _read_sysfs_status(device_dir),
+        'requests': _read_sysfs_attribute(device_dir, 'request_count'),
+        'pending': _read_sysfs_pending(device_dir),
+        'hwtype': _read_sysfs_attribute(device_dir, 'hwtype'),
+        'qdepth': _read_sysfs_attribute(device_dir, 'depth'),
+        'functions': functions,
+        'driver': _read_sysfs_driver(device_dir),
+    }
+
+
+def _read_sysfs_queue(device_dir, queue_id, card):
+    card_config = _read_sysfs_attribute(os.path.join(os.path.dirname(device_dir), 'card' + card['card']), 'config', required=False)
+
+    return {
+        'card': queue_id,
+        'type': card['type'],
+        'mode': card['mode'],
+        'status': _read_sysfs_status(device_dir, card_config),
+        'requests': _read_sysfs_attribute(device_dir, 'request_count'),
+        'pending': _read_sysfs_pending(device_dir),
+        'hwtype': card['hwtype'],
+        'qdepth': card['qdepth'],
+        'functions': card['functions'],
+        'driver': _read_sysfs_driver(device_dir),
+    }
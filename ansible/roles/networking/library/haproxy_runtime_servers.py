@@ -0,0 +1,314 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+DOCUMENTATION = r'''
+---
+module: haproxy_runtime_servers
+short_description: Apply the backend servers of a haproxy configuration file to a running haproxy via its runtime API.
+description:
+    - This module compares the servers of the backends configured in a (validated) haproxy configuration file
+    - with the servers of the running haproxy and applies the differences via the haproxy runtime API,
+    - so existing connections survive.
+    - Changed server addresses are updated in place, added servers are added dynamically (haproxy 2.4 or later)
+    - and removed servers are put into maintenance mode, drained and deleted.
+    - If the differences can't be applied via the runtime API (e.g. added or removed backends, an older haproxy version
+    - or an unreachable runtime API), the module reports that a (graceful) reload is required instead.
+version_added: "1.0"
+options:
+    config:
+        description:
+            - The location of the haproxy configuration file.
+        required: false
+        default: '/etc/haproxy/haproxy.cfg'
+    backends:
+        description:
+            - The names of the backends to be considered.
+        required: true
+        default: null
+    socket:
+        description:
+            - The location of the haproxy runtime API socket (requires level 'admin').
+        required: true
+        default: null
+    drain_timeout:
+        description:
+            - The maximum time (in seconds) to wait for the connections of removed servers to be closed.
+            - Removed servers that still have connections after that are kept in maintenance mode (they're gone after the next reload).
+        required: false
+        default: 30
+notes: []
+requirements: []
+'''
+
+EXAMPLES = r'''
+# apply the backend servers of the OpenShift ingress backends
+haproxy_runtime_servers:
+  backends:
+    - 'ocp1-https'
+    - 'ocp1-http'
+  socket: '/var/lib/haproxy/ocp-kvm-ipi.sock'
+'''
+
+RETURN = r'''
+reload_required:
+    description: Whether the differences couldn't be applied via the runtime API (so haproxy needs to be reloaded).
+    returned: success
+    type: bool
+    sample: false
+reason:
+    description: The reason why haproxy needs to be reloaded.
+    returned: success
+    type: string
+    sample: 'haproxy 1.8.27 does not support adding servers at runtime'
+added:
+    description: The servers added at runtime (as 'backend/server').
+    returned: success
+    type: list
+    sample: [ 'ocp1-https/ocp1-qf2b5-worker-0-456r9' ]
+updated:
+    description: The servers whose address has been updated at runtime.
+    returned: success
+    type: list
+    sample: []
+removed:
+    description: The servers removed (or put into maintenance mode if they still had connections) at runtime.
+    returned: success
+    type: list
+    sample: []
+'''
+
+
+import socket
+import time
+from ansible.module_utils.basic import AnsibleModule
+
+
+# the minimum haproxy version supporting the 'add server' and 'del server' runtime API commands
+DYNAMIC_SERVERS_VERSION = (2, 4)
+
+# the interval (in seconds) the connections of removed servers are checked at
+DRAIN_POLL_INTERVAL = 1
+
+RUNTIME_API_SUCCESS_MESSAGES = ['New server registered', 'Server deleted', 'IP changed', 'port changed', 'no need to change']
+
+
+class HaproxyRuntimeException(Exception):
+    def __init__(self, message='haproxy runtime API command failed'):
+        self.message = message
+        super().__init__(self.message)
+
+
+class HaproxyRuntimeServersModule(object):
+    def __init__(self, module):
+        self.module = module
+        self.args = self.module.params
+
+        self.changed = False
+        self.reload_required = False
+        self.reason = ''
+        self.added = []
+        self.updated = []
+        self.removed = []
+
+        self.version = None
+
+        self.process()
+
+    def process(self):
+        configured = self._read_config()
+
+        try:
+            self.version = self._get_version()
+            running = dict((b, self._get_servers(b)) for b in self.args['backends'])
+        except (HaproxyRuntimeException, OSError) as e:
+            self._require_reload('runtime API not available: {}'.format(e))
+            return
+
+        to_add, to_update, to_remove = [], [], []
+
+        for b in self.args['backends']:
+            if b not in configured or running[b] is None:
+                self._require_reload('backend {} added or removed'.format(b))
+                return
+
+            for name, server in configured[b].items():
+                if name not in running[b]:
+                    to_add.append((b, name, server))
+                elif (server['address'], server['port']) != (running[b][name]['address'], running[b][name]['port']):
+                    to_update.append((b, name, server))
+
+            to_remove.extend((b, name) for name in running[b] if name not in configured[b])
+
+        if (to_add or to_remove) and self.version < DYNAMIC_SERVERS_VERSION:
+            self._require_reload('haproxy {} does not support adding or removing servers at runtime'.format('.'.join(str(v) for v in self.version)))
+            return
+
+        if not (to_add or to_update or to_remove):
+            return
+
+        self.changed = True
+        if self.module.check_mode:
+            self.added = ['{}/{}'.format(b, n) for b, n, _ in to_add]
+            self.updated = ['{}/{}'.format(b, n) for b, n, _ in to_update]
+            self.removed = ['{}/{}'.format(b, n) for b, n in to_remove]
+            return
+
+        try:
+            for b, name, server in to_update:
+                self._command('set server {}/{} addr {} port {}'.format(b, name, server['address'], server['port']))
+                self.updated.append('{}/{}'.format(b, name))
+
+            # new servers are added in maintenance mode, they're enabled once they're fully set up
+            for b, name, server in to_add:
+                self._command('{}add server {}/{} {}:{} {}'.format(self._experimental(), b, name, server['address'], server['port'], server['params']).rstrip())
+                if 'check' in server['params'].split():
+                    self._command('enable health {}/{}'.format(b, name))
+                self._command('enable server {}/{}'.format(b, name))
+                self.added.append('{}/{}'.format(b, name))
+
+            # removed servers don't get any new connections, existing connections are given some time to be closed
+            for b, name in to_remove:
+                self._command('disable server {}/{}'.format(b, name))
+            self._drain(to_remove)
+        except (HaproxyRuntimeException, OSError) as e:
+            self._require_reload('runtime API command failed: {}'.format(e))
+
+    def _require_reload(self, reason):
+        self.reload_required = True
+        self.reason = reason
+
+    def _read_config(self):
+        backends = {}
+        current = None
+
+        try:
+            with open(self.args['config'], 'r') as f:
+                for line in f:
+                    words = line.split('#', 1)[0].split()
+                    if not words:
+                        continue
+
+                    # any non-indented keyword starts a new section
+                    if not line[0].isspace():
+                        current = words[1] if words[0] == 'backend' and len(words) > 1 else None
+                        if current:
+                            backends[current] = {}
+                    elif current and words[0] == 'server' and len(words) >= 3:
+                        address, _, port = words[2].rpartition(':')
+                        backends[current][words[1]] = {'address': address, 'port': port, 'params': ' '.join(words[3:])}
+        except OSError as e:
+            self.module.fail_json('Unable to read haproxy configuration file {}: {}'.format(self.args['config'], e))
+
+        return backends
+
+    def _command(self, command):
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            s.settimeout(10)
+            s.connect(self.args['socket'])
+            s.sendall((command + '\n').encode('utf-8'))
+
+            # the runtime API closes the connection after answering a single (non-interactive) command
+            out = b''
+            while True:
+                chunk = s.recv(65536)
+                if not chunk:
+                    break
+                out += chunk
+        finally:
+            s.close()
+
+        out = out.decode('utf-8')
+
+        # commands that modify the state of haproxy either answer nothing or one of a few well-known messages
+        if not command.startswith('show') and out.strip() and not any(m in out for m in RUNTIME_API_SUCCESS_MESSAGES):
+            raise HaproxyRuntimeException('"{}": {}'.format(command, out.strip()))
+
+        return out
+
+    def _experimental(self):
+
+        # haproxy 2.4 flags dynamic servers as experimental
+        return 'experimental-mode on; ' if self.version[:2] == (2, 4) else ''
+
+    def _get_version(self):
+        for line in self._command('show info').splitlines():
+            if line.startswith('Version:'):
+                return tuple(int(v) for v in line.split(':', 1)[1].strip().split('-')[0].split('.')[:3])
+
+        raise HaproxyRuntimeException('Unable to determine haproxy version')
+
+    def _get_servers(self, backend):
+        out = self._command('show servers state {}'.format(backend))
+        lines = out.splitlines()
+
+        # first line: format version, second line: field names, then one line per server
+        if len(lines) < 2 or not lines[1].startswith('#'):
+            return None
+
+        fields = lines[1].lstrip('#').split()
+        servers = {}
+        for line in lines[2:]:
+            values = dict(zip(fields, line.split()))
+            if values.get('be_name') == backend:
+                servers[values['srv_name']] = {'address': values.get('srv_addr'), 'port': values.get('srv_port')}
+
+        return servers
+
+    def _drain(self, servers):
+        deadline = time.monotonic() + self.args['drain_timeout']
+        pending = list(servers)
+
+        while pending:
+            sessions = self._get_current_sessions()
+            for b, name in list(pending):
+                if sessions.get((b, name), 0) == 0 or time.monotonic() >= deadline:
+                    if sessions.get((b, name), 0) == 0:
+                        self._command('{}del server {}/{}'.format(self._experimental(), b, name))
+                    self.removed.append('{}/{}'.format(b, name))
+                    pending.remove((b, name))
+
+            if pending:
+                time.sleep(DRAIN_POLL_INTERVAL)
+
+    def _get_current_sessions(self):
+        lines = self._command('show stat').splitlines()
+        if not lines:
+            return {}
+
+        fields = lines[0].lstrip('# ').split(',')
+        sessions = {}
+        for line in lines[1:]:
+            values = dict(zip(fields, line.split(',')))
+            if values.get('pxname') and values.get('svname'):
+                sessions[(values['pxname'], values['svname'])] = int(values.get('scur') or 0)
+
+        return sessions
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec = dict(
+            config = dict(type='path', default='/etc/haproxy/haproxy.cfg', required=False),
+            backends = dict(type='list', elements='str', required=True),
+            socket = dict(type='path', required=True),
+            drain_timeout = dict(type='int', default=30, required=False),
+        ),
+        supports_check_mode=True
+    )
+
+    result = HaproxyRuntimeServersModule(module)
+
+    module.exit_json(
+        changed=result.changed,
+        reload_required=result.reload_required,
+        reason=result.reason,
+        added=result.added,
+        updated=result.updated,
+        removed=result.removed
+    )
+
+
+if __name__ == '__main__':
+    main()
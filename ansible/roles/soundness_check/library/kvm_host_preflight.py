@@ -0,0 +1,384 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+DOCUMENTATION = r'''
+---
+module: kvm_host_preflight
+short_description: Check whether a KVM host is able to run the requested OpenShift cluster configuration.
+description:
+    - This module gathers (in a single process) the details of the KVM host required by the soundness checks,
+    - i.e. the OS release, the architecture, the number of CPUs (and cores and SMT threads per core on s390x),
+    - the memory, the free disk space at the libvirt image location, the availability of KVM and the installed versions
+    - of specific RPM packages.
+    - It evaluates the given support matrix and the hardware demands of the given cluster nodes against these details
+    - (on s390x, the CPUs of the cluster nodes are compared against the cores, not the SMT threads, of the KVM host)
+    - and returns a structured report containing the result of each individual check.
+    - The module doesn't fail if checks don't pass, see 'passed' and 'checks'.
+version_added: "1.0"
+options:
+    support_matrix:
+        description:
+            - Dictionary mapping the supported distributions (IDs as in /etc/os-release) to their supported major versions,
+            - each optionally restricting the supported minor versions ('minor_versions') and architectures ('architectures',
+            - with 'architectures_info_url' pointing to further information).
+            - Distributions of the Red Hat family not contained in the support matrix are supported in general.
+        required: true
+        default: null
+    nodes:
+        description:
+            - List of dictionaries describing the cluster nodes (with keys 'role', 'count', 'cpus', 'memory' (in MB),
+            - 'volume_size' (in bytes) and 'volume_usage_ratio' (the share of the root volume expected to be written to)).
+        required: false
+        default: []
+    cpu_overcommit_factor:
+        description:
+            - The factor the CPUs of the KVM host are overcommitted by.
+        required: false
+        default: 1
+    base_volume_size:
+        description:
+            - The disk space (in bytes) required by the base volume shared by the root volumes of all cluster nodes.
+        required: false
+        default: 0
+    image_path:
+        description:
+            - The libvirt image location (or, if it doesn't exist yet, the location it is created at).
+        required: false
+        default: '/var/lib/libvirt/openshift-images'
+    incompatible_packages:
+        description:
+            - List of dictionaries describing the RPM packages known to be incompatible (with keys 'name',
+            - 'release_prefix' (the prefix of the incompatible releases) and 'info_url' (pointing to further information)).
+        required: false
+        default: []
+notes: []
+requirements:
+    - rpm (if incompatible_packages is given)
+'''
+
+EXAMPLES = r'''
+# check the KVM host against the support matrix and the hardware demands of a three master / two worker cluster
+kvm_host_preflight:
+  support_matrix:
+    rhel:
+      '9':
+        minor_versions: [ 0, 1, 2 ]
+        architectures: [ 's390x', 'x86_64' ]
+  nodes:
+    - { 'role': 'master', 'count': 3, 'cpus': 4, 'memory': 16384, 'volume_size': 137438953472, 'volume_usage_ratio': 0.2 }
+    - { 'role': 'worker', 'count': 2, 'cpus': 4, 'memory': 8192, 'volume_size': 137438953472, 'volume_usage_ratio': 0.2 }
+  cpu_overcommit_factor: 10
+  base_volume_size: 4294967296
+  incompatible_packages:
+    - { 'name': 'libvirt', 'release_prefix': '37.1.module' }
+'''
+
+RETURN = r'''
+passed:
+    description: Whether all checks passed.
+    returned: success
+    type: bool
+    sample: true
+checks:
+    description: List containing the result of each check.
+    returned: success
+    type: list
+    elements: dictionary
+    contains:
+        name:
+            description: The name of the check.
+            returned: success
+            type: string
+            sample: 'memory'
+        status:
+            description: The result of the check ('pass', 'fail' or 'warn').
+            returned: success
+            type: string
+            sample: 'pass'
+        message:
+            description: The details of the check result.
+            returned: success
+            type: string
+            sample: '81920 MB of RAM required (current: 128512 MB)'
+host:
+    description: Dictionary containing the KVM host details the checks are based on.
+    returned: success
+    type: dictionary
+    sample: {
+        'distribution': 'rhel', 'version': '9.2', 'architecture': 's390x', 'cpus': 16, 'cores': 8, 'threads_per_core': 2,
+        'memory': 128512, 'image_path': '/var/lib/libvirt', 'free_disk_space': 805306368000, 'kvm': true, 'packages': {}
+    }
+demands:
+    description: Dictionary containing the hardware demands of the cluster nodes.
+    returned: success
+    type: dictionary
+    sample: { 'cpus': 2, 'memory': 65536, 'disk_space': 59373627899 }
+'''
+
+
+import os
+import platform
+from ansible.module_utils.basic import AnsibleModule
+
+
+# the distributions (IDs as in /etc/os-release) of the Red Hat family
+RED_HAT_FAMILY = ['rhel', 'fedora', 'centos']
+
+
+class KvmHostPreflightModule(object):
+    def __init__(self, module):
+        self.module = module
+        self.args = self.module.params
+
+        self.changed = False
+        self.checks = []
+        self.host = {}
+        self.demands = {}
+
+        self.process()
+
+    def process(self):
+        self.host = self._get_host_details()
+
+        self._check_os()
+        self._check_kvm()
+        self._check_capacity()
+        self._check_packages()
+
+    @property
+    def passed(self):
+        return all(c['status'] != 'fail' for c in self.checks)
+
+    def _add_check(self, name, status, message):
+        self.checks.append({'name': name, 'status': status, 'message': message})
+
+    def _get_host_details(self):
+        os_release = self._read_os_release()
+        cpus = self._online_cpus()
+        threads_per_core = self._threads_per_core()
+        image_path = self._existing_path(self.args['image_path'])
+        st = os.statvfs(image_path)
+
+        return {
+            'distribution': os_release.get('ID', ''),
+            'family': [i for i in [os_release.get('ID', '')] + os_release.get('ID_LIKE', '').split() if i in RED_HAT_FAMILY],
+            'version': os_release.get('VERSION_ID', ''),
+            'architecture': platform.machine(),
+            'cpus': cpus,
+            'cores': cpus // threads_per_core,
+            'threads_per_core': threads_per_core,
+            'memory': self._meminfo('MemTotal') // 1024,
+            'image_path': image_path,
+            'free_disk_space': st.f_bavail * st.f_frsize,
+            'kvm': os.path.exists('/dev/kvm'),
+            'packages': self._query_packages([p['name'] for p in self.args['incompatible_packages']]),
+        }
+
+    def _read_os_release(self):
+        os_release = {}
+        try:
+            with open('/etc/os-release', 'r') as f:
+                for line in f:
+                    key, sep, value = line.strip().partition('=')
+                    if sep:
+                        os_release[key] = value.strip('"\'')
+        except OSError as e:
+            self.module.fail_json('Unable to determine OS release: {}'.format(e))
+
+        return os_release
+
+    def _online_cpus(self):
+        try:
+            return self._count_cpu_list('/sys/devices/system/cpu/online')
+        except (OSError, ValueError):
+            return os.cpu_count()
+
+    def _threads_per_core(self):
+
+        # the SMT threads of a core are listed as siblings of each other
+        try:
+            return max(self._count_cpu_list('/sys/devices/system/cpu/cpu0/topology/thread_siblings_list'), 1)
+        except (OSError, ValueError):
+            return 1
+
+    def _count_cpu_list(self, path):
+
+        # CPU lists are given as comma-separated list of ranges, e.g. '0-7,16-23'
+        with open(path, 'r') as f:
+            cpu_list = f.read().strip()
+
+        cpus = 0
+        for r in cpu_list.split(','):
+            first, _, last = r.partition('-')
+            cpus += int(last or first) - int(first) + 1
+
+        return cpus
+
+    def _meminfo(self, key):
+        try:
+            with open('/proc/meminfo', 'r') as f:
+                for line in f:
+                    if line.startswith(key + ':'):
+                        return int(line.split()[1])
+        except (OSError, ValueError) as e:
+            self.module.fail_json('Unable to determine memory: {}'.format(e))
+
+        return 0
+
+    def _existing_path(self, path):
+
+        # the libvirt image location may not exist yet, its disk space is taken from the file system it will be created on
+        while not os.path.exists(path) and os.path.dirname(path) != path:
+            path = os.path.dirname(path)
+
+        return path
+
+    def _query_packages(self, names):
+        if not names:
+            return {}
+
+        # a single query for all packages (the exit code is the number of packages not installed, which are reported
+        # on stdout too, but in a different format)
+        _, out, err = self.module.run_command(['rpm', '-q', '--qf', 'pkg %{NAME} %{VERSION} %{RELEASE}\\n'] + names)
+        if err.strip():
+            self.module.fail_json('Unable to query RPM packages {}: {}'.format(', '.join(names), err.strip()))
+
+        packages = {}
+        for line in out.splitlines():
+            fields = line.split()
+            if len(fields) == 4 and fields[0] == 'pkg':
+                packages.setdefault(fields[1], {'version': fields[2], 'release': fields[3]})
+
+        return packages
+
+    def _check_os(self):
+        distribution = self.host['distribution']
+        version = self.host['version']
+        architecture = self.host['architecture']
+
+        if not self.host['family']:
+            self._add_check('os', 'fail', 'The KVM host is not running a Red Hat-based OS (current: {} {})'.format(distribution, version))
+            return
+
+        matrix = self.args['support_matrix'].get(distribution)
+        if matrix is None:
+            self._add_check('os', 'pass', 'Red Hat-based OS {} {}'.format(distribution, version))
+            return
+
+        major, _, minor = version.partition('.')
+        if major not in matrix:
+            self._add_check('os', 'fail', 'The major version of {} must be one of {} (current: {})'.format(
+                distribution, ', '.join(sorted(matrix)), version))
+            return
+
+        entry = matrix[major] or {}
+        minor_versions = [str(v) for v in entry.get('minor_versions', [])]
+        if minor_versions and (minor.split('.')[0] or '0') not in minor_versions:
+            self._add_check('os', 'fail', 'The minor version of {} {} must be one of {} (current: {})'.format(
+                distribution, major, ', '.join(minor_versions), version))
+            return
+
+        self._add_check('os', 'pass', 'Supported OS {} {}'.format(distribution, version))
+
+        architectures = entry.get('architectures', [])
+        if architectures and architecture not in architectures:
+            message = 'The KVM host architecture {} is not supported by {} {} (supported: {})'.format(
+                architecture, distribution, major, ', '.join(architectures))
+            if entry.get('architectures_info_url'):
+                message += ', for more information please refer to {}'.format(entry['architectures_info_url'])
+            self._add_check('architecture', 'fail', message)
+        else:
+            self._add_check('architecture', 'pass', 'Supported architecture {}'.format(architecture))
+
+    def _check_kvm(self):
+
+        # the KVM device may only show up once libvirt has been set up, so its absence is not fatal
+        if self.host['kvm']:
+            self._add_check('kvm', 'pass', 'KVM is available (/dev/kvm)')
+        else:
+            self._add_check('kvm', 'warn', 'KVM is not available (yet), /dev/kvm does not exist')
+
+    def _check_capacity(self):
+        nodes = self.args['nodes']
+        if not nodes:
+            return
+
+        cpus = sum(int(n['count']) * int(n['cpus']) for n in nodes) / float(self.args['cpu_overcommit_factor'])
+        memory = sum(int(n['count']) * int(n['memory']) for n in nodes)
+        disk_space = self.args['base_volume_size'] + sum(
+            int(n['count']) * int(n['volume_size']) * float(n.get('volume_usage_ratio', 1)) for n in nodes
+        )
+        self.demands = {'cpus': int(cpus), 'memory': int(memory), 'disk_space': int(disk_space)}
+
+        # on s390x, the CPUs of the cluster nodes are backed by cores (the SMT threads of a core don't add to its capacity)
+        if self.host['architecture'] == 's390x':
+            capacity, unit = self.host['cores'], 'cores'
+            cpu_details = '{} cores with {} SMT threads per core'.format(self.host['cores'], self.host['threads_per_core'])
+        else:
+            capacity, unit = self.host['cpus'], 'CPUs'
+            cpu_details = '{} CPUs'.format(self.host['cpus'])
+
+        self._add_check(
+            'cpu',
+            'pass' if capacity >= self.demands['cpus'] else 'fail',
+            '{} {} required (current: {})'.format(self.demands['cpus'], unit, cpu_details)
+        )
+        self._add_check(
+            'memory',
+            'pass' if self.host['memory'] > self.demands['memory'] else 'fail',
+            '{} MB of RAM required (current: {} MB)'.format(self.demands['memory'], self.host['memory'])
+        )
+        self._add_check(
+            'disk_space',
+            'pass' if self.host['free_disk_space'] >= self.demands['disk_space'] else 'fail',
+            '{:.1f} GB free disk space required at {} (current: {:.1f} GB)'.format(
+                self.demands['disk_space'] / 1024 ** 3, self.host['image_path'], self.host['free_disk_space'] / 1024 ** 3)
+        )
+
+    def _check_packages(self):
+        for p in self.args['incompatible_packages']:
+            installed = self.host['packages'].get(p['name'])
+            if installed is None:
+                continue
+
+            nvr = '{}-{}-{}'.format(p['name'], installed['version'], installed['release'])
+            if p.get('release_prefix') and installed['release'].startswith(p['release_prefix']):
+                message = 'The KVM host has a version of {} installed that is known to be incompatible with OpenShift: {}'.format(p['name'], nvr)
+                if p.get('info_url'):
+                    message += ', follow these instructions to resolve the issue: {}'.format(p['info_url'])
+                self._add_check('package_{}'.format(p['name']), 'fail', message)
+            else:
+                self._add_check('package_{}'.format(p['name']), 'pass', 'Compatible package {}'.format(nvr))
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec = dict(
+            support_matrix = dict(type='dict', required=True),
+            nodes = dict(type='list', elements='dict', default=[], required=False),
+            cpu_overcommit_factor = dict(type='float', default=1, required=False),
+            base_volume_size = dict(type='int', default=0, required=False),
+            image_path = dict(type='path', default='/var/lib/libvirt/openshift-images', required=False),
+            incompatible_packages = dict(type='list', elements='dict', default=[], required=False),
+        ),
+        supports_check_mode=True
+    )
+
+    result = KvmHostPreflightModule(module)
+
+    for check in result.checks:
+        if check['status'] == 'warn':
+            module.warn(check['message'])
+
+    module.exit_json(
+        changed=result.changed,
+        passed=result.passed,
+        checks=result.checks,
+        host=result.host,
+        demands=result.demands
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+DOCUMENTATION = r'''
+---
+module: libvirt_domain_tuning
+short_description: Apply a tuning profile to the persistent definitions of libvirt domains.
+description:
+    - This module applies performance-related changes to the persistent definitions of libvirt domains.
+    - The definition of each libvirt domain is retrieved and parsed once, all changes of the tuning profile
+    - are applied to it and the libvirt domain is redefined once (via a single libvirt connection).
+    - Libvirt domains whose definition already matches the tuning profile are skipped.
+version_added: "1.0"
+options:
+    domains:
+        description:
+            - The names of the libvirt domains to be tuned.
+        required: true
+        default: null
+    profile:
+        description:
+            - The tuning profile to be applied to the libvirt domains.
+            - Only the keys present in the tuning profile are applied.
+            - network_interface_driver - the attributes of the <driver> element of all network interfaces of type 'network' (e.g. name and queues).
+            - memballoon_model - the model of the memory balloon device (e.g. 'none' to disable the device).
+            - iothreads - the IDs of the dedicated IO threads of the libvirt domain.
+            - disk_driver - the attributes of the <driver> element of all disks using the 'qemu' driver (e.g. cache, io and iothread).
+            - cpu_shares - the CPU weight of the libvirt domain.
+        required: true
+        default: null
+    uri:
+        description:
+            - The libvirt connection URI.
+        required: false
+        default: 'qemu:///system'
+notes:
+    - Changes to the persistent definition of a running libvirt domain only take effect after the libvirt domain has been restarted.
+requirements:
+    - libvirt-python
+'''
+
+EXAMPLES = r'''
+# tune the given libvirt domains
+libvirt_domain_tuning:
+  domains:
+    - 'ocp1-qf2b5-master-0'
+    - 'ocp1-qf2b5-worker-0-456r9'
+  profile:
+    network_interface_driver:
+      name: vhost
+      queues: '2'
+    memballoon_model: none
+    iothreads: [ '1', '2' ]
+    disk_driver:
+      cache: none
+      io: native
+      iothread: '1'
+    cpu_shares: 2048
+
+# check the tuning against the libvirt test driver
+libvirt_domain_tuning:
+  domains:
+    - 'test'
+  profile:
+    memballoon_model: none
+  uri: 'test:///default'
+'''
+
+RETURN = r'''
+domains:
+    description: List containing the tuning results for each libvirt domain.
+    returned: success
+    type: list
+    elements: dictionary
+    contains:
+        name:
+            description: The name of the libvirt domain.
+            returned: success
+            type: string
+            sample: 'ocp1-qf2b5-worker-0-456r9'
+        changed:
+            description: Whether the definition of the libvirt domain has been changed.
+            returned: success
+            type: bool
+            sample: true
+        changes:
+            description: The tuning profile keys that led to changes of the libvirt domain definition.
+            returned: success
+            type: list
+            sample: [ 'memballoon_model', 'cpu_shares' ]
+'''
+
+
+import traceback
+import xml.etree.ElementTree as ET
+from ansible.module_utils.basic import AnsibleModule, missing_required_lib
+
+LIBVIRT_IMPORT_ERROR = None
+try:
+    import libvirt
+except ImportError:
+    LIBVIRT_IMPORT_ERROR = traceback.format_exc()
+
+
+TUNING_PROFILE_KEYS = ['network_interface_driver', 'memballoon_model', 'iothreads', 'disk_driver', 'cpu_shares']
+
+
+class LibvirtDomainTuningModule(object):
+    def __init__(self, module):
+        self.module = module
+        self.args = self.module.params
+
+        self.changed = False
+        self.domains = []
+        self.diff = []
+
+        self.process()
+
+    def process(self):
+        profile = self.args['profile']
+
+        unknown_keys = [k for k in profile if k not in TUNING_PROFILE_KEYS]
+        if unknown_keys:
+            self.module.fail_json('Unknown tuning profile keys: {}'.format(', '.join(unknown_keys)))
+
+        conn = None
+
+        try:
+            conn = libvirt.open(self.args['uri'])
+
+            for domain_name in self.args['domains']:
+                self.domains.append(self._tune_domain(conn, domain_name, profile))
+        except libvirt.libvirtError as e:
+            self.module.fail_json('Unable to tune libvirt domains: {}'.format(e))
+        finally:
+            if conn:
+                conn.close()
+
+        self.changed = any(d['changed'] for d in self.domains)
+
+    def _tune_domain(self, conn, domain_name, profile):
+        domain = conn.lookupByName(domain_name)
+        domain_xml = ET.fromstring(domain.XMLDesc(libvirt.VIR_DOMAIN_XML_INACTIVE))
+        before = ET.tostring(domain_xml, encoding='unicode')
+
+        changes = []
+        for key in TUNING_PROFILE_KEYS:
+            if profile.get(key) is None:
+                continue
+
+            if getattr(self, '_apply_{}'.format(key))(domain_xml, profile[key]):
+                changes.append(key)
+
+        after = ET.tostring(domain_xml, encoding='unicode')
+
+        # libvirt domains which already match the tuning profile are left alone
+        if before == after:
+            return {'name': domain_name, 'changed': False, 'changes': []}
+
+        # update the persistent domain definition once for all changes
+        if not self.module.check_mode:
+            conn.defineXML(after)
+
+        self.diff.append({
+            'before_header': domain_name,
+            'after_header': domain_name,
+            'before': before,
+            'after': after,
+        })
+
+        return {'name': domain_name, 'changed': True, 'changes': changes}
+
+    def _apply_network_interface_driver(self, domain_xml, attributes):
+        changed = False
+
+        for interface in domain_xml.findall("devices/interface[@type='network']"):
+            driver = interface.find('driver')
+            if driver is None:
+                driver = ET.SubElement(interface, 'driver')
+
+            changed |= self._set_attributes(driver, attributes)
+
+        return changed
+
+    def _apply_memballoon_model(self, domain_xml, model):
+        devices = domain_xml.find('devices')
+        memballoons = devices.findall('memballoon')
+
+        # there must be exactly one memory balloon device with the given model and nothing else configured
+        if len(memballoons) == 1 and dict(memballoons[0].attrib) == {'model': model} and len(memballoons[0]) == 0:
+            return False
+
+        for memballoon in memballoons:
+            devices.remove(memballoon)
+        ET.SubElement(devices, 'memballoon', {'model': model})
+
+        return True
+
+    def _apply_iothreads(self, domain_xml, iothread_ids):
+        iothread_ids = [str(i) for i in iothread_ids]
+        changed = False
+
+        iothreads = domain_xml.find('iothreads')
+        if iothreads is None:
+            iothreads = ET.SubElement(domain_xml, 'iothreads')
+        if iothreads.text != str(len(iothread_ids)):
+            iothreads.text = str(len(iothread_ids))
+            changed = True
+
+        iothreadids = domain_xml.find('iothreadids')
+        if iothreadids is None:
+            iothreadids = ET.SubElement(domain_xml, 'iothreadids')
+
+        existing_ids = [i.get('id') for i in iothreadids.findall('iothread')]
+        for iothread_id in iothread_ids:
+            if iothread_id not in existing_ids:
+                ET.SubElement(iothreadids, 'iothread', {'id': iothread_id})
+                changed = True
+
+        return changed
+
+    def _apply_disk_driver(self, domain_xml, attributes):
+        changed = False
+
+        for driver in domain_xml.findall("devices/disk/driver[@name='qemu']"):
+            changed |= self._set_attributes(driver, attributes)
+
+        return changed
+
+    def _apply_cpu_shares(self, domain_xml, shares):
+        cputune = domain_xml.find('cputune')
+        if cputune is None:
+            cputune = ET.SubElement(domain_xml, 'cputune')
+
+        cpu_shares = cputune.find('shares')
+        if cpu_shares is None:
+            cpu_shares = ET.SubElement(cputune, 'shares')
+
+        if cpu_shares.text == str(shares):
+            return False
+
+        cpu_shares.text = str(shares)
+        return True
+
+    def _set_attributes(self, element, attributes):
+        changed = False
+
+        for name, value in attributes.items():
+            if element.get(name) != str(value):
+                element.set(name, str(value))
+                changed = True
+
+        return changed
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec = dict(
+            domains = dict(type='list', elements='str', required=True),
+            profile = dict(type='dict', required=True),
+            uri = dict(type='str', default='qemu:///system', required=False),
+        ),
+        supports_check_mode=True
+    )
+
+    if LIBVIRT_IMPORT_ERROR:
+        module.fail_json(msg=missing_required_lib('libvirt-python'), exception=LIBVIRT_IMPORT_ERROR)
+
+    result = LibvirtDomainTuningModule(module)
+
+    module.exit_json(changed=result.changed, domains=result.domains, diff=result.diff)
+
+
+if __name__ == '__main__':
+    main()
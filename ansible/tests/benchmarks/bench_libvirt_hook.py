@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Benchmark of the libvirt 'qemu' hook of the crypto role (roles/crypto/templates/libvirt_hook_qemu.py.j2).
+#
+# libvirt runs the hook synchronously (in a new process) for every lifecycle event of every domain on the host.
+# This benchmark feeds the recorded domain XMLs in 'tests/fixtures/libvirt_hook' and the lifecycle events of a
+# domain start and stop to the rendered hook, running against a fake sysfs tree, and reports the latency per event.
+# The latency of starting the Python interpreter alone is reported as well ('interpreter').
+#
+# The mediated device of the crypto-enabled domain exists with the expected crypto resource assigned, so
+# 'prepare' resumes without creating a mediated device ('release' writes to the fake sysfs tree only).
+#
+# Usage (from within the 'ansible' directory):
+#   python3 tests/benchmarks/bench_libvirt_hook.py [--iterations N]
+
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from libvirt_hook_utils import HookEnvironment, domain_xml  # noqa: E402
+
+
+# the lifecycle events libvirt runs the hook for when a domain is started and stopped (in that order)
+EVENTS = ['prepare', 'start', 'started', 'stopped', 'release']
+
+MDEV_UUID = '5a4c1e3d-9b2f-4d8a-8c61-0e7f3b2a9d10'
+CRYPTO_RESOURCE = '07.0029'
+
+
+def measure(run, iterations):
+    latencies = []
+
+    for _ in range(iterations):
+        started = time.perf_counter()
+        result = run()
+        latencies.append((time.perf_counter() - started) * 1000)
+
+        if result.returncode != 0:
+            raise RuntimeError('hook failed: {}'.format(result.stderr.decode('utf-8', 'replace').strip()))
+
+    return latencies
+
+
+def report(name, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(round(len(latencies) * 0.95)) - 1)]
+
+    print('{:<40} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f}'.format(name, latencies[0], statistics.median(latencies), p95, latencies[-1]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the libvirt qemu hook of the crypto role.')
+    parser.add_argument('--iterations', type=int, default=50, help='the number of hook runs per domain and event')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as base_dir:
+        hook_env = HookEnvironment(base_dir)
+
+        domains = {
+            'ocp1-qf2b5-master-0': domain_xml('ocp-master.xml', 'ocp1-qf2b5-master-0'),
+            'ocp1-qf2b5-worker-0': hook_env.add_domain('ocp1-qf2b5-worker-0', {MDEV_UUID: CRYPTO_RESOURCE}),
+        }
+        hook_env.add_mdev(MDEV_UUID, [CRYPTO_RESOURCE], [CRYPTO_RESOURCE.split('.')[1]])
+
+        print('{:<40} {:>9} {:>9} {:>9} {:>9}'.format('latency (ms)', 'min', 'median', 'p95', 'max'))
+
+        report('interpreter', measure(lambda: subprocess.run([sys.executable, '-c', 'pass']), args.iterations))
+
+        for domain_name, xml in domains.items():
+            for event in EVENTS:
+                latencies = measure(lambda: hook_env.run(domain_name, event, xml), args.iterations)
+                report('{} {}'.format(domain_name, event), latencies)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Benchmark of the selection of non-ready Nodes by the 'select_resources' filter (filter_plugins/FilterUtils.py) and
+# by the cluster_health_info module (library/cluster_health_info.py), which implements the same selection.
+#
+# The selection runs over a list of synthetic Nodes (a given share of which isn't Ready) and is compared to the
+# former approach of check_cluster_state.yml, where 'set_fact' looped over all Nodes and templated the growing list
+# of non-ready Nodes again for every single Node (using the 'get_resources' filter). The former approach is measured
+# without the overhead Ansible adds for every loop item, i.e. the actual difference is even larger.
+#
+# Usage (from within the 'ansible' directory):
+#   python3 tests/benchmarks/bench_select_resources.py [--nodes N] [--iterations N]
+
+
+import argparse
+import ast
+import os
+import statistics
+import sys
+import time
+
+import jinja2
+
+ANSIBLE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path[:0] = [os.path.join(ANSIBLE_DIR, 'library'), os.path.join(ANSIBLE_DIR, 'filter_plugins')]
+
+from cluster_health_info import NONREADY_NODE_CONDITIONS, ClusterHealthInfoModule  # noqa: E402
+from FilterUtils import FilterModule  # noqa: E402
+
+
+# the template of the former 'set_fact' task, rendered once per Node
+FORMER_TEMPLATE = '{{ (nonready_nodes | default([])) + [item | get_resources(state="Ready", status="Unknown|False")] | select() | list }}'
+
+
+def make_nodes(count, nonready_every):
+    nodes = []
+
+    for i in range(count):
+        nodes.append({
+            'metadata': {'name': 'worker-{}'.format(i)},
+            'status': {'conditions': [
+                {'type': 'MemoryPressure', 'status': 'False'},
+                {'type': 'DiskPressure', 'status': 'False'},
+                {'type': 'PIDPressure', 'status': 'False'},
+                {'type': 'Ready', 'status': 'False' if i % nonready_every == 0 else 'True'},
+            ]},
+        })
+
+    return nodes
+
+
+def select_former(nodes):
+    environment = jinja2.Environment()
+    environment.filters.update(FilterModule().filters())
+    template = environment.from_string(FORMER_TEMPLATE)
+
+    # 'set_fact' passes the result of each loop item on to the next one (as a string, parsed again by Ansible)
+    nonready_nodes = []
+    for node in nodes:
+        nonready_nodes = ast.literal_eval(template.render(item=node, nonready_nodes=nonready_nodes))
+
+    return nonready_nodes
+
+
+def select_filter(nodes):
+    return FilterModule().select_resources(nodes, {'Ready': 'False|Unknown'})
+
+
+def select_module(nodes):
+    return ClusterHealthInfoModule._select_resources(nodes, NONREADY_NODE_CONDITIONS)
+
+
+def measure(run, iterations):
+    latencies = []
+
+    for _ in range(iterations):
+        started = time.perf_counter()
+        result = run()
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    return latencies, result
+
+
+def report(name, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(round(len(latencies) * 0.95)) - 1)]
+
+    print('{:<40} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f}'.format(name, latencies[0], statistics.median(latencies), p95, latencies[-1]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the selection of non-ready Nodes.')
+    parser.add_argument('--nodes', type=int, default=10000, help='the number of synthetic Nodes')
+    parser.add_argument('--nonready-every', type=int, default=100, help='every n-th synthetic Node is not Ready')
+    parser.add_argument('--iterations', type=int, default=20, help='the number of runs of the filter and module selections')
+    parser.add_argument('--former-iterations', type=int, default=1, help='the number of runs of the former selection')
+    args = parser.parse_args()
+
+    nodes = make_nodes(args.nodes, args.nonready_every)
+
+    print('{:<40} {:>9} {:>9} {:>9} {:>9}'.format('latency (ms, {} Nodes)'.format(args.nodes), 'min', 'median', 'p95', 'max'))
+
+    latencies, selected = measure(lambda: select_filter(nodes), args.iterations)
+    report('select_resources filter', latencies)
+
+    latencies, module_selected = measure(lambda: select_module(nodes), args.iterations)
+    report('cluster_health_info', latencies)
+
+    latencies, former_selected = measure(lambda: select_former(nodes), args.former_iterations)
+    report('set_fact loop (get_resources)', latencies)
+
+    for other in [module_selected, former_selected]:
+        if selected != other:
+            raise RuntimeError('the selections differ: {} != {}'.format(selected, other))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+# Common setup of the unit tests for the modules, module utilities and plugins of this repository.
+#
+# The tests require 'pytest' and 'ansible-core'. Tests depending on further Python packages
+# (e.g. 'libvirt-python') are skipped if these packages are not installed.
+#
+# Run the tests from within the 'ansible' directory:
+#   python -m pytest tests
+
+
+import glob
+import json
+import os
+import sys
+
+import pytest
+
+
+ANSIBLE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# the modules and plugins are imported by their file names
+sys.path[:0] = [
+    os.path.join(ANSIBLE_DIR, 'library'),
+    os.path.join(ANSIBLE_DIR, 'filter_plugins'),
+    os.path.join(ANSIBLE_DIR, 'callback_plugins'),
+] + sorted(glob.glob(os.path.join(ANSIBLE_DIR, 'roles', '*', 'library')))
+
+# the module utilities of the roles are imported by the modules as 'ansible.module_utils.<name>'
+# (same as the role-level 'module_utils' directories are made available by Ansible)
+import ansible.module_utils  # noqa: E402
+ansible.module_utils.__path__.extend(sorted(glob.glob(os.path.join(ANSIBLE_DIR, 'roles', '*', 'module_utils'))))
+
+from ansible.module_utils import basic  # noqa: E402
+from ansible.module_utils.common.text.converters import to_bytes  # noqa: E402
+
+
+class AnsibleExitJson(Exception):
+    pass
+
+
+class AnsibleFailJson(Exception):
+    pass
+
+
+def _exit_json(self, **kwargs):
+    kwargs.setdefault('changed', False)
+    raise AnsibleExitJson(kwargs)
+
+
+def _fail_json(self, msg=None, **kwargs):
+    kwargs.update({'failed': True, 'msg': msg})
+    raise AnsibleFailJson(kwargs)
+
+
+def fixture_path(*names):
+    return os.path.join(FIXTURES_DIR, *names)
+
+
+def read_fixture(*names):
+    with open(fixture_path(*names), 'r') as f:
+        return f.read()
+
+
+@pytest.fixture
+def run_module(monkeypatch):
+    '''
+    Runs the main() function of the given module with the given module arguments
+    and returns the result of the module (containing 'failed': True if the module failed).
+    '''
+    def run(module, args, check_mode=False):
+        module_args = dict(args, _ansible_check_mode=check_mode, _ansible_remote_tmp='/tmp', _ansible_keep_remote_files=False)
+
+        monkeypatch.setattr(basic, '_ANSIBLE_ARGS', to_bytes(json.dumps({'ANSIBLE_MODULE_ARGS': module_args})))
+        if hasattr(basic, '_ANSIBLE_PROFILE'):
+            monkeypatch.setattr(basic, '_ANSIBLE_PROFILE', 'legacy')
+        monkeypatch.setattr(basic.AnsibleModule, 'exit_json', _exit_json)
+        monkeypatch.setattr(basic.AnsibleModule, 'fail_json', _fail_json)
+
+        try:
+            module.main()
+        except (AnsibleExitJson, AnsibleFailJson) as e:
+            return e.args[0]
+
+        raise AssertionError('module {} did neither exit nor fail'.format(module.__name__))
+
+    return run
+
+
+DOMAIN_XML_TEMPLATE = '''
+<domain type='test'>
+  <name>{name}</name>
+  <memory unit='KiB'>{memory}</memory>
+  <vcpu>{vcpus}</vcpu>
+  <os>
+    <type arch='s390x'>hvm</type>
+  </os>
+  <devices>{devices}</devices>
+</domain>
+'''
+
+
+def define_domain(conn, name, devices='', memory=1048576, vcpus=2):
+    '''
+    Defines a libvirt domain with the given name (and devices XML) and returns it.
+    '''
+    return conn.defineXML(DOMAIN_XML_TEMPLATE.format(name=name, devices=devices, memory=memory, vcpus=vcpus))
+
+
+@pytest.fixture
+def libvirt_conn():
+    '''
+    Returns a connection to the libvirt test driver ('test:///default'). The state of the test driver is shared by all
+    connections of the process (i.e. with the modules under test) while this connection is open; all domains defined
+    while running the test are removed afterwards.
+    '''
+    libvirt = pytest.importorskip('libvirt')
+
+    conn = libvirt.open('test:///default')
+    existing_domains = set(d.name() for d in conn.listAllDomains())
+
+    yield conn
+
+    for domain in conn.listAllDomains():
+        if domain.name() not in existing_domains:
+            if domain.isActive():
+                domain.destroy()
+            domain.undefine()
+    conn.close()
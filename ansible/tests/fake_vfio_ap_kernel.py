@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Runs the libvirt 'qemu' hook of the crypto role against a fake sysfs tree that emulates the vfio_ap device driver,
+# i.e. the writes to the sysfs attributes of the vfio_ap matrix device behave (and fail) as with the real kernel:
+# - 'create' creates a mediated device directory (failing if it exists already)
+# - 'assign_adapter' / 'assign_domain' / 'assign_control_domain' update the 'matrix' and 'control_domains'
+#   attributes of a mediated device (failing if the crypto resources are not reserved for vfio_ap via the AP bus masks
+#   or if they're assigned to another mediated device already)
+# - 'remove' removes a mediated device directory
+# - writing the AP bus masks fails if crypto resources assigned to a mediated device would be given back to zcrypt
+# - each write takes some time (same as with the real kernel), which widens the window for races between hook runs
+#
+# Usage (the fake sysfs root is given via the 'LIBVIRT_HOOK_SYSFS_ROOT' environment variable, same as for the hook):
+#   python3 fake_vfio_ap_kernel.py <hook> <domain name> <operation> <sub-operation> <extra argument>
+
+
+import errno
+import glob
+import importlib.machinery
+import importlib.util
+import os
+import shutil
+import sys
+import time
+
+
+SYSFS_ROOT = os.environ['LIBVIRT_HOOK_SYSFS_ROOT']
+MATRIX_DIR = os.path.join(SYSFS_ROOT, 'devices', 'vfio_ap', 'matrix')
+CREATE_FILE = os.path.join(MATRIX_DIR, 'mdev_supported_types', 'vfio_ap-passthrough', 'create')
+
+# the time (in seconds) each write to a sysfs attribute takes
+WRITE_DELAY = float(os.environ.get('FAKE_VFIO_AP_WRITE_DELAY', '0.01'))
+
+
+def read_assignments(mdev_dir):
+    adapters, domains, control_domains = set(), set(), set()
+
+    with open(os.path.join(mdev_dir, 'matrix'), 'r') as f:
+        for line in f:
+            card, _, domain = line.strip().partition('.')
+            if card:
+                adapters.add(int(card, 16))
+            if domain:
+                domains.add(int(domain, 16))
+
+    with open(os.path.join(mdev_dir, 'control_domains'), 'r') as f:
+        control_domains.update(int(line.strip(), 16) for line in f if line.strip())
+
+    return adapters, domains, control_domains
+
+
+def write_assignments(mdev_dir, adapters, domains, control_domains):
+    if adapters and domains:
+        matrix = ['{:02x}.{:04x}'.format(a, d) for a in sorted(adapters) for d in sorted(domains)]
+    else:
+        matrix = ['{:02x}.'.format(a) for a in sorted(adapters)] + ['.{:04x}'.format(d) for d in sorted(domains)]
+
+    with open(os.path.join(mdev_dir, 'matrix'), 'w') as f:
+        f.write(''.join(m + '\n' for m in matrix))
+    with open(os.path.join(mdev_dir, 'control_domains'), 'w') as f:
+        f.write(''.join('{:04x}\n'.format(d) for d in sorted(control_domains)))
+
+
+def assigned_apqns(exclude=None):
+    apqns = set()
+
+    for mdev_dir in glob.glob(os.path.join(MATRIX_DIR, '*-*-*-*-*')):
+        if mdev_dir != exclude:
+            adapters, domains, _ = read_assignments(mdev_dir)
+            apqns.update((a, d) for a in adapters for d in domains)
+
+    return apqns
+
+
+def read_masks():
+    from ap_masks import ApMasks
+
+    return ApMasks(SYSFS_ROOT).read()
+
+
+def is_host_owned(mask, index):
+    from ap_masks import mask_bit
+
+    return bool(mask & mask_bit(index))
+
+
+def write_sysfs_attribute(location, value):
+    time.sleep(WRITE_DELAY)
+
+    if location == CREATE_FILE:
+        mdev_dir = os.path.join(MATRIX_DIR, value)
+        os.mkdir(mdev_dir)
+        write_assignments(mdev_dir, set(), set(), set())
+        return
+
+    mdev_dir, attribute = os.path.split(location)
+    if not os.path.isdir(mdev_dir):
+        raise OSError(errno.ENOENT, os.strerror(errno.ENOENT), location)
+
+    if attribute == 'remove':
+        shutil.rmtree(mdev_dir)
+        return
+
+    adapters, domains, control_domains = read_assignments(mdev_dir)
+    apmask, aqmask = read_masks()
+    index = int(value, 16)
+
+    if attribute == 'assign_adapter':
+        if is_host_owned(apmask, index):
+            raise OSError(errno.EADDRNOTAVAIL, os.strerror(errno.EADDRNOTAVAIL), location)
+        adapters.add(index)
+    elif attribute == 'assign_domain':
+        if is_host_owned(aqmask, index):
+            raise OSError(errno.EADDRNOTAVAIL, os.strerror(errno.EADDRNOTAVAIL), location)
+        domains.add(index)
+    elif attribute == 'assign_control_domain':
+        control_domains.add(index)
+    else:
+        raise OSError(errno.EINVAL, os.strerror(errno.EINVAL), location)
+
+    # a crypto resource (APQN) can only be assigned to a single mediated device
+    if set((a, d) for a in adapters for d in domains) & assigned_apqns(exclude=mdev_dir):
+        raise OSError(errno.EADDRINUSE, os.strerror(errno.EADDRINUSE), location)
+
+    write_assignments(mdev_dir, adapters, domains, control_domains)
+
+
+def patch_ap_masks():
+    import ap_masks
+
+    write_mask = ap_masks.ApMasks._write_mask
+
+    def _write_mask(self, mask_file, mask):
+        time.sleep(WRITE_DELAY)
+
+        apmask, aqmask = read_masks()
+        if mask_file == self.apmask_file:
+            apmask = mask
+        else:
+            aqmask = mask
+
+        # crypto resources assigned to a mediated device can't be given back to the host
+        for a, d in assigned_apqns():
+            if is_host_owned(apmask, a) and is_host_owned(aqmask, d):
+                raise ap_masks.ApMaskException('Unable to write AP bus mask {}: crypto resource {:02x}.{:04x} in use'.format(mask_file, a, d))
+
+        write_mask(self, mask_file, mask)
+
+    ap_masks.ApMasks._write_mask = _write_mask
+
+
+def main():
+    hook = sys.argv[1]
+
+    loader = importlib.machinery.SourceFileLoader('libvirt_hook_qemu', hook)
+    spec = importlib.util.spec_from_loader('libvirt_hook_qemu', loader)
+    hook_module = importlib.util.module_from_spec(spec)
+    loader.exec_module(hook_module)
+
+    sys.path.insert(0, hook_module.HOOK_LIBRARY_DIR)
+    patch_ap_masks()
+    hook_module.write_sysfs_attribute = write_sysfs_attribute
+
+    sys.argv = sys.argv[1:]
+    hook_module.main()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+# Helpers for running the libvirt 'qemu' hook of the crypto role (roles/crypto/templates/libvirt_hook_qemu.py.j2)
+# against a fake sysfs tree, shared by the hook tests and the hook benchmark.
+
+
+import os
+import re
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import jinja2
+
+
+ANSIBLE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HOOK_TEMPLATE = os.path.join(ANSIBLE_DIR, 'roles', 'crypto', 'templates', 'libvirt_hook_qemu.py.j2')
+
+# the hook imports the AP bus mask helper from its library directory
+HOOK_LIBRARY_DIR = os.path.join(ANSIBLE_DIR, 'roles', 'crypto', 'module_utils')
+
+DOMAIN_XML_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'libvirt_hook')
+
+FAKE_KERNEL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_vfio_ap_kernel.py')
+
+ALL_BITS_MASK = '0x' + 'f' * 64
+
+
+class HookEnvironment(object):
+    '''
+    A rendered libvirt 'qemu' hook along with its working directory, lock file, log file and fake sysfs tree,
+    all located below the given base directory.
+    '''
+    def __init__(self, base_dir):
+        self.base_dir = str(base_dir)
+        self.hook = os.path.join(self.base_dir, 'qemu')
+        self.workdir = os.path.join(self.base_dir, 'workdir')
+        self.sysfs_root = os.path.join(self.base_dir, 'sys')
+        self.lock_file = os.path.join(self.base_dir, 'hook.lock')
+        self.log_file = os.path.join(self.base_dir, 'hook.log')
+        self.matrix_dir = os.path.join(self.sysfs_root, 'devices', 'vfio_ap', 'matrix')
+
+        os.makedirs(self.workdir)
+        os.makedirs(os.path.join(self.sysfs_root, 'bus', 'ap'))
+        os.makedirs(os.path.join(self.matrix_dir, 'mdev_supported_types', 'vfio_ap-passthrough'))
+
+        for mask in ('apmask', 'aqmask'):
+            with open(os.path.join(self.sysfs_root, 'bus', 'ap', mask), 'w') as f:
+                f.write(ALL_BITS_MASK + '\n')
+        with open(os.path.join(self.matrix_dir, 'mdev_supported_types', 'vfio_ap-passthrough', 'create'), 'w'):
+            pass
+
+        with open(HOOK_TEMPLATE, 'r') as f:
+            template = jinja2.Template(f.read(), keep_trailing_newline=True)
+        with open(self.hook, 'w') as f:
+            f.write(template.render(
+                openshift_installer_workdir=self.workdir,
+                crypto_hook_library_dir=HOOK_LIBRARY_DIR,
+                crypto_hook_lock_file=self.lock_file,
+                crypto_hook_log_file=self.log_file,
+            ))
+        os.chmod(self.hook, 0o755)
+
+    def add_domain(self, domain_name, mdevs):
+        '''
+        Records the given mediated devices (mdev UUID -> crypto resource) of the given domain
+        (same as the crypto role does) and returns the domain XML.
+        '''
+        with open(os.path.join(self.workdir, 'crypto_mdevs_{}.yaml'.format(domain_name)), 'w') as f:
+            for mdev_uuid, crypto_resource in mdevs.items():
+                f.write("{}: '{}'\n".format(mdev_uuid, crypto_resource))
+
+        return domain_xml('ocp-worker-crypto.xml', domain_name, list(mdevs))
+
+    def add_mdev(self, mdev_uuid, matrix=(), control_domains=()):
+        '''
+        Creates a mediated device with the given crypto resources ('<card>.<domain>') and control domains
+        assigned in the fake sysfs tree.
+        '''
+        mdev_dir = os.path.join(self.matrix_dir, mdev_uuid)
+        os.makedirs(mdev_dir)
+
+        with open(os.path.join(mdev_dir, 'matrix'), 'w') as f:
+            f.write(''.join('{}\n'.format(m) for m in matrix))
+        with open(os.path.join(mdev_dir, 'control_domains'), 'w') as f:
+            f.write(''.join('{}\n'.format(d) for d in control_domains))
+
+    def read_mdev(self, mdev_uuid):
+        '''
+        Returns the crypto resources and control domains assigned to the given mediated device in the fake sysfs tree.
+        '''
+        mdev_dir = os.path.join(self.matrix_dir, mdev_uuid)
+
+        with open(os.path.join(mdev_dir, 'matrix'), 'r') as f:
+            matrix = f.read().split()
+        with open(os.path.join(mdev_dir, 'control_domains'), 'r') as f:
+            control_domains = f.read().split()
+
+        return matrix, control_domains
+
+    def read_masks(self):
+        masks = []
+
+        for mask in ('apmask', 'aqmask'):
+            with open(os.path.join(self.sysfs_root, 'bus', 'ap', mask), 'r') as f:
+                masks.append(f.read().strip())
+
+        return tuple(masks)
+
+    def env(self):
+        return dict(os.environ, LIBVIRT_HOOK_SYSFS_ROOT=self.sysfs_root)
+
+    def command(self, domain_name, operation, fake_kernel=False):
+        '''
+        Returns the command running the hook the same way libvirt does (the domain XML is expected on stdin),
+        optionally against a fake sysfs tree emulating the vfio_ap device driver (see 'fake_vfio_ap_kernel.py').
+        '''
+        command = [sys.executable, self.hook, domain_name, operation, 'begin', '-']
+        if fake_kernel:
+            command.insert(1, FAKE_KERNEL)
+
+        return command
+
+    def run(self, domain_name, operation, xml, fake_kernel=False):
+        '''
+        Runs the hook (in a separate process, the domain XML on stdin) and returns the completed process.
+        '''
+        return subprocess.run(
+            self.command(domain_name, operation, fake_kernel),
+            input=xml.encode('utf-8'),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=self.env(),
+        )
+
+    def run_concurrently(self, runs, fake_kernel=False):
+        '''
+        Runs the hook for all of the given (domain name, operation, domain XML) tuples at the same time
+        and returns the completed processes.
+        '''
+        def run(domain_name, operation, xml):
+            process = subprocess.Popen(self.command(domain_name, operation, fake_kernel), stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=self.env())
+            stdout, stderr = process.communicate(xml.encode('utf-8'), timeout=60)
+            return subprocess.CompletedProcess(process.args, process.returncode, stdout, stderr)
+
+        # each hook run is fed its domain XML by its own thread, so that none of them waits for another one
+        with ThreadPoolExecutor(max_workers=len(runs)) as executor:
+            return list(executor.map(lambda r: run(*r), runs))
+
+
+def domain_xml(name, domain_name, mdev_uuids=()):
+    '''
+    Returns the recorded domain XML of the given name for the given domain, containing one
+    vfio-ap <hostdev> element for each of the given mdev UUIDs (if the recorded domain XML contains any).
+    '''
+    with open(os.path.join(DOMAIN_XML_DIR, name), 'r') as f:
+        xml = f.read()
+
+    xml = re.sub(r'ocp1-qf2b5-(worker|master)-0', domain_name, xml)
+
+    hostdev = re.search(r'    <hostdev .*?</hostdev>\n', xml, re.DOTALL)
+    if hostdev:
+        hostdevs = ''.join(hostdev.group(0).replace('{mdev_uuid}', u).replace('ua-hostdev0', 'ua-hostdev{}'.format(i)) for i, u in enumerate(mdev_uuids))
+        xml = xml[:hostdev.start()] + hostdevs + xml[hostdev.end():]
+
+    return xml
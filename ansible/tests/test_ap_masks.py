@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+# Tests for the AP bus mask helper of the crypto role (roles/crypto/module_utils/ap_masks.py),
+# using a fake sysfs tree.
+
+
+import multiprocessing
+import os
+
+import pytest
+
+from ansible.module_utils.ap_masks import ApBusLock, ApMaskException, ApMasks, format_mask, mask_bit, parse_mask
+
+
+ALL_BITS = (1 << 256) - 1
+
+
+def make_sysfs(root, apmask=ALL_BITS, aqmask=ALL_BITS):
+    ap_dir = os.path.join(str(root), 'bus', 'ap')
+    os.makedirs(ap_dir)
+
+    for name, mask in (('apmask', apmask), ('aqmask', aqmask)):
+        with open(os.path.join(ap_dir, name), 'w') as f:
+            f.write(format_mask(mask) + '\n')
+
+    return str(root)
+
+
+def _update(sysfs_root, lock_file, changes, barrier):
+    barrier.wait()
+    ApMasks(sysfs_root, lock_file).update(changes)
+
+
+def test_mask_format_roundtrip():
+    assert parse_mask(format_mask(mask_bit(7) | mask_bit(0x29))) == mask_bit(7) | mask_bit(0x29)
+
+    # the masks are left-aligned, shorter values are padded on the right
+    assert parse_mask('0x8') == mask_bit(0)
+
+
+def test_update(tmp_path):
+    sysfs_root = make_sysfs(tmp_path / 'sys')
+    masks = ApMasks(sysfs_root, str(tmp_path / 'lock'))
+
+    assert masks.update([('07.0029', '-'), ('07.002a', '-')])
+    assert masks.read() == (ALL_BITS & ~mask_bit(7), ALL_BITS & ~mask_bit(0x29) & ~mask_bit(0x2a))
+
+    # nothing to be written if the masks are as desired already
+    assert not masks.update([('07.0029', '-')])
+
+
+def test_update_invalid_resource(tmp_path):
+    masks = ApMasks(make_sysfs(tmp_path / 'sys'), str(tmp_path / 'lock'))
+
+    with pytest.raises(ApMaskException):
+        masks.update([('zz.0029', '-')])
+
+
+def test_update_is_reentrant_while_holding_the_lock(tmp_path):
+    lock_file = str(tmp_path / 'lock')
+    masks = ApMasks(make_sysfs(tmp_path / 'sys'), lock_file)
+
+    with ApBusLock(lock_file):
+        with ApBusLock(lock_file):
+            assert masks.update([('07.0029', '-')])
+        assert masks.update([('07.0029', '+')])
+
+    assert ApBusLock._held == {}
+
+
+def test_concurrent_updates_are_serialized(tmp_path):
+    sysfs_root = make_sysfs(tmp_path / 'sys')
+    lock_file = str(tmp_path / 'lock')
+    domains = list(range(0x20, 0x40))
+
+    # each process clears the bit of a different domain at the same time,
+    # none of these changes must get lost
+    barrier = multiprocessing.Barrier(len(domains))
+    processes = [
+        multiprocessing.Process(target=_update, args=(sysfs_root, lock_file, [('07.{:04x}'.format(d), '-')], barrier))
+        for d in domains
+    ]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join(30)
+        assert p.exitcode == 0
+
+    expected_aqmask = ALL_BITS
+    for d in domains:
+        expected_aqmask &= ~mask_bit(d)
+
+    assert ApMasks(sysfs_root, lock_file).read() == (ALL_BITS & ~mask_bit(7), expected_aqmask)
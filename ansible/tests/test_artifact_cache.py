@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+# Tests for the artifact_cache module (library/artifact_cache.py),
+# using a local HTTP server supporting range requests.
+
+
+import hashlib
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import artifact_cache
+
+
+ARTIFACT_SIZE = 64 * 1024
+
+
+def artifact(name):
+    return (name.encode('utf-8') * ARTIFACT_SIZE)[:ARTIFACT_SIZE]
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class StubMirrorHandler(BaseHTTPRequestHandler):
+    '''
+    Serves the artifacts of the stub mirror, optionally closing the connection halfway through the first download of an
+    artifact (to be resumed by the module) and updating the artifact afterwards.
+    '''
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        mirror = self.server.mirror
+        data = mirror['artifacts'].get(self.path)
+        mirror['requests'].append((self.path, self.headers.get('Range')))
+
+        if data is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        match = re.match(r'bytes=(\d+)-$', self.headers.get('Range') or '')
+        offset = int(match.group(1)) if match else 0
+
+        self.send_response(206 if offset else 200)
+        if offset:
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(offset, len(data) - 1, len(data)))
+        self.send_header('Content-Length', str(len(data) - offset))
+        self.end_headers()
+
+        if self.path in mirror['interrupted']:
+            mirror['interrupted'].remove(self.path)
+            self.wfile.write(data[offset:len(data) // 2])
+            if self.path in mirror['updates']:
+                mirror['artifacts'][self.path] = mirror['updates'].pop(self.path)
+            self.close_connection = True
+            return
+
+        self.wfile.write(data[offset:])
+
+
+@pytest.fixture
+def stub_mirror():
+    '''
+    Runs the stub mirror and returns its state.
+    '''
+    server = ThreadingHTTPServer(('localhost', 0), StubMirrorHandler)
+    mirror = {
+        'url': 'http://localhost:{}'.format(server.server_address[1]),
+        'artifacts': dict(('/{}'.format(n), artifact(n)) for n in ('a', 'b', 'c')),
+        'interrupted': set(),
+        'updates': {},
+        'requests': [],
+    }
+    server.mirror = mirror
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield mirror
+
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def provide(stub_mirror, tmp_path, run_module, monkeypatch):
+    '''
+    Provides the given artifacts of the stub mirror (verified against their checksums) using the cache in 'tmp_path'.
+    '''
+    monkeypatch.setattr(artifact_cache, 'BACKOFF_INITIAL', 0)
+
+    def run(names, **kwargs):
+        artifacts = [{
+            'url': stub_mirror['url'] + '/' + n,
+            'dest': str(tmp_path / n),
+            'checksum': 'sha256:' + sha256(artifact(n)),
+        } for n in names]
+
+        return run_module(artifact_cache, dict({'artifacts': artifacts, 'cache_dir': str(tmp_path / 'cache')}, **kwargs))
+
+    return run
+
+
+def test_download_and_cache_hit(stub_mirror, tmp_path, provide):
+    result = provide(['a', 'b'])
+
+    assert not result.get('failed'), result
+    assert result['changed']
+    assert [(a['cache_hit'], a['verified'], a['downloaded']) for a in result['artifacts']] == [(False, True, ARTIFACT_SIZE)] * 2
+    assert (tmp_path / 'a').read_bytes() == artifact('a')
+
+    (tmp_path / 'a').unlink()
+    result = provide(['a', 'b'])
+
+    assert result['changed']
+    assert [a['cache_hit'] for a in result['artifacts']] == [True, True]
+    assert (tmp_path / 'a').read_bytes() == artifact('a')
+    assert len(stub_mirror['requests']) == 2
+
+
+def test_interrupted_download_is_resumed(stub_mirror, tmp_path, provide):
+    stub_mirror['interrupted'].add('/a')
+
+    result = provide(['a'])
+
+    assert not result.get('failed'), result
+    assert result['artifacts'][0]['resumed']
+    assert result['artifacts'][0]['downloaded'] == ARTIFACT_SIZE
+    assert (tmp_path / 'a').read_bytes() == artifact('a')
+
+    # the download is resumed where the connection has been closed
+    assert stub_mirror['requests'] == [('/a', None), ('/a', 'bytes={}-'.format(ARTIFACT_SIZE // 2))]
+
+
+def test_checksum_mismatch(stub_mirror, tmp_path, provide, monkeypatch):
+    stub_mirror['artifacts']['/a'] = artifact('x')
+    monkeypatch.setattr(artifact_cache, 'BACKOFF_INITIAL', 10)
+
+    started = time.monotonic()
+    result = provide(['a'], retries=8)
+
+    # the artifact is downloaded again once (from scratch and without backoff), then the module fails
+    assert result['failed']
+    assert 'Checksum mismatch' in result['msg']
+    assert stub_mirror['requests'] == [('/a', None), ('/a', None)]
+    assert time.monotonic() - started < 5
+    assert not (tmp_path / 'a').exists()
+
+
+def test_corrupted_download_is_downloaded_again(stub_mirror, tmp_path, provide):
+    # the artifact is updated on the mirror while its download is interrupted, so the resumed download is corrupted
+    stub_mirror['artifacts']['/a'] = artifact('x')
+    stub_mirror['interrupted'].add('/a')
+    stub_mirror['updates']['/a'] = artifact('a')
+
+    result = provide(['a'])
+
+    assert not result.get('failed'), result
+    assert (tmp_path / 'a').read_bytes() == artifact('a')
+    assert stub_mirror['requests'] == [('/a', None), ('/a', 'bytes={}-'.format(ARTIFACT_SIZE // 2)), ('/a', None)]
+
+
+def test_lru_eviction(stub_mirror, tmp_path, provide):
+    max_size = str(2 * ARTIFACT_SIZE)
+
+    provide(['a'], max_size=max_size)
+    provide(['b'], max_size=max_size)
+
+    # 'a' is used again, so 'b' is the least recently used artifact once 'c' is added
+    result = provide(['a'], max_size=max_size)
+    assert result['artifacts'][0]['cache_hit']
+
+    result = provide(['c'], max_size=max_size)
+
+    assert not result.get('failed'), result
+    assert result['cache'] == {'size': 2 * ARTIFACT_SIZE, 'evicted': [stub_mirror['url'] + '/b']}
+    assert sorted(p.name for p in (tmp_path / 'cache' / 'objects').iterdir()) == sorted(sha256(artifact(n)) for n in ('a', 'c'))
+
+    # artifacts provided by the current module invocation are never evicted
+    result = provide(['a', 'b', 'c'], max_size=max_size)
+
+    assert not result.get('failed'), result
+    assert result['cache']['evicted'] == []
+    assert result['cache']['size'] == 3 * ARTIFACT_SIZE
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+
+# Tests for the cluster_health_info module (library/cluster_health_info.py),
+# using a local stub of the OpenShift API, OAuth and Prometheus servers (HTTPS, self-signed certificate).
+
+
+import base64
+import json
+import shutil
+import ssl
+import subprocess
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import pytest
+
+pytest.importorskip('requests')
+
+import cluster_health_info  # noqa: E402
+
+# the OAuth server certificate isn't verified by the module (see 'ClusterHealthInfoModule._request_token')
+pytestmark = pytest.mark.filterwarnings('ignore:Unverified HTTPS request')
+
+PASSWORD = 'kubeadmin-secret'
+TOKEN = 'sha256~stub-access-token'
+
+
+def node(name, ready):
+    return {'metadata': {'name': name}, 'status': {'conditions': [
+        {'type': 'MemoryPressure', 'status': 'False'},
+        {'type': 'Ready', 'status': ready},
+    ]}}
+
+
+def cluster_operator(name, available):
+    return {'metadata': {'name': name}, 'status': {'conditions': [
+        {'type': 'Available', 'status': available},
+        {'type': 'Degraded', 'status': 'False'},
+    ]}}
+
+
+def alert(name):
+    return {'labels': {'alertname': name}, 'state': 'firing'}
+
+
+class StubClusterHandler(BaseHTTPRequestHandler):
+    '''
+    Serves the API server, OAuth server and Prometheus endpoints used by the module from the state of the stub cluster.
+    '''
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=None, headers=None):
+        data = json.dumps(body if body is not None else {}).encode('utf-8')
+
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        cluster = self.server.cluster
+        path = urlparse(self.path).path
+        cluster['requests'].append(('GET', path))
+
+        if path == '/.well-known/oauth-authorization-server':
+            return self._send(200, {'authorization_endpoint': cluster['url'] + '/oauth/authorize'})
+
+        if path == '/oauth/authorize':
+            if self.headers.get('Authorization') != 'Basic ' + base64.b64encode('kubeadmin:{}'.format(PASSWORD).encode('utf-8')).decode('utf-8'):
+                return self._send(401)
+            return self._send(302, headers={'Location': cluster['url'] + '/oauth/token/implicit#access_token={}&token_type=Bearer'.format(TOKEN)})
+
+        if self.headers.get('Authorization') != 'Bearer {}'.format(TOKEN):
+            return self._send(401)
+
+        if path in cluster['failures']:
+            return self._send(cluster['failures'][path])
+
+        if path == '/apis/user.openshift.io/v1/users/~':
+            return self._send(200, {'metadata': {'name': 'kube:admin'}})
+        if path == '/api/v1/nodes':
+            return self._send(200, {'items': cluster['nodes']})
+        if path == '/apis/config.openshift.io/v1/clusteroperators':
+            return self._send(200, {'items': cluster['cluster_operators']})
+        if path == cluster_health_info.PROMETHEUS_ROUTE_PATH:
+            return self._send(200, {'spec': {'host': urlparse(cluster['url']).netloc}})
+        if path == '/api/v1/alerts':
+            return self._send(200, {'status': 'success', 'data': {'alerts': cluster['alerts']}})
+
+        return self._send(404)
+
+    def do_DELETE(self):
+        self.server.cluster['requests'].append(('DELETE', urlparse(self.path).path))
+        self._send(200)
+
+
+@pytest.fixture(scope='module')
+def certificate(tmp_path_factory):
+    '''
+    Returns the certificate and key files of a self-signed certificate for 'localhost'.
+    '''
+    if not shutil.which('openssl'):
+        pytest.skip('openssl is not installed')
+
+    cert_dir = tmp_path_factory.mktemp('cert')
+    cert_file, key_file = str(cert_dir / 'cert.pem'), str(cert_dir / 'key.pem')
+    subprocess.run([
+        'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+        '-keyout', key_file, '-out', cert_file, '-subj', '/CN=localhost', '-addext', 'subjectAltName=DNS:localhost',
+    ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    return cert_file, key_file
+
+
+@pytest.fixture
+def stub_cluster(tmp_path, certificate):
+    '''
+    Runs the stub cluster and returns its state along with the location of its kubeconfig and password files.
+    '''
+    cert_file, key_file = certificate
+
+    server = ThreadingHTTPServer(('localhost', 0), StubClusterHandler)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_file, key_file)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+
+    cluster = {
+        'url': 'https://localhost:{}'.format(server.server_address[1]),
+        'nodes': [node('master-{}'.format(i), 'True') for i in range(3)] + [node('worker-{}'.format(i), 'True') for i in range(2)],
+        'cluster_operators': [cluster_operator(n, 'True') for n in ('etcd', 'kube-apiserver', 'ingress')],
+        'alerts': [alert('Watchdog')],
+        'failures': {},
+        'requests': [],
+    }
+    server.cluster = cluster
+
+    with open(cert_file, 'rb') as f:
+        ca_data = base64.b64encode(f.read()).decode('utf-8')
+    kubeconfig = tmp_path / 'kubeconfig'
+    kubeconfig.write_text(json.dumps({'clusters': [{'name': 'stub', 'cluster': {'server': cluster['url'], 'certificate-authority-data': ca_data}}]}))
+    (tmp_path / 'kubeadmin-password').write_text(PASSWORD + '\n')
+    cluster['kubeconfig'] = str(kubeconfig)
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield cluster
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_healthy_cluster(stub_cluster, run_module):
+    result = run_module(cluster_health_info, {'kubeconfig': stub_cluster['kubeconfig']})
+
+    assert not result.get('failed'), result
+    health = result['cluster_health']
+    assert health['operational']
+    assert (health['nonready_nodes'], health['unavailable_cos'], health['alerts']) == ([], [], [])
+    assert all(p['success'] and p['error'] == '' for p in health['probes'].values())
+
+    # a single OAuth access token is requested and revoked again (by the name it is stored under)
+    assert stub_cluster['requests'].count(('GET', '/oauth/authorize')) == 1
+    assert [r for r in stub_cluster['requests'] if r[0] == 'DELETE'] == [
+        ('DELETE', '/apis/oauth.openshift.io/v1/oauthaccesstokens/sha256~O3qALL0X8QHXqbYF0IAXF22ioncm-hVf9MaNX8psZ3o'),
+    ]
+
+
+def test_unhealthy_cluster(stub_cluster, run_module):
+    stub_cluster['nodes'] += [node('worker-2', 'False'), node('worker-3', 'Unknown')]
+    stub_cluster['cluster_operators'].append(cluster_operator('monitoring', 'False'))
+    stub_cluster['alerts'] += [alert('KubePodCrashLooping'), alert('KubePodCrashLooping'), alert('AlertmanagerReceiversNotConfigured')]
+
+    result = run_module(cluster_health_info, {'kubeconfig': stub_cluster['kubeconfig']})
+
+    assert not result.get('failed'), result
+    health = result['cluster_health']
+    assert not health['operational']
+    assert health['nonready_nodes'] == ['worker-2', 'worker-3']
+    assert health['unavailable_cos'] == ['monitoring']
+    assert health['alerts'] == ['KubePodCrashLooping']
+
+
+def test_failed_probe(stub_cluster, run_module):
+    stub_cluster['failures']['/apis/config.openshift.io/v1/clusteroperators'] = 503
+
+    result = run_module(cluster_health_info, {'kubeconfig': stub_cluster['kubeconfig']})
+
+    # a failed probe doesn't let the module fail, but the cluster isn't considered to be operational
+    assert not result.get('failed'), result
+    health = result['cluster_health']
+    assert not health['operational']
+    assert not health['probes']['cluster_operators']['success']
+    assert 'HTTP status 503' in health['probes']['cluster_operators']['error']
+    assert health['probes']['nodes']['success']
+
+
+@pytest.mark.parametrize('nodes', [
+    {'kind': 'NodeList'},
+    [{'status': {'conditions': [{'type': 'Ready', 'status': 'False'}]}}],
+    [{'metadata': {'name': 'worker-2'}, 'status': {'conditions': {'type': 'Ready', 'status': 'False'}}}],
+    [{'metadata': {'name': 'worker-2'}, 'status': {'conditions': [{'status': 'False'}]}}],
+    ['worker-2'],
+])
+def test_malformed_nodes(stub_cluster, run_module, nodes):
+    stub_cluster['nodes'] = nodes
+
+    result = run_module(cluster_health_info, {'kubeconfig': stub_cluster['kubeconfig']})
+
+    # malformed k8s objects must never be mistaken for healthy ones
+    assert not result.get('failed'), result
+    assert not result['cluster_health']['operational']
+    assert not result['cluster_health']['probes']['nodes']['success']
+
+
+def test_node_without_ready_condition(stub_cluster, run_module):
+    stub_cluster['nodes'].append({'metadata': {'name': 'worker-2'}, 'status': {}})
+
+    result = run_module(cluster_health_info, {'kubeconfig': stub_cluster['kubeconfig']})
+
+    assert not result['cluster_health']['operational']
+    assert result['cluster_health']['nonready_nodes'] == ['worker-2']
+
+
+def test_token_cache(stub_cluster, tmp_path, run_module):
+    args = {'kubeconfig': stub_cluster['kubeconfig'], 'token_cache': str(tmp_path / 'token')}
+
+    for _ in range(2):
+        result = run_module(cluster_health_info, args)
+        assert result['cluster_health']['operational'], result
+
+    # the cached OAuth access token is reused (and not revoked)
+    assert stub_cluster['requests'].count(('GET', '/oauth/authorize')) == 1
+    assert not any(r[0] == 'DELETE' for r in stub_cluster['requests'])
+    assert (tmp_path / 'token').read_text() == TOKEN
+
+
+def test_invalid_credentials(stub_cluster, tmp_path, run_module):
+    password_file = tmp_path / 'wrong-password'
+    password_file.write_text('wrong')
+
+    result = run_module(cluster_health_info, {'kubeconfig': stub_cluster['kubeconfig'], 'password_file': str(password_file)})
+
+    assert result['failed']
+    assert 'Unable to log in as kubeadmin' in result['msg']
+
+
+def test_invalid_kubeconfig(tmp_path, run_module):
+    kubeconfig = tmp_path / 'kubeconfig'
+    kubeconfig.write_text('clusters: []\n')
+
+    result = run_module(cluster_health_info, {'kubeconfig': str(kubeconfig)})
+
+    assert result['failed']
+    assert 'Unable to read kubeconfig' in result['msg']
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+# Tests for the cluster_nodes_facts module (library/cluster_nodes_facts.py),
+# using the libvirt test driver ('test:///default').
+
+
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from conftest import define_domain
+
+cluster_nodes_facts = pytest.importorskip('cluster_nodes_facts')
+
+
+CLUSTER_ID = 'ocp1-qf2b5'
+
+DOMAIN_NAMES = [
+    'ocp1-qf2b5-worker-0-x8k2p',
+    'ocp1-qf2b5-master-0',
+    'ocp1-qf2b5-worker-0-456r9',
+    'ocp1-qf2b5-master-1',
+    'ocp2-zz9zz-worker-0-abcde',
+]
+
+
+@pytest.fixture
+def cluster_domains(libvirt_conn):
+    for name in DOMAIN_NAMES:
+        define_domain(libvirt_conn, name)
+
+    # the order in which libvirt lists the libvirt domains of the cluster
+    return [d.name() for d in libvirt_conn.listAllDomains(0) if d.name().startswith(CLUSTER_ID + '-')]
+
+
+def get_role_metadata(conn, name):
+    import libvirt
+
+    domain_xml = ET.fromstring(conn.lookupByName(name).XMLDesc(libvirt.VIR_DOMAIN_XML_INACTIVE))
+    metadata = domain_xml.find('metadata/{{{}}}node'.format(cluster_nodes_facts.CLUSTER_NODE_METADATA_NAMESPACE))
+
+    return metadata.get('role') if metadata is not None else None
+
+
+def test_cluster_nodes(libvirt_conn, cluster_domains, run_module):
+    result = run_module(cluster_nodes_facts, {'uri': 'test:///default', 'cluster_id': CLUSTER_ID})
+
+    assert not result.get('failed'), result
+    assert result['changed']
+
+    # the cluster nodes are kept in the order listed by libvirt (other roles refer to the worker nodes by index)
+    facts = result['ansible_facts']
+    assert [n['name'] for n in facts['cluster_nodes']] == cluster_domains
+    assert facts['worker_domains'] == [n for n in cluster_domains if '-worker-' in n]
+    assert facts['master_domains'] == [n for n in cluster_domains if '-master-' in n]
+
+    # the roles are recorded in the metadata of the libvirt domains
+    assert [get_role_metadata(libvirt_conn, n) for n in cluster_domains] == [n.split('-')[2] for n in cluster_domains]
+    assert get_role_metadata(libvirt_conn, 'ocp2-zz9zz-worker-0-abcde') is None
+
+    result = run_module(cluster_nodes_facts, {'uri': 'test:///default', 'cluster_id': CLUSTER_ID})
+
+    assert not result['changed']
+    assert result['ansible_facts'] == facts
+
+
+def test_check_mode(libvirt_conn, cluster_domains, run_module):
+    result = run_module(cluster_nodes_facts, {'uri': 'test:///default', 'cluster_id': CLUSTER_ID}, check_mode=True)
+
+    assert not result.get('failed'), result
+    assert not result['changed']
+    assert [n['role'] for n in result['ansible_facts']['cluster_nodes']] == [n.split('-')[2] for n in cluster_domains]
+    assert [get_role_metadata(libvirt_conn, n) for n in cluster_domains] == [None] * len(cluster_domains)
+
+
+def test_cache(libvirt_conn, cluster_domains, tmp_path, run_module):
+    args = {'uri': 'test:///default', 'cluster_id': CLUSTER_ID, 'cache_file': str(tmp_path / 'cluster_nodes.json')}
+
+    result = run_module(cluster_nodes_facts, args)
+    assert not result['cached']
+
+    result = run_module(cluster_nodes_facts, args)
+    assert result['cached']
+    assert [n['name'] for n in result['ansible_facts']['cluster_nodes']] == cluster_domains
+
+    # defining another libvirt domain of the cluster invalidates the cache
+    define_domain(libvirt_conn, 'ocp1-qf2b5-worker-0-zzzzz')
+
+    result = run_module(cluster_nodes_facts, args)
+    assert not result['cached']
+    assert 'ocp1-qf2b5-worker-0-zzzzz' in result['ansible_facts']['worker_domains']
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+# Tests for the crypto adapter inventory of the crypto role (roles/crypto/module_utils/crypto_inventory.py),
+# using captured 'lszcrypt -V' output and fake sysfs trees.
+
+
+import os
+
+import pytest
+
+from ansible.module_utils.crypto_inventory import CryptoInventory, CryptoInventoryException
+from conftest import read_fixture
+
+
+class FakeModule(object):
+    def __init__(self, output, rc=0):
+        self.output = output
+        self.rc = rc
+        self.commands = []
+
+    def run_command(self, cmd):
+        self.commands.append(cmd)
+        return self.rc, self.output, '' if self.rc == 0 else 'lszcrypt: error'
+
+
+def make_sysfs(root, cards):
+    '''
+    Creates a fake AP bus device tree (<root>/bus/ap/devices) containing the given cards
+    (card ID -> dictionary of card attributes, with the queues in 'queues': queue ID -> dictionary of queue attributes).
+    The special attribute 'driver' becomes a symbolic link to the driver of the device.
+    '''
+    devices_dir = os.path.join(str(root), 'bus', 'ap', 'devices')
+    drivers_dir = os.path.join(str(root), 'bus', 'ap', 'drivers')
+
+    def make_device(name, attributes):
+        device_dir = os.path.join(devices_dir, name)
+        os.makedirs(device_dir)
+
+        for attribute, value in attributes.items():
+            if attribute == 'driver':
+                os.makedirs(os.path.join(drivers_dir, value), exist_ok=True)
+                os.symlink(os.path.join(drivers_dir, value), os.path.join(device_dir, 'driver'))
+            else:
+                with open(os.path.join(device_dir, attribute), 'w') as f:
+                    f.write('{}\n'.format(value))
+
+    for card_id, card in cards.items():
+        card = dict(card)
+        queues = card.pop('queues', {})
+
+        make_device('card' + card_id, dict({
+            'type': 'CEX7P', 'ap_functions': '0x04a00000', 'online': 1, 'config': 1, 'request_count': 0,
+            'requestq_count': 0, 'pendingq_count': 0, 'hwtype': 13, 'depth': '08', 'driver': 'cex4card',
+        }, **card))
+
+        for queue_id, queue in queues.items():
+            make_device(queue_id, dict({
+                'online': 1, 'request_count': 0, 'requestq_count': 0, 'pendingq_count': 0, 'driver': 'cex4queue',
+            }, **queue))
+
+    return str(root)
+
+
+def test_lszcrypt_output_is_indexed_by_card_and_domain():
+    inventory = CryptoInventory.from_lszcrypt_output(read_fixture('lszcrypt', 'lszcrypt_V.txt'))
+
+    assert inventory.cards() == ['01', '07', '0b']
+    assert inventory.domains() == ['01.0034', '07.0029', '07.002a', '07.002b', '0b.0034']
+    assert inventory.get('07.0029') == {
+        'card': '07.0029', 'type': 'CEX7P', 'mode': 'EP11-Coproc', 'status': 'online', 'requests': '9', 'pending': '0',
+        'hwtype': '13', 'qdepth': '08', 'functions': '-----XN-F-', 'driver': 'vfio_ap',
+    }
+    assert inventory.get_detail('0b', 'status') == 'deconfig'
+    assert inventory.get_detail('0b.0034', 'driver') == '-no-driver-'
+
+
+def test_lszcrypt_output_header_and_blank_lines_are_skipped():
+    inventory = CryptoInventory.from_lszcrypt_output(read_fixture('lszcrypt', 'lszcrypt_V.txt'))
+
+    assert not any(a.startswith('CARD') or a.startswith('-') for a in inventory.adapters)
+    assert '' not in inventory
+
+
+def test_lszcrypt_output_card_rollups():
+    inventory = CryptoInventory.from_lszcrypt_output(read_fixture('lszcrypt', 'lszcrypt_V.txt'))
+
+    assert inventory.domains('07') == ['07.0029', '07.002a', '07.002b']
+    assert inventory.get('07')['domain_status'] == {'online': 2, 'offline': 1}
+    assert inventory.get('0b')['domain_status'] == {'deconfig': 1}
+    assert inventory.domains('99') == []
+
+
+def test_lszcrypt_output_without_cards():
+
+    # 'lszcrypt -V <domain>' (and older s390-tools versions with the 'CARD.DOMAIN' header) list domains only
+    inventory = CryptoInventory.from_lszcrypt_output(read_fixture('lszcrypt', 'lszcrypt_V_domains_only.txt'))
+
+    assert inventory.cards() == []
+    assert inventory.domains() == ['07.0029', '07.002a']
+    assert inventory.get_detail('07.002a', 'pending') == '2'
+
+
+def test_lszcrypt_output_missing_detail():
+    inventory = CryptoInventory.from_lszcrypt_output(read_fixture('lszcrypt', 'lszcrypt_V.txt'))
+
+    with pytest.raises(CryptoInventoryException):
+        inventory.get_detail('07.00ff', 'status')
+
+
+def test_lszcrypt_runs_once():
+    module = FakeModule(read_fixture('lszcrypt', 'lszcrypt_V.txt'))
+
+    inventory = CryptoInventory.from_lszcrypt(module, '/usr/sbin/lszcrypt')
+
+    assert module.commands == ['/usr/sbin/lszcrypt -V']
+    assert '07.002b' in inventory
+
+
+def test_lszcrypt_failure():
+    with pytest.raises(CryptoInventoryException):
+        CryptoInventory.from_lszcrypt(FakeModule('', rc=1), '/usr/sbin/lszcrypt')
+
+
+def test_sysfs(tmp_path):
+    sysfs_root = make_sysfs(tmp_path, {
+        '07': {
+            'request_count': 12, 'requestq_count': 1, 'pendingq_count': 2,
+            'queues': {
+                '07.0029': {'request_count': 9, 'driver': 'vfio_ap'},
+                '07.002a': {'request_count': 3},
+                '07.002b': {'online': 0},
+            },
+        },
+        '0b': {
+            'type': 'CEX7A', 'ap_functions': '0x08000000', 'config': 0,
+            'queues': {
+                '0b.0034': {},
+            },
+        },
+    })
+
+    inventory = CryptoInventory.from_sysfs(sysfs_root)
+
+    assert inventory.cards() == ['07', '0b']
+    assert inventory.get('07') == {
+        'card': '07', 'type': 'CEX7P', 'mode': 'EP11-Coproc', 'status': 'online', 'requests': '12', 'pending': '3',
+        'hwtype': '13', 'qdepth': '08', 'functions': '0x04a00000', 'driver': 'cex4card',
+        'domains': ['07.0029', '07.002a', '07.002b'], 'domain_status': {'online': 2, 'offline': 1},
+    }
+    assert inventory.get_detail('07.0029', 'driver') == 'vfio_ap'
+    assert inventory.get_detail('07.0029', 'mode') == 'EP11-Coproc'
+    assert inventory.get_detail('07.002b', 'status') == 'offline'
+
+    # the queues of a deconfigured card are deconfigured as well
+    assert inventory.get_detail('0b', 'mode') == 'Accelerator'
+    assert inventory.get_detail('0b', 'status') == 'deconfig'
+    assert inventory.get_detail('0b.0034', 'status') == 'deconfig'
+
+
+def test_sysfs_without_driver(tmp_path):
+    sysfs_root = make_sysfs(tmp_path, {'07': {'queues': {'07.0029': {}}}})
+    os.remove(os.path.join(sysfs_root, 'bus', 'ap', 'devices', '07.0029', 'driver'))
+
+    assert CryptoInventory.from_sysfs(sysfs_root).get_detail('07.0029', 'driver') == '-no-driver-'
+
+
+def test_sysfs_missing_devices(tmp_path):
+    with pytest.raises(CryptoInventoryException):
+        CryptoInventory.from_sysfs(str(tmp_path))
+
+
+def test_sysfs_incomplete_attributes(tmp_path):
+    sysfs_root = make_sysfs(tmp_path, {'07': {'queues': {'07.0029': {}}}})
+    os.remove(os.path.join(sysfs_root, 'bus', 'ap', 'devices', '07.0029', 'request_count'))
+
+    with pytest.raises(CryptoInventoryException):
+        CryptoInventory.from_sysfs(sysfs_root)
+
+
+def test_load_sysfs(tmp_path):
+    sysfs_root = make_sysfs(tmp_path, {'07': {'queues': {'07.0029': {}}}})
+    module = FakeModule(read_fixture('lszcrypt', 'lszcrypt_V.txt'))
+
+    inventory = CryptoInventory.load(module, '/usr/sbin/lszcrypt', 'sysfs', sysfs_root, ['07.0029'])
+
+    assert module.commands == []
+    assert inventory.cards() == ['07']
+
+
+@pytest.mark.parametrize('incomplete', ['missing_sysfs', 'missing_adapter', 'missing_attribute'])
+def test_load_sysfs_falls_back_to_lszcrypt(tmp_path, incomplete):
+    if incomplete == 'missing_sysfs':
+        sysfs_root = str(tmp_path)
+    else:
+        sysfs_root = make_sysfs(tmp_path, {'07': {'queues': {'07.0029': {}}}})
+    if incomplete == 'missing_attribute':
+        os.remove(os.path.join(sysfs_root, 'bus', 'ap', 'devices', 'card07', 'ap_functions'))
+    module = FakeModule(read_fixture('lszcrypt', 'lszcrypt_V.txt'))
+
+    inventory = CryptoInventory.load(module, '/usr/sbin/lszcrypt', 'sysfs', sysfs_root, ['07.0029', '07.002a'])
+
+    assert module.commands == ['/usr/sbin/lszcrypt -V']
+    assert inventory.get_detail('07.002a', 'requests') == '3'
+
+
+def test_load_sysfs_fallback_without_lszcrypt(tmp_path):
+    with pytest.raises(CryptoInventoryException):
+        CryptoInventory.load(FakeModule(''), None, 'sysfs', str(tmp_path), ['07.0029'])
+
+
+def test_load_lszcrypt_ignores_sysfs(tmp_path):
+    sysfs_root = make_sysfs(tmp_path, {'07': {'queues': {'07.0029': {}}}})
+    module = FakeModule(read_fixture('lszcrypt', 'lszcrypt_V.txt'))
+
+    inventory = CryptoInventory.load(module, '/usr/sbin/lszcrypt', 'lszcrypt', sysfs_root)
+
+    assert module.commands == ['/usr/sbin/lszcrypt -V']
+    assert inventory.cards() == ['01', '07', '0b']
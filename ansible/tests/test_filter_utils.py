@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+# Tests for the 'select_resources' filter (filter_plugins/FilterUtils.py)
+# and the selection of the cluster_health_info module (library/cluster_health_info.py) implementing the same logic.
+
+
+import pytest
+
+from ansible.errors import AnsibleFilterError
+from FilterUtils import FilterModule
+
+cluster_health_info = pytest.importorskip('cluster_health_info')
+
+
+def node(name, *conditions):
+    return {'metadata': {'name': name}, 'status': {'conditions': [{'type': t, 'status': s} for t, s in conditions]}}
+
+
+NODES = [
+    node('ready', ('MemoryPressure', 'False'), ('Ready', 'True')),
+    node('not-ready', ('MemoryPressure', 'False'), ('Ready', 'False')),
+    node('unknown', ('Ready', 'Unknown')),
+    node('no-ready-condition', ('MemoryPressure', 'False')),
+    {'metadata': {'name': 'no-status'}},
+    node('memory-pressure', ('MemoryPressure', 'True'), ('Ready', 'True')),
+]
+
+MALFORMED = [
+    {'kind': 'NodeList'},
+    [{'status': {'conditions': [{'type': 'Ready', 'status': 'False'}]}}],
+    [{'metadata': {'name': 'worker-2'}, 'status': {'conditions': {'type': 'Ready', 'status': 'False'}}}],
+    [{'metadata': {'name': 'worker-2'}, 'status': {'conditions': [{'status': 'False'}]}}],
+    [{'metadata': {'name': 'worker-2'}, 'status': {'conditions': [{'type': 'Ready', 'status': None}]}}],
+    ['worker-2'],
+]
+
+
+def select_resources(items, conditions):
+    return FilterModule().filters()['select_resources'](items, conditions)
+
+
+@pytest.mark.parametrize('conditions, selected', [
+    ({'Ready': 'False|Unknown'}, ['not-ready', 'unknown', 'no-ready-condition', 'no-status']),
+    ({'Ready': ['False']}, ['not-ready']),
+    ({'Ready': 'False', 'MemoryPressure': 'True'}, ['not-ready', 'memory-pressure']),
+    ({}, []),
+])
+def test_select_resources(conditions, selected):
+    assert select_resources(NODES, conditions) == selected
+
+
+@pytest.mark.parametrize('items', MALFORMED)
+def test_malformed_resources(items):
+    with pytest.raises(AnsibleFilterError):
+        select_resources(items, {'Ready': 'False|Unknown'})
+
+    with pytest.raises(cluster_health_info.ClusterHealthException):
+        cluster_health_info.ClusterHealthInfoModule._select_resources(items, cluster_health_info.NONREADY_NODE_CONDITIONS)
+
+
+@pytest.mark.parametrize('conditions', [cluster_health_info.NONREADY_NODE_CONDITIONS, cluster_health_info.UNAVAILABLE_CO_CONDITIONS])
+def test_module_selection_matches_filter(conditions):
+    assert cluster_health_info.ClusterHealthInfoModule._select_resources(NODES, conditions) == select_resources(NODES, conditions)
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+
+# Tests for the haproxy_runtime_servers module (roles/networking/library/haproxy_runtime_servers.py),
+# using a stub of the haproxy runtime API listening on a Unix socket.
+
+
+import os
+import shutil
+import socketserver
+import tempfile
+import threading
+import time
+
+import pytest
+
+import haproxy_runtime_servers
+
+
+CONFIG = '''
+global
+  stats socket /var/lib/haproxy/ocp-kvm-ipi.sock mode 600 level admin
+
+frontend ocp1-https
+  mode tcp
+  bind *:443
+  use_backend ocp1-https
+
+backend ocp1-https
+  mode tcp
+  balance source
+  hash-type consistent
+{servers}
+'''
+
+SERVER_STATE_FIELDS = [
+    'be_id', 'be_name', 'srv_id', 'srv_name', 'srv_addr', 'srv_op_state', 'srv_admin_state', 'srv_uweight',
+    'srv_iweight', 'srv_time_since_last_change', 'srv_check_status', 'srv_check_result', 'srv_check_health',
+    'srv_check_state', 'srv_agent_state', 'bk_f_forced_id', 'srv_f_forced_id', 'srv_fqdn', 'srv_port', 'srvrecord',
+]
+
+
+class StubRuntimeApiHandler(socketserver.StreamRequestHandler):
+    '''
+    Answers a single line of (semicolon-separated) runtime API commands from the state of the stub haproxy,
+    then closes the connection (same as haproxy does in non-interactive mode).
+    '''
+    def handle(self):
+        haproxy = self.server.haproxy
+        line = self.rfile.readline().decode('utf-8').strip()
+
+        out = ''
+        for command in [c.strip() for c in line.split(';') if c.strip()]:
+            haproxy['commands'].append(command)
+            out += self._answer(haproxy, command)
+
+        self.wfile.write(out.encode('utf-8'))
+
+    def _answer(self, haproxy, command):
+        for prefix, reply in haproxy['errors'].items():
+            if command.startswith(prefix):
+                return reply
+
+        words = command.split()
+        servers = haproxy['servers']
+
+        if command == 'show info':
+            return 'Name: HAProxy\nVersion: {}\nUptime_sec: 42\n\n'.format(haproxy['version'])
+
+        if command.startswith('show servers state'):
+            backend = words[3]
+            if backend not in servers:
+                return "Can't find backend.\n"
+            lines = ['1', '# ' + ' '.join(SERVER_STATE_FIELDS)]
+            for i, (name, s) in enumerate(servers[backend].items()):
+                values = dict.fromkeys(SERVER_STATE_FIELDS, '0')
+                values.update({'be_id': '3', 'be_name': backend, 'srv_id': str(i + 1), 'srv_name': name,
+                               'srv_addr': s['address'], 'srv_port': s['port'], 'srv_fqdn': '-', 'srvrecord': '-'})
+                lines.append(' '.join(values[f] for f in SERVER_STATE_FIELDS))
+            return '\n'.join(lines) + '\n\n'
+
+        if command == 'show stat':
+            lines = ['# pxname,svname,qcur,qmax,scur,smax,slim,stot']
+            for backend, backend_servers in servers.items():
+                for name, s in backend_servers.items():
+                    sessions = s['sessions'].pop(0) if len(s['sessions']) > 1 else s['sessions'][0]
+                    lines.append('{},{},0,0,{},0,,0'.format(backend, name, sessions))
+                lines.append('{},BACKEND,0,0,0,0,,0'.format(backend))
+            return '\n'.join(lines) + '\n\n'
+
+        if command == 'experimental-mode on':
+            return ''
+
+        if haproxy['version'] < '2.4' and words[0] in ['add', 'del']:
+            return 'Unknown command. Please enter one of the following commands only :\n  help           : this message\n'
+
+        backend, _, name = words[2].partition('/')
+
+        if words[:2] == ['set', 'server']:
+            server = servers[backend][name]
+            old = (server['address'], server['port'])
+            server.update({'address': words[4], 'port': words[6]})
+            return "IP changed from '{}' to '{}', port changed from '{}' to '{}' by 'stats socket command'\n".format(
+                old[0], words[4], old[1], words[6])
+
+        if words[:2] == ['add', 'server']:
+            address, _, port = words[3].rpartition(':')
+            servers[backend][name] = {'address': address, 'port': port, 'state': 'maint', 'sessions': [0]}
+            return 'New server registered.\n'
+
+        if words[:2] in [['enable', 'server'], ['disable', 'server']]:
+            servers[backend][name]['state'] = 'ready' if words[0] == 'enable' else 'maint'
+            return ''
+
+        if words[:2] == ['enable', 'health']:
+            return ''
+
+        if words[:2] == ['del', 'server']:
+            del servers[backend][name]
+            return 'Server deleted.\n'
+
+        return 'Unknown command.\n'
+
+
+@pytest.fixture
+def stub_haproxy(monkeypatch):
+    '''
+    Runs the stub haproxy runtime API and returns the state of the stub haproxy (running the servers of backend
+    'ocp1-https' given in the configuration file 'config').
+    '''
+    monkeypatch.setattr(haproxy_runtime_servers, 'DRAIN_POLL_INTERVAL', 0.05)
+
+    # Unix socket paths are limited to about 100 characters
+    temp_dir = tempfile.mkdtemp(prefix='haproxy')
+    server = socketserver.ThreadingUnixStreamServer(os.path.join(temp_dir, 'api.sock'), StubRuntimeApiHandler)
+    haproxy = {
+        'socket': server.server_address,
+        'config': os.path.join(temp_dir, 'haproxy.cfg'),
+        'version': '2.6.6-274d1a4',
+        'servers': {'ocp1-https': {
+            'ocp1-worker-0': {'address': '192.168.126.51', 'port': '443', 'state': 'ready', 'sessions': [0]},
+            'ocp1-worker-1': {'address': '192.168.126.52', 'port': '443', 'state': 'ready', 'sessions': [0]},
+        }},
+        'errors': {},
+        'commands': [],
+    }
+    server.haproxy = haproxy
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield haproxy
+
+    server.shutdown()
+    server.server_close()
+    shutil.rmtree(temp_dir)
+
+
+def apply_config(stub_haproxy, run_module, servers, check_mode=False, **kwargs):
+    with open(stub_haproxy['config'], 'w') as f:
+        f.write(CONFIG.format(servers='\n'.join('  server {} {} check'.format(n, a) for n, a in servers)))
+
+    args = dict({'config': stub_haproxy['config'], 'backends': ['ocp1-https'], 'socket': stub_haproxy['socket']}, **kwargs)
+    return run_module(haproxy_runtime_servers, args, check_mode=check_mode)
+
+
+def modifying_commands(stub_haproxy):
+    return [c for c in stub_haproxy['commands'] if not c.startswith('show')]
+
+
+def test_unchanged(stub_haproxy, run_module):
+    result = apply_config(stub_haproxy, run_module, [('ocp1-worker-0', '192.168.126.51:443'), ('ocp1-worker-1', '192.168.126.52:443')])
+
+    assert not result.get('failed'), result
+    assert not result['changed']
+    assert not result['reload_required']
+    assert modifying_commands(stub_haproxy) == []
+
+
+def test_update(stub_haproxy, run_module):
+    result = apply_config(stub_haproxy, run_module, [('ocp1-worker-0', '192.168.126.61:443'), ('ocp1-worker-1', '192.168.126.52:443')])
+
+    assert not result.get('failed'), result
+    assert result['changed']
+    assert not result['reload_required'], result['reason']
+    assert result['updated'] == ['ocp1-https/ocp1-worker-0']
+    assert modifying_commands(stub_haproxy) == ['set server ocp1-https/ocp1-worker-0 addr 192.168.126.61 port 443']
+    assert stub_haproxy['servers']['ocp1-https']['ocp1-worker-0']['address'] == '192.168.126.61'
+
+
+@pytest.mark.parametrize('version, experimental', [('2.6.6-274d1a4', False), ('2.4.22', True)])
+def test_add(stub_haproxy, run_module, version, experimental):
+    stub_haproxy['version'] = version
+
+    result = apply_config(stub_haproxy, run_module, [
+        ('ocp1-worker-0', '192.168.126.51:443'), ('ocp1-worker-1', '192.168.126.52:443'), ('ocp1-worker-2', '192.168.126.53:443'),
+    ])
+
+    assert not result.get('failed'), result
+    assert result['changed']
+    assert not result['reload_required'], result['reason']
+    assert result['added'] == ['ocp1-https/ocp1-worker-2']
+
+    # the added server is enabled (along with its health check) once it's fully set up
+    assert modifying_commands(stub_haproxy) == (['experimental-mode on'] if experimental else []) + [
+        'add server ocp1-https/ocp1-worker-2 192.168.126.53:443 check',
+        'enable health ocp1-https/ocp1-worker-2',
+        'enable server ocp1-https/ocp1-worker-2',
+    ]
+    assert stub_haproxy['servers']['ocp1-https']['ocp1-worker-2']['state'] == 'ready'
+
+
+def test_remove_drained(stub_haproxy, run_module):
+    stub_haproxy['servers']['ocp1-https']['ocp1-worker-1']['sessions'] = [2, 1, 0]
+
+    result = apply_config(stub_haproxy, run_module, [('ocp1-worker-0', '192.168.126.51:443')], drain_timeout=10)
+
+    assert not result.get('failed'), result
+    assert result['removed'] == ['ocp1-https/ocp1-worker-1']
+
+    # the server is deleted once its connections have been closed
+    assert modifying_commands(stub_haproxy) == ['disable server ocp1-https/ocp1-worker-1', 'del server ocp1-https/ocp1-worker-1']
+    assert stub_haproxy['commands'].count('show stat') == 3
+    assert 'ocp1-worker-1' not in stub_haproxy['servers']['ocp1-https']
+
+
+def test_remove_drain_timeout(stub_haproxy, run_module):
+    stub_haproxy['servers']['ocp1-https']['ocp1-worker-1']['sessions'] = [2]
+
+    started = time.monotonic()
+    result = apply_config(stub_haproxy, run_module, [('ocp1-worker-0', '192.168.126.51:443')], drain_timeout=1)
+
+    assert not result.get('failed'), result
+    assert 1 <= time.monotonic() - started < 5
+    assert result['removed'] == ['ocp1-https/ocp1-worker-1']
+    assert not result['reload_required']
+
+    # the server still having connections is kept in maintenance mode
+    assert modifying_commands(stub_haproxy) == ['disable server ocp1-https/ocp1-worker-1']
+    assert stub_haproxy['servers']['ocp1-https']['ocp1-worker-1']['state'] == 'maint'
+
+
+def test_old_version_requires_reload(stub_haproxy, run_module):
+    stub_haproxy['version'] = '2.2.19'
+
+    result = apply_config(stub_haproxy, run_module, [('ocp1-worker-0', '192.168.126.51:443'), ('ocp1-worker-2', '192.168.126.53:443')])
+
+    assert not result.get('failed'), result
+    assert result['reload_required']
+    assert 'haproxy 2.2.19 does not support adding or removing servers at runtime' in result['reason']
+    assert modifying_commands(stub_haproxy) == []
+
+
+def test_error_reply_requires_reload(stub_haproxy, run_module):
+    stub_haproxy['errors']['add server'] = "Already exists a server with the same name in backend.\n"
+
+    result = apply_config(stub_haproxy, run_module, [
+        ('ocp1-worker-0', '192.168.126.51:443'), ('ocp1-worker-1', '192.168.126.52:443'), ('ocp1-worker-2', '192.168.126.53:443'),
+    ])
+
+    assert not result.get('failed'), result
+    assert result['reload_required']
+    assert 'runtime API command failed' in result['reason']
+    assert 'Already exists a server' in result['reason']
+    assert result['added'] == []
+
+
+def test_unknown_backend_requires_reload(stub_haproxy, run_module):
+    del stub_haproxy['servers']['ocp1-https']
+
+    result = apply_config(stub_haproxy, run_module, [('ocp1-worker-0', '192.168.126.51:443')])
+
+    assert result['reload_required']
+    assert 'backend ocp1-https added or removed' in result['reason']
+
+
+def test_runtime_api_not_available(stub_haproxy, run_module):
+    stub_haproxy['socket'] = stub_haproxy['socket'] + '.missing'
+
+    result = apply_config(stub_haproxy, run_module, [('ocp1-worker-0', '192.168.126.51:443')])
+
+    assert not result.get('failed'), result
+    assert result['reload_required']
+    assert 'runtime API not available' in result['reason']
+
+
+def test_check_mode(stub_haproxy, run_module):
+    result = apply_config(stub_haproxy, run_module, [('ocp1-worker-0', '192.168.126.61:443'), ('ocp1-worker-2', '192.168.126.53:443')], check_mode=True)
+
+    assert not result.get('failed'), result
+    assert result['changed']
+    assert (result['added'], result['updated'], result['removed']) == (
+        ['ocp1-https/ocp1-worker-2'], ['ocp1-https/ocp1-worker-0'], ['ocp1-https/ocp1-worker-1'])
+    assert modifying_commands(stub_haproxy) == []
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+# Tests for the error handling of the k8s_wait_for module (library/k8s_wait_for.py),
+# using a fake dynamic k8s client.
+
+
+import time
+
+import pytest
+
+pytest.importorskip('kubernetes')
+
+import k8s_wait_for  # noqa: E402
+
+import urllib3  # noqa: E402
+from kubernetes.client.exceptions import ApiException  # noqa: E402
+from kubernetes.dynamic.exceptions import ResourceNotFoundError  # noqa: E402
+
+
+TIMEOUT = 30
+
+
+def node(name, ready):
+    return {'metadata': {'name': name}, 'status': {'conditions': [{'type': 'Ready', 'status': ready}]}}
+
+
+class FakeCollection(object):
+    def __init__(self, items, resource_version):
+        self.items = items
+        self.resource_version = resource_version
+
+    def to_dict(self):
+        return {'metadata': {'resourceVersion': self.resource_version}, 'items': self.items}
+
+
+class FakeResources(object):
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, api_version, kind):
+        self.client.requests.append(('resource', kind))
+        self.client.raise_next('resource')
+
+        return kind
+
+
+class FakeDynamicClient(object):
+    '''
+    Serves the given list of k8s objects and the given watch events, failing with the given errors first
+    (a list of errors per type of request: 'resource', 'list' and 'watch').
+    '''
+    def __init__(self, objects, events=(), errors=None):
+        self.objects = objects
+        self.events = list(events)
+        self.errors = errors or {}
+        self.requests = []
+        self.resources = FakeResources(self)
+
+    def raise_next(self, request):
+        if self.errors.get(request):
+            raise self.errors[request].pop(0)
+
+    def get(self, resource, **kwargs):
+        self.requests.append(('list', resource))
+        self.raise_next('list')
+
+        return FakeCollection(list(self.objects), '1')
+
+    def watch(self, resource, **kwargs):
+        self.requests.append(('watch', resource))
+        self.raise_next('watch')
+
+        while self.events:
+            yield self.events.pop(0)
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    '''
+    Lets the module use the fake dynamic k8s client set via the returned function.
+    '''
+    clients = {}
+
+    monkeypatch.setattr(k8s_wait_for, 'BACKOFF_INITIAL', 0.01)
+    monkeypatch.setattr(k8s_wait_for.config, 'new_client_from_config', lambda config_file: None)
+    monkeypatch.setattr(k8s_wait_for.dynamic, 'DynamicClient', lambda api_client: clients['client'])
+
+    def set_client(client):
+        clients['client'] = client
+        return client
+
+    return set_client
+
+
+def wait_for_node(run_module, timeout=TIMEOUT):
+    return run_module(k8s_wait_for, {
+        'kubeconfig': '/nonexistent/kubeconfig',
+        'predicates': [{'kind': 'Node', 'name': 'worker-0', 'conditions': [{'type': 'Ready', 'status': 'True'}]}],
+        'timeout': timeout,
+    })
+
+
+@pytest.mark.parametrize('error', [
+    ApiException(status=503, reason='Service Unavailable'),
+    ApiException(status=429, reason='Too Many Requests'),
+    urllib3.exceptions.MaxRetryError(None, '/api/v1/nodes', 'Connection refused'),
+    ConnectionResetError(),
+])
+def test_transient_errors_are_retried(fake_client, run_module, error):
+    client = fake_client(FakeDynamicClient([node('worker-0', 'True')], errors={'list': [error]}))
+
+    result = wait_for_node(run_module)
+
+    assert not result.get('failed'), result
+    assert result['predicates'][0]['satisfied']
+    assert result['predicates'][0]['reconnects'] == 1
+    assert client.requests.count(('list', 'Node')) == 2
+
+
+def test_expired_watch_is_resumed(fake_client, run_module):
+    client = fake_client(FakeDynamicClient([node('worker-0', 'False')], events=[
+        {'type': 'ERROR', 'raw_object': {'kind': 'Status', 'code': 410, 'message': 'too old resource version'}},
+        {'type': 'MODIFIED', 'raw_object': node('worker-0', 'True')},
+    ]))
+
+    result = wait_for_node(run_module)
+
+    assert not result.get('failed'), result
+    assert result['predicates'][0]['satisfied']
+    assert client.requests.count(('list', 'Node')) == 2
+
+
+@pytest.mark.parametrize('errors, message', [
+    ({'resource': [ResourceNotFoundError('No matches found for {\'kind\': \'Node\'}')]}, 'No matches found'),
+    ({'list': [ApiException(status=401, reason='Unauthorized')]}, 'Unauthorized'),
+    ({'list': [ApiException(status=403, reason='Forbidden')]}, 'Forbidden'),
+    ({'watch': [ApiException(status=403, reason='Forbidden')]}, 'Forbidden'),
+])
+def test_permanent_errors_fail_immediately(fake_client, run_module, errors, message):
+    fake_client(FakeDynamicClient([node('worker-0', 'False')], errors=errors))
+
+    started = time.monotonic()
+    result = wait_for_node(run_module)
+
+    assert result['failed']
+    assert 'Unable to wait for Node worker-0' in result['msg']
+    assert message in result['msg']
+    assert time.monotonic() - started < 5
+
+
+def test_permanent_watch_error_event_fails_immediately(fake_client, run_module):
+    fake_client(FakeDynamicClient([node('worker-0', 'False')], events=[
+        {'type': 'ERROR', 'raw_object': {'kind': 'Status', 'code': 403, 'message': 'nodes is forbidden'}},
+    ]))
+
+    result = wait_for_node(run_module)
+
+    assert result['failed']
+    assert 'nodes is forbidden' in result['msg']
+
+
+def test_invalid_kubeconfig_fails_immediately(tmp_path, run_module):
+    kubeconfig = tmp_path / 'kubeconfig'
+    kubeconfig.write_text('apiVersion: v1\nkind: Config\n')
+
+    started = time.monotonic()
+    result = run_module(k8s_wait_for, {'kubeconfig': str(kubeconfig), 'predicates': [{'kind': 'Node'}], 'timeout': TIMEOUT})
+
+    assert result['failed']
+    assert 'Unable to connect to the API server using kubeconfig' in result['msg']
+    assert time.monotonic() - started < 5
+
+
+def test_timeout(fake_client, run_module):
+    fake_client(FakeDynamicClient([node('worker-0', 'False')]))
+
+    result = wait_for_node(run_module, timeout=1)
+
+    assert result['failed']
+    assert 'Timed out after 1 seconds waiting for Node worker-0' in result['msg']
+    assert not result['predicates'][0]['satisfied']
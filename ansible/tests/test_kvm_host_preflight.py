@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+# Tests for the CPU capacity check of the kvm_host_preflight module (roles/soundness_check/library/kvm_host_preflight.py),
+# using given CPU topologies of the KVM host.
+
+
+import pytest
+
+import kvm_host_preflight
+
+
+# three masters and two workers with 4 CPUs each
+NODES = [
+    {'role': 'master', 'count': 3, 'cpus': 4, 'memory': 1, 'volume_size': 1},
+    {'role': 'worker', 'count': 2, 'cpus': 4, 'memory': 1, 'volume_size': 1},
+]
+
+
+@pytest.fixture
+def cpu_topology(monkeypatch):
+    '''
+    Lets the module detect the given architecture, number of online CPUs and SMT threads per core.
+    '''
+    def set_topology(architecture, cpus, threads_per_core):
+        monkeypatch.setattr(kvm_host_preflight.platform, 'machine', lambda: architecture)
+        monkeypatch.setattr(kvm_host_preflight.KvmHostPreflightModule, '_online_cpus', lambda self: cpus)
+        monkeypatch.setattr(kvm_host_preflight.KvmHostPreflightModule, '_threads_per_core', lambda self: threads_per_core)
+
+    return set_topology
+
+
+def cpu_check(run_module):
+    result = run_module(kvm_host_preflight, {'support_matrix': {}, 'nodes': NODES, 'image_path': '/'})
+
+    assert not result.get('failed'), result
+    return [c for c in result['checks'] if c['name'] == 'cpu'][0]
+
+
+@pytest.mark.parametrize('architecture, cpus, threads_per_core, status', [
+    # on s390x, the SMT threads don't count, only the cores do
+    ('s390x', 40, 2, 'pass'),
+    ('s390x', 20, 1, 'pass'),
+    ('s390x', 38, 2, 'fail'),
+    ('s390x', 20, 2, 'fail'),
+    # on all other architectures, the logical CPUs count
+    ('x86_64', 20, 2, 'pass'),
+    ('x86_64', 19, 1, 'fail'),
+])
+def test_cpu_capacity(cpu_topology, run_module, architecture, cpus, threads_per_core, status):
+    cpu_topology(architecture, cpus, threads_per_core)
+
+    check = cpu_check(run_module)
+
+    assert check['status'] == status, check
+
+
+def test_cpu_check_message(cpu_topology, run_module):
+    cpu_topology('s390x', 16, 2)
+
+    assert cpu_check(run_module)['message'] == '20 cores required (current: 8 cores with 2 SMT threads per core)'
+
+    cpu_topology('x86_64', 16, 2)
+
+    assert cpu_check(run_module)['message'] == '20 CPUs required (current: 16 CPUs)'
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+# Tests for the libvirt_domain_power module (library/libvirt_domain_power.py),
+# using the libvirt test driver ('test:///default').
+
+
+import time
+
+import pytest
+
+from conftest import define_domain
+
+libvirt_domain_power = pytest.importorskip('libvirt_domain_power')
+
+
+@pytest.fixture
+def lifecycle_events(monkeypatch):
+    '''
+    Records the (domain name, event) tuples of the lifecycle events received by the module.
+    '''
+    events = []
+    lifecycle_event = libvirt_domain_power.LibvirtDomainPowerModule._lifecycle_event
+
+    def _lifecycle_event(self, conn, domain, event, detail, opaque):
+        events.append((domain.name(), event))
+        return lifecycle_event(self, conn, domain, event, detail, opaque)
+
+    monkeypatch.setattr(libvirt_domain_power.LibvirtDomainPowerModule, '_lifecycle_event', _lifecycle_event)
+
+    return events
+
+
+@pytest.fixture
+def running_domains(libvirt_conn):
+    domains = [define_domain(libvirt_conn, 'test-worker-{}'.format(i)) for i in range(3)]
+    for domain in domains:
+        domain.create()
+
+    return domains
+
+
+def test_shutdown_via_lifecycle_events(running_domains, lifecycle_events, monkeypatch, run_module):
+    import libvirt
+
+    # the libvirt domain state is never checked directly within the timeout
+    monkeypatch.setattr(libvirt_domain_power, 'EVENT_FALLBACK_INTERVAL', 3600)
+    names = [d.name() for d in running_domains]
+
+    started = time.monotonic()
+    result = run_module(libvirt_domain_power, {'uri': 'test:///default', 'domains': names, 'state': 'shutdown', 'timeout': 30})
+
+    assert not result.get('failed'), result
+    assert time.monotonic() - started < 30
+    assert result['changed']
+    assert [(d['name'], d['changed'], d['state'], d['destroyed']) for d in result['domains']] == [(n, True, 'shutdown', False) for n in names]
+    assert sorted(n for n, e in lifecycle_events if e == libvirt.VIR_DOMAIN_EVENT_STOPPED) == names
+    assert not any(d.isActive() for d in running_domains)
+
+    # the libvirt domains are shut down already
+    result = run_module(libvirt_domain_power, {'uri': 'test:///default', 'domains': names, 'state': 'shutdown', 'timeout': 30})
+
+    assert not result['changed']
+
+
+def test_start(libvirt_conn, run_module):
+    domain = define_domain(libvirt_conn, 'test-worker-0')
+
+    result = run_module(libvirt_domain_power, {'uri': 'test:///default', 'domains': ['test-worker-0'], 'state': 'running'})
+
+    assert not result.get('failed'), result
+    assert result['changed']
+    assert domain.isActive()
+
+
+def test_shutdown_with_lost_lifecycle_events(running_domains, monkeypatch, run_module):
+    monkeypatch.setattr(libvirt_domain_power, 'EVENT_FALLBACK_INTERVAL', 0.1)
+    monkeypatch.setattr(libvirt_domain_power.LibvirtDomainPowerModule, '_lifecycle_event', lambda self, conn, domain, event, detail, opaque: None)
+    names = [d.name() for d in running_domains]
+
+    result = run_module(libvirt_domain_power, {'uri': 'test:///default', 'domains': names, 'state': 'shutdown', 'timeout': 30})
+
+    # the libvirt domain state is checked directly instead
+    assert not result.get('failed'), result
+    assert [(d['name'], d['changed'], d['destroyed']) for d in result['domains']] == [(n, True, False) for n in names]
+    assert not any(d.isActive() for d in running_domains)
+
+
+def test_shutdown_timeout(running_domains, monkeypatch, run_module):
+    import libvirt
+
+    # the guest OS ignores the shutdown request
+    monkeypatch.setattr(libvirt.virDomain, 'shutdown', lambda self, *args: 0)
+    monkeypatch.setattr(libvirt_domain_power, 'EVENT_FALLBACK_INTERVAL', 0.1)
+
+    result = run_module(libvirt_domain_power, {'uri': 'test:///default', 'domains': ['test-worker-0'], 'state': 'shutdown', 'timeout': 1})
+
+    assert result['failed']
+    assert 'did not reach state shutdown within 1 seconds' in result['msg']
+    assert running_domains[0].isActive()
+
+
+def test_shutdown_timeout_destroys_domain(running_domains, monkeypatch, run_module):
+    import libvirt
+
+    monkeypatch.setattr(libvirt.virDomain, 'shutdown', lambda self, *args: 0)
+    monkeypatch.setattr(libvirt_domain_power, 'EVENT_FALLBACK_INTERVAL', 0.1)
+
+    result = run_module(libvirt_domain_power, {'uri': 'test:///default', 'domains': ['test-worker-0'], 'state': 'shutdown', 'timeout': 1, 'destroy_on_timeout': True})
+
+    assert not result.get('failed'), result
+    assert [(d['name'], d['changed'], d['destroyed']) for d in result['domains']] == [('test-worker-0', True, True)]
+    assert not running_domains[0].isActive()
+    assert running_domains[1].isActive()
+
+
+def test_check_mode(running_domains, run_module):
+    result = run_module(libvirt_domain_power, {'uri': 'test:///default', 'domains': ['test-worker-0'], 'state': 'shutdown'}, check_mode=True)
+
+    assert result['changed']
+    assert running_domains[0].isActive()
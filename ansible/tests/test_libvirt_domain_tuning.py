@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+# Tests for the libvirt_domain_tuning module of the tuning role (roles/tuning/library/libvirt_domain_tuning.py),
+# using the libvirt test driver ('test:///default').
+
+
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from conftest import define_domain
+
+libvirt_domain_tuning = pytest.importorskip('libvirt_domain_tuning')
+
+
+DEVICES_XML = '''
+    <disk type='file' device='disk'>
+      <driver name='qemu' type='qcow2'/>
+      <source file='/var/lib/libvirt/images/{name}.qcow2'/>
+      <target dev='vda' bus='virtio'/>
+    </disk>
+    <interface type='network'>
+      <source network='default'/>
+      <model type='virtio'/>
+    </interface>
+    <memballoon model='virtio'/>
+'''
+
+PROFILE = {
+    'network_interface_driver': {'name': 'vhost', 'queues': '2'},
+    'memballoon_model': 'none',
+    'iothreads': ['1'],
+    'disk_driver': {'cache': 'none', 'io': 'native', 'iothread': '1'},
+    'cpu_shares': 2048,
+}
+
+
+@pytest.fixture
+def define_calls(monkeypatch):
+    '''
+    Records the names of the libvirt domains (re)defined via any libvirt connection
+    (the recorded calls are to be cleared once the test has defined its libvirt domains).
+    '''
+    import libvirt
+
+    calls = []
+    define_xml = libvirt.virConnect.defineXML
+
+    def _define_xml(self, xml):
+        calls.append(ET.fromstring(xml).find('name').text)
+        return define_xml(self, xml)
+
+    monkeypatch.setattr(libvirt.virConnect, 'defineXML', _define_xml)
+
+    return calls
+
+
+def get_domain_xml(conn, name):
+    import libvirt
+
+    return ET.fromstring(conn.lookupByName(name).XMLDesc(libvirt.VIR_DOMAIN_XML_INACTIVE))
+
+
+def test_apply_profile(libvirt_conn, define_calls, run_module):
+    define_domain(libvirt_conn, 'test-worker-0', DEVICES_XML.format(name='test-worker-0'))
+    del define_calls[:]
+    args = {'uri': 'test:///default', 'domains': ['test-worker-0'], 'profile': PROFILE}
+
+    result = run_module(libvirt_domain_tuning, args)
+
+    assert not result.get('failed'), result
+    assert result['changed']
+    assert result['domains'] == [{'name': 'test-worker-0', 'changed': True, 'changes': list(PROFILE)}]
+
+    # all changes are applied with a single redefinition of the libvirt domain
+    assert define_calls == ['test-worker-0']
+
+    assert len(result['diff']) == 1
+    assert result['diff'][0]['before_header'] == result['diff'][0]['after_header'] == 'test-worker-0'
+    assert "<memballoon model=\"virtio\"" in result['diff'][0]['before']
+    assert "<memballoon model=\"none\"" in result['diff'][0]['after']
+
+    domain_xml = get_domain_xml(libvirt_conn, 'test-worker-0')
+    assert domain_xml.find('devices/memballoon').get('model') == 'none'
+    assert domain_xml.find('devices/interface/driver').attrib == {'name': 'vhost', 'queues': '2'}
+    assert domain_xml.find('devices/disk/driver').get('io') == 'native'
+    assert domain_xml.find('iothreads').text == '1'
+    assert domain_xml.find('cputune/shares').text == '2048'
+
+    # the libvirt domain matches the tuning profile now
+    del define_calls[:]
+    result = run_module(libvirt_domain_tuning, args)
+
+    assert not result.get('failed'), result
+    assert not result['changed']
+    assert result['domains'] == [{'name': 'test-worker-0', 'changed': False, 'changes': []}]
+    assert result['diff'] == []
+    assert define_calls == []
+
+
+def test_only_changed_domains_are_redefined(libvirt_conn, define_calls, run_module):
+    define_domain(libvirt_conn, 'test-master-0', DEVICES_XML.format(name='test-master-0'))
+    define_domain(libvirt_conn, 'test-worker-0', DEVICES_XML.format(name='test-worker-0').replace("<memballoon model='virtio'/>", "<memballoon model='none'/>"))
+    del define_calls[:]
+    args = {'uri': 'test:///default', 'domains': ['test-master-0', 'test-worker-0'], 'profile': {'memballoon_model': 'none'}}
+
+    result = run_module(libvirt_domain_tuning, args)
+
+    assert not result.get('failed'), result
+    assert [(d['name'], d['changed']) for d in result['domains']] == [('test-master-0', True), ('test-worker-0', False)]
+    assert [d['before_header'] for d in result['diff']] == ['test-master-0']
+    assert define_calls == ['test-master-0']
+
+
+def test_check_mode(libvirt_conn, define_calls, run_module):
+    define_domain(libvirt_conn, 'test-worker-0', DEVICES_XML.format(name='test-worker-0'))
+    del define_calls[:]
+
+    result = run_module(libvirt_domain_tuning, {'uri': 'test:///default', 'domains': ['test-worker-0'], 'profile': PROFILE}, check_mode=True)
+
+    assert result['changed']
+    assert len(result['diff']) == 1
+    assert define_calls == []
+    assert get_domain_xml(libvirt_conn, 'test-worker-0').find('devices/memballoon').get('model') == 'virtio'
+
+
+def test_unknown_domain(libvirt_conn, run_module):
+    result = run_module(libvirt_domain_tuning, {'uri': 'test:///default', 'domains': ['test-missing'], 'profile': PROFILE})
+
+    assert result['failed']
+    assert 'test-missing' in result['msg']
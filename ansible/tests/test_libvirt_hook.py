@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+# Tests for the libvirt 'qemu' hook of the crypto role (roles/crypto/templates/libvirt_hook_qemu.py.j2),
+# running the rendered hook against a fake sysfs tree emulating the vfio_ap device driver (see 'fake_vfio_ap_kernel.py').
+
+
+import os
+import uuid
+
+import pytest
+
+from libvirt_hook_utils import ALL_BITS_MASK, HookEnvironment, domain_xml
+
+
+# the number of simulated domains started and stopped at the same time
+CONCURRENT_DOMAINS = 16
+
+MDEV_UUID = '5a4c1e3d-9b2f-4d8a-8c61-0e7f3b2a9d10'
+
+
+@pytest.fixture
+def hook_env(tmp_path):
+    return HookEnvironment(tmp_path)
+
+
+def read_log(hook_env):
+    if not os.path.exists(hook_env.log_file):
+        return []
+
+    with open(hook_env.log_file, 'r') as f:
+        return f.read().splitlines()
+
+
+def test_irrelevant_operation_exits_early(hook_env):
+
+    # the domain XML isn't even read for operations other than 'prepare' and 'release'
+    result = hook_env.run('ocp1-qf2b5-worker-0', 'started', '<not-xml')
+
+    assert result.returncode == 0
+    assert read_log(hook_env) == []
+
+
+def test_domain_without_mdevs(hook_env):
+    result = hook_env.run('ocp1-qf2b5-master-0', 'prepare', domain_xml('ocp-master.xml', 'ocp1-qf2b5-master-0'), fake_kernel=True)
+
+    assert result.returncode == 0
+    assert hook_env.read_masks() == (ALL_BITS_MASK, ALL_BITS_MASK)
+
+
+def test_prepare_and_release(hook_env):
+    xml = hook_env.add_domain('ocp1-qf2b5-worker-0', {MDEV_UUID: '07.0029'})
+
+    result = hook_env.run('ocp1-qf2b5-worker-0', 'prepare', xml, fake_kernel=True)
+
+    assert result.returncode == 0, result.stderr
+    assert hook_env.read_mdev(MDEV_UUID) == (['07.0029'], ['0029'])
+    assert hook_env.read_masks() == ('0x' + 'fe' + 'f' * 62, '0x' + 'f' * 10 + 'bf' + 'f' * 52)
+
+    result = hook_env.run('ocp1-qf2b5-worker-0', 'release', xml, fake_kernel=True)
+
+    assert result.returncode == 0, result.stderr
+    assert not os.path.exists(os.path.join(hook_env.matrix_dir, MDEV_UUID))
+    assert hook_env.read_masks() == (ALL_BITS_MASK, ALL_BITS_MASK)
+
+    assert [line.split()[3] for line in read_log(hook_env)] == ['success', 'success']
+
+
+def test_prepare_is_idempotent(hook_env):
+    xml = hook_env.add_domain('ocp1-qf2b5-worker-0', {MDEV_UUID: '07.0029'})
+
+    for _ in range(2):
+        result = hook_env.run('ocp1-qf2b5-worker-0', 'prepare', xml, fake_kernel=True)
+        assert result.returncode == 0, result.stderr
+
+    assert hook_env.read_mdev(MDEV_UUID) == (['07.0029'], ['0029'])
+
+
+@pytest.mark.parametrize('matrix, control_domains', [
+    ([], []),
+    (['07.'], []),
+    (['.0029'], []),
+    (['07.0029'], []),
+    ([], ['0029']),
+])
+def test_prepare_resumes_partial_assignments(hook_env, matrix, control_domains):
+
+    # a previous attempt has been interrupted after creating the mediated device (and assigning part of the crypto resource)
+    xml = hook_env.add_domain('ocp1-qf2b5-worker-0', {MDEV_UUID: '07.0029'})
+    hook_env.add_mdev(MDEV_UUID, matrix, control_domains)
+
+    result = hook_env.run('ocp1-qf2b5-worker-0', 'prepare', xml, fake_kernel=True)
+
+    assert result.returncode == 0, result.stderr
+    assert hook_env.read_mdev(MDEV_UUID) == (['07.0029'], ['0029'])
+
+
+@pytest.mark.parametrize('matrix, control_domains', [
+    (['08.0029'], ['0029']),
+    (['07.002a'], []),
+    (['07.'], ['002a']),
+])
+def test_prepare_fails_with_different_assignments(hook_env, matrix, control_domains):
+    xml = hook_env.add_domain('ocp1-qf2b5-worker-0', {MDEV_UUID: '07.0029'})
+    hook_env.add_mdev(MDEV_UUID, matrix, control_domains)
+
+    result = hook_env.run('ocp1-qf2b5-worker-0', 'prepare', xml, fake_kernel=True)
+
+    assert result.returncode == 1
+    assert b'exists with different assignments' in result.stderr
+    assert hook_env.read_mdev(MDEV_UUID) == (matrix, control_domains)
+
+
+def test_release_of_removed_mdev(hook_env):
+    xml = hook_env.add_domain('ocp1-qf2b5-worker-0', {MDEV_UUID: '07.0029'})
+
+    result = hook_env.run('ocp1-qf2b5-worker-0', 'release', xml, fake_kernel=True)
+
+    assert result.returncode == 0, result.stderr
+    assert hook_env.read_masks() == (ALL_BITS_MASK, ALL_BITS_MASK)
+
+
+def test_concurrent_domain_starts_and_stops(hook_env):
+
+    # simulate the cluster worker nodes being started (and stopped) all at the same time, each with its own
+    # crypto domain on one of two crypto adapters
+    domains = {}
+    for i in range(CONCURRENT_DOMAINS):
+        domain_name = 'ocp1-qf2b5-worker-{}'.format(i)
+        mdev_uuid = str(uuid.uuid4())
+        crypto_resource = '{:02x}.{:04x}'.format(0x07 + i % 2, 0x20 + i)
+        domains[domain_name] = (mdev_uuid, crypto_resource, hook_env.add_domain(domain_name, {mdev_uuid: crypto_resource}))
+
+    # start all domains (and retry starting them, e.g. after libvirt has been restarted)
+    for _ in range(2):
+        results = hook_env.run_concurrently([(d, 'prepare', xml) for d, (_, _, xml) in domains.items()], fake_kernel=True)
+        assert [r.returncode for r in results] == [0] * CONCURRENT_DOMAINS, [r.stderr for r in results if r.returncode]
+
+        for mdev_uuid, crypto_resource, _ in domains.values():
+            assert hook_env.read_mdev(mdev_uuid) == ([crypto_resource], [crypto_resource.split('.')[1]])
+
+    apmask, aqmask = (int(m, 16) for m in hook_env.read_masks())
+    assert apmask == int(ALL_BITS_MASK, 16) & ~(0b11 << (255 - 0x08))
+    assert aqmask == int(ALL_BITS_MASK, 16) & ~(((1 << CONCURRENT_DOMAINS) - 1) << (255 - 0x20 - CONCURRENT_DOMAINS + 1))
+
+    # stop all domains
+    results = hook_env.run_concurrently([(d, 'release', xml) for d, (_, _, xml) in domains.items()], fake_kernel=True)
+    assert [r.returncode for r in results] == [0] * CONCURRENT_DOMAINS, [r.stderr for r in results if r.returncode]
+
+    assert [n for n in os.listdir(hook_env.matrix_dir) if n != 'mdev_supported_types'] == []
+    assert hook_env.read_masks() == (ALL_BITS_MASK, ALL_BITS_MASK)
+
+    log = read_log(hook_env)
+    assert len(log) == 3 * CONCURRENT_DOMAINS
+    assert all(line.split()[3] == 'success' for line in log)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+# Tests for the mdev_libvirt_attach module of the crypto role (roles/crypto/library/mdev_libvirt_attach.py),
+# using the libvirt test driver ('test:///default').
+
+
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from conftest import define_domain
+
+mdev_libvirt_attach = pytest.importorskip('mdev_libvirt_attach')
+
+
+MDEV_UUIDS = [
+    '34ef0de3-ab1c-4adc-ac6c-0741338b39ea',
+    '5d0e1a7c-3c4b-4f0a-9d0b-1e6f7a8b9c0d',
+    '8f3b6c2a-1d4e-4a7b-9c0d-2e5f8a1b3c4d',
+]
+
+
+def get_mdevs(conn, name):
+    '''
+    Returns the (mdev UUID, device alias) tuples of the vfio-ap mediated devices in the persistent definition of the given domain.
+    '''
+    import libvirt
+
+    domain_xml = ET.fromstring(conn.lookupByName(name).XMLDesc(libvirt.VIR_DOMAIN_XML_INACTIVE))
+
+    return [
+        (h.find('source/address').get('uuid'), h.find('alias').get('name') if h.find('alias') is not None else None)
+        for h in domain_xml.findall('devices/hostdev')
+        if h.get('type') == 'mdev' and h.get('model') == 'vfio-ap'
+    ]
+
+
+def test_attach_is_idempotent(libvirt_conn, run_module):
+    define_domain(libvirt_conn, 'test-worker-0')
+    define_domain(libvirt_conn, 'test-worker-1')
+    args = {
+        'uri': 'test:///default',
+        'assignments': [
+            {'worker_name': 'test-worker-0', 'mdev_uuids': {MDEV_UUIDS[0]: '07.0029'}},
+            {'worker_name': 'test-worker-1', 'mdev_uuids': [MDEV_UUIDS[1]]},
+        ],
+    }
+
+    result = run_module(mdev_libvirt_attach, args)
+
+    assert not result.get('failed'), result
+    assert result['changed']
+    assert result['attached_mdevs'] == {'test-worker-0': [MDEV_UUIDS[0]], 'test-worker-1': [MDEV_UUIDS[1]]}
+    assert get_mdevs(libvirt_conn, 'test-worker-0') == [(MDEV_UUIDS[0], 'ua-hostdev0')]
+    assert get_mdevs(libvirt_conn, 'test-worker-1') == [(MDEV_UUIDS[1], 'ua-hostdev0')]
+
+    result = run_module(mdev_libvirt_attach, args)
+
+    assert not result.get('failed'), result
+    assert not result['changed']
+    assert result['attached_mdevs'] == {}
+    assert get_mdevs(libvirt_conn, 'test-worker-0') == [(MDEV_UUIDS[0], 'ua-hostdev0')]
+    assert get_mdevs(libvirt_conn, 'test-worker-1') == [(MDEV_UUIDS[1], 'ua-hostdev0')]
+
+
+def test_attach_check_mode(libvirt_conn, run_module):
+    define_domain(libvirt_conn, 'test-worker-0')
+
+    result = run_module(mdev_libvirt_attach, {
+        'uri': 'test:///default',
+        'assignments': [{'worker_name': 'test-worker-0', 'mdev_uuids': [MDEV_UUIDS[0]]}],
+    }, check_mode=True)
+
+    assert result['changed']
+    assert get_mdevs(libvirt_conn, 'test-worker-0') == []
+
+
+def test_exclusive_aliases_do_not_collide(libvirt_conn, run_module):
+    define_domain(libvirt_conn, 'test-worker-0')
+
+    result = run_module(mdev_libvirt_attach, {
+        'uri': 'test:///default',
+        'assignments': [{'worker_name': 'test-worker-0', 'mdev_uuids': MDEV_UUIDS[:2]}],
+    })
+    assert get_mdevs(libvirt_conn, 'test-worker-0') == [(MDEV_UUIDS[0], 'ua-hostdev0'), (MDEV_UUIDS[1], 'ua-hostdev1')]
+
+    # detaching the first mediated device while attaching another one must not reuse the alias of the remaining one
+    result = run_module(mdev_libvirt_attach, {
+        'uri': 'test:///default',
+        'assignments': [{'worker_name': 'test-worker-0', 'mdev_uuids': MDEV_UUIDS[1:]}],
+        'exclusive': True,
+    })
+
+    assert not result.get('failed'), result
+    assert result['attached_mdevs'] == {'test-worker-0': [MDEV_UUIDS[2]]}
+    assert result['detached_mdevs'] == {'test-worker-0': [MDEV_UUIDS[0]]}
+    assert get_mdevs(libvirt_conn, 'test-worker-0') == [(MDEV_UUIDS[1], 'ua-hostdev1'), (MDEV_UUIDS[2], 'ua-hostdev2')]
+
+
+def test_exclusive_detaches_all(libvirt_conn, run_module):
+    define_domain(libvirt_conn, 'test-worker-0')
+    run_module(mdev_libvirt_attach, {
+        'uri': 'test:///default',
+        'assignments': [{'worker_name': 'test-worker-0', 'mdev_uuids': [MDEV_UUIDS[0]]}],
+    })
+
+    result = run_module(mdev_libvirt_attach, {
+        'uri': 'test:///default',
+        'assignments': [{'worker_name': 'test-worker-0', 'mdev_uuids': []}],
+        'exclusive': True,
+    })
+
+    assert result['changed']
+    assert result['detached_mdevs'] == {'test-worker-0': [MDEV_UUIDS[0]]}
+    assert get_mdevs(libvirt_conn, 'test-worker-0') == []
+
+
+def test_unknown_domain(libvirt_conn, run_module):
+    result = run_module(mdev_libvirt_attach, {
+        'uri': 'test:///default',
+        'assignments': [{'worker_name': 'test-worker-unknown', 'mdev_uuids': [MDEV_UUIDS[0]]}],
+    })
+
+    assert result['failed']
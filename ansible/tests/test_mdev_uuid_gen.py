@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+# Tests for the planning mode of the mdev_uuid_gen module of the crypto role (roles/crypto/library/mdev_uuid_gen.py).
+
+
+import os
+
+import yaml
+
+import mdev_uuid_gen
+
+from ansible.module_utils.common.warnings import get_warning_messages
+
+
+WORKER_DOMAINS = ['ocp1-qf2b5-worker-0-456r9', 'ocp1-qf2b5-worker-0-x8k2p']
+
+
+def plan_args(config_dir, resource_assignments):
+    return {
+        'worker_domains': WORKER_DOMAINS,
+        'cluster_id': 'ocp1-qf2b5',
+        'config_dir': str(config_dir),
+        'resource_assignments': resource_assignments,
+    }
+
+
+def persist(config_dir, mdev_plan):
+    '''
+    Persists the mediated device configuration of the given plan the same way the crypto role does.
+    '''
+    for p in mdev_plan:
+        config_file = os.path.join(str(config_dir), 'crypto_mdevs_{}.yaml'.format(p['worker_name']))
+
+        if p['mdev_uuids']:
+            with open(config_file, 'w') as f:
+                yaml.safe_dump(p['mdev_uuids'], f)
+        elif os.path.exists(config_file):
+            os.remove(config_file)
+
+
+def test_plan_is_stable(tmp_path, run_module):
+    args = plan_args(tmp_path, [{'id': '07.0029', 'assign_to_worker': 0}, {'id': '07.002a', 'assign_to_worker': 1}])
+
+    result = run_module(mdev_uuid_gen, args)
+
+    assert result['changed']
+    assert [list(p['mdev_uuids'].values()) for p in result['mdev_plan']] == [['07.0029'], ['07.002a']]
+
+    persist(tmp_path, result['mdev_plan'])
+    rerun = run_module(mdev_uuid_gen, args)
+
+    assert not rerun['changed']
+    assert rerun['mdev_plan'] == [dict(p, changed=False, added={}) for p in result['mdev_plan']]
+
+
+def test_worker_without_assignments_left(tmp_path, run_module):
+    result = run_module(mdev_uuid_gen, plan_args(tmp_path, [{'id': '07.0029', 'assign_to_worker': 0}, {'id': '07.002a', 'assign_to_worker': 1}]))
+    persist(tmp_path, result['mdev_plan'])
+
+    # the crypto resource is no longer assigned to the second worker
+    args = plan_args(tmp_path, [{'id': '07.0029', 'assign_to_worker': 0}])
+    result = run_module(mdev_uuid_gen, args)
+
+    assert result['changed']
+    assert result['mdev_plan'][1]['mdev_uuids'] == {}
+    assert list(result['mdev_plan'][1]['removed'].values()) == ['07.002a']
+
+    # the configuration of the second worker is removed, so the plan doesn't change anymore
+    persist(tmp_path, result['mdev_plan'])
+    assert not os.path.exists(os.path.join(str(tmp_path), 'crypto_mdevs_{}.yaml'.format(WORKER_DOMAINS[1])))
+    assert not run_module(mdev_uuid_gen, args)['changed']
+
+
+def test_unknown_worker_is_skipped(tmp_path, run_module):
+    result = run_module(mdev_uuid_gen, plan_args(tmp_path, [{'id': '07.0029', 'assign_to_worker': 0}, {'id': '07.002a', 'assign_to_worker': 2}]))
+
+    assert not result.get('failed'), result
+    assert [list(p['mdev_uuids'].values()) for p in result['mdev_plan']] == [['07.0029'], []]
+    assert any('07.002a' in w for w in get_warning_messages())
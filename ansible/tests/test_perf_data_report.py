@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+# Tests for the perf_data_report module (library/perf_data_report.py),
+# using nmon / njmon output files and an openshift-install log file of six sampling intervals (10:12 - 10:17 UTC).
+
+
+import gzip
+import json
+import os
+import time
+
+import pytest
+
+from conftest import fixture_path
+
+import perf_data_report
+
+
+# the time series expected for both formats (the njmon output file ends with a truncated snapshot)
+SAMPLES = [
+    # timestamp, cpu_user, cpu_sys, cpu_wait, cpu_idle, cpu_steal, mem_total_mb, mem_used_mb, disk_read_kbs, disk_write_kbs, net_rx_kbs, net_tx_kbs
+    [1677665520.0, 21.0, 6.0, 2.0, 70.0, 1.0, 16384.0, 8192.0, 110.0, 220.0, 110.0, 70.0],
+    [1677665580.0, 30.0, 6.0, 3.0, 60.0, 1.0, 16384.0, 9216.0, 220.0, 440.0, 220.0, 140.0],
+    [1677665640.0, 60.0, 12.0, 5.0, 20.0, 3.0, 16384.0, 12288.0, 330.0, 660.0, 330.0, 210.0],
+    [1677665700.0, 70.0, 14.0, 4.0, 10.0, 2.0, 16384.0, 14336.0, 440.0, 880.0, 440.0, 280.0],
+    [1677665760.0, 45.0, 10.0, 3.0, 40.0, 2.0, 16384.0, 13312.0, 550.0, 1100.0, 550.0, 350.0],
+    [1677665820.0, 6.0, 2.0, 1.0, 90.0, 1.0, 16384.0, 10240.0, 660.0, 1320.0, 660.0, 420.0],
+]
+
+# the milestones of the last installation in the openshift-install log file
+MILESTONES = {
+    'infrastructure_creation': '2023-03-01T10:12:30+00:00',
+    'api_up': '2023-03-01T10:14:30+00:00',
+    'bootstrap_complete': '2023-03-01T10:15:30+00:00',
+    'install_complete': '2023-03-01T10:16:30+00:00',
+}
+
+
+@pytest.fixture
+def utc():
+    '''
+    Lets the nmon timestamps be interpreted in UTC (instead of the local time zone of the test host).
+    '''
+    tz = os.environ.get('TZ')
+    os.environ['TZ'] = 'UTC'
+    time.tzset()
+
+    yield
+
+    if tz is None:
+        del os.environ['TZ']
+    else:
+        os.environ['TZ'] = tz
+    time.tzset()
+
+
+@pytest.fixture
+def report(run_module, tmp_path, utc):
+    '''
+    Processes the output files of the given format and returns the result of the module and the archive written.
+    '''
+    def run(format, check_mode=False, **kwargs):
+        dest = tmp_path / 'perf-data' / '{}.json.gz'.format(format)
+        args = dict({'data_dir': fixture_path('perf_data', format), 'format': format, 'dest': str(dest)}, **kwargs)
+
+        result = run_module(perf_data_report, args, check_mode=check_mode)
+        assert not result.get('failed'), result
+
+        if not dest.exists():
+            return result, None
+        with gzip.open(str(dest), 'rt', encoding='utf-8') as f:
+            return result, json.load(f)
+
+    return run
+
+
+def phase_summary(phases, *keys):
+    return [tuple(p.get(k) for k in ('phase', 'samples') + keys) for p in phases]
+
+
+@pytest.mark.parametrize('format, files', [
+    ('nmon', ['kvmhost_230301_1012.nmon']),
+    ('njmon', ['kvmhost_20230301_101200.json']),
+])
+def test_samples(report, format, files):
+    result, archive = report(format)
+
+    assert result['changed']
+    assert [os.path.basename(f) for f in result['files']] == files
+    assert result['samples'] == len(SAMPLES)
+    assert archive['files'] == files
+    assert archive['columns'] == perf_data_report.COLUMNS
+    assert archive['samples'] == SAMPLES
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 500, 4096])
+def test_njmon_chunk_boundaries(report, monkeypatch, chunk_size):
+    # the snapshots are about 700 bytes long, so (except for the largest chunk size) each of them is split across chunks
+    monkeypatch.setattr(perf_data_report, 'READ_CHUNK_SIZE', chunk_size)
+
+    result, archive = report('njmon')
+
+    assert result['samples'] == len(SAMPLES)
+    assert archive['samples'] == SAMPLES
+
+
+@pytest.mark.parametrize('values, total', [
+    # the partitions and device mapper devices of a disk are accounted for by the disk
+    ({'sda': 100, 'sda1': 60, 'sda2': 40, 'dm-0': 60}, 100.0),
+    ({'nvme0n1': 10, 'nvme0n1p1': 4, 'nvme0n1p2': 6, 'nvme1n1': 20}, 30.0),
+    ({'mmcblk0': 8, 'mmcblk0p1': 8}, 8.0),
+    # partitions of disks not reported are accounted for
+    ({'sda1': 5, 'sdb': 7}, 12.0),
+    ({'md0': 30, 'loop0': 1, 'ram0': 1, 'sr0': 1}, 30.0),
+    ({'sda': '12.5', 'sdb': 'n/a', 'sdc': None}, 12.5),
+])
+def test_sum_disks(values, total):
+    module = perf_data_report.PerfDataReportModule.__new__(perf_data_report.PerfDataReportModule)
+
+    assert module._sum_disks(values) == total
+
+
+@pytest.mark.parametrize('format', ['nmon', 'njmon'])
+def test_phases_from_install_log(report, format):
+    result, archive = report(format, install_log=fixture_path('perf_data', 'openshift_install.log'))
+
+    # the milestones of the failed installation preceding the last one are ignored
+    assert result['milestones'] == MILESTONES
+    assert list(result['milestones']) == list(MILESTONES)
+    assert archive['milestones'] == MILESTONES
+    assert archive['phases'] == result['phases']
+
+    assert phase_summary(result['phases'], 'duration', 'cpu_busy_avg', 'cpu_busy_max', 'disk_read_kbs_avg') == [
+        ('overall', 6, 301, 51.7, 90.0, 385.0),
+        ('collection_start -> infrastructure_creation', 1, 30, 30.0, 30.0, 110.0),
+        ('infrastructure_creation -> api_up', 2, 120, 60.0, 80.0, 275.0),
+        ('api_up -> bootstrap_complete', 1, 60, 90.0, 90.0, 440.0),
+        ('bootstrap_complete -> install_complete', 1, 60, 60.0, 60.0, 550.0),
+        ('install_complete -> collection_end', 1, 31, 10.0, 10.0, 660.0),
+    ]
+    assert result['phases'][2]['start'] == MILESTONES['infrastructure_creation']
+    assert result['report'][2] == (
+        'infrastructure_creation -> api_up (120s): cpu busy avg 60.0% / max 80.0%, steal avg 2.0% / max 3.0%, '
+        'iowait avg 4.0%, memory used max 12288.0 MB, disk read / write avg 275.0 / 550.0 KB/s, '
+        'network rx / tx avg 275.0 / 175.0 KB/s'
+    )
+
+
+def test_explicit_milestones(report):
+    result, archive = report('njmon', install_log=fixture_path('perf_data', 'openshift_install.log'), milestones={
+        'masters_ready': '2023-03-01T10:15:00Z',
+        'install_complete': '2023-03-01T10:16:45Z',
+        # milestones outside of the collection period don't start a phase
+        'infrastructure_destroyed': '2023-03-01T11:00:00Z',
+    })
+
+    assert list(result['milestones']) == list(MILESTONES)[:2] + ['masters_ready'] + list(MILESTONES)[2:] + ['infrastructure_destroyed']
+    assert result['milestones']['install_complete'] == '2023-03-01T10:16:45+00:00'
+
+    assert phase_summary(result['phases'][3:], 'duration') == [
+        ('api_up -> masters_ready', 0, 30),
+        ('masters_ready -> bootstrap_complete', 1, 30),
+        ('bootstrap_complete -> install_complete', 1, 75),
+        ('install_complete -> collection_end', 1, 16),
+    ]
+    assert result['report'][3] == 'api_up -> masters_ready (30s): no samples'
+
+
+def test_invalid_milestone(run_module, tmp_path):
+    result = run_module(perf_data_report, {
+        'data_dir': fixture_path('perf_data', 'njmon'),
+        'format': 'njmon',
+        'milestones': {'masters_ready': 'yesterday'},
+        'dest': str(tmp_path / 'njmon.json.gz'),
+    })
+
+    assert result['failed']
+    assert result['msg'] == 'Invalid timestamp for installation milestone masters_ready: yesterday'
+
+
+def test_check_mode(report, tmp_path):
+    result, archive = report('nmon', check_mode=True)
+
+    assert result['changed']
+    assert result['samples'] == len(SAMPLES)
+    assert archive is None
+    assert not (tmp_path / 'perf-data').exists()
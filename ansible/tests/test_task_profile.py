@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+# Tests for the task_profile callback plugin (callback_plugins/task_profile.py),
+# running playbooks against the implicit localhost.
+
+
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ANSIBLE_DIR
+
+
+PLAYBOOK = '''
+- hosts: localhost
+  gather_facts: false
+  tasks:
+    - name: succeed
+      ansible.builtin.debug:
+        msg: profiled
+      tags: [profiled]
+
+    - name: fail on demand
+      ansible.builtin.fail:
+      when: fail | default(false) | bool
+'''
+
+
+@pytest.fixture
+def run_playbook(tmp_path):
+    '''
+    Runs the playbook with the given command line arguments (and environment variables) and returns the directory
+    containing the output directories of the callback plugin.
+    '''
+    ansible_playbook = shutil.which('ansible-playbook', path=os.path.dirname(sys.executable)) or shutil.which('ansible-playbook')
+    if not ansible_playbook:
+        pytest.skip('ansible-playbook is not installed')
+
+    playbook = tmp_path / 'site.yml'
+    playbook.write_text(PLAYBOOK)
+
+    # the repository's 'ansible.cfg' requires collections not needed here
+    config = tmp_path / 'ansible.cfg'
+    config.write_text('[defaults]\n')
+
+    env = dict(
+        os.environ,
+        ANSIBLE_CONFIG=str(config),
+        ANSIBLE_LOCALHOST_WARNING='false',
+        ANSIBLE_CALLBACKS_ENABLED='task_profile',
+        ANSIBLE_CALLBACK_PLUGINS=os.path.join(ANSIBLE_DIR, 'callback_plugins'),
+        TASK_PROFILE_OUTPUT_DIR=str(tmp_path / 'profiles'),
+        TASK_PROFILE_PROMETHEUS_TEXTFILE_DIR=str(tmp_path / 'textfiles'),
+    )
+
+    def run(*args, **extra_env):
+        process = subprocess.run([ansible_playbook, str(playbook)] + list(args), env=dict(env, **extra_env), cwd=str(tmp_path),
+                                 stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        assert 'TASK PROFILE (site)' in process.stdout, process.stdout
+
+        return tmp_path
+
+    return run
+
+
+def read_profiles(tmp_path):
+    return [json.loads(open(f).read()) for f in sorted(glob.glob(str(tmp_path / 'profiles' / 'site-*.json')))]
+
+
+@pytest.mark.parametrize('args, flag', [
+    (['-e', 'fail=true'], 'failed'),
+    (['--tags', 'profiled'], 'limited_by_tags'),
+    (['--skip-tags', 'profiled'], 'limited_by_tags'),
+])
+def test_incomplete_run_is_no_baseline(run_playbook, args, flag):
+    tmp_path = run_playbook(*args)
+
+    profile = read_profiles(tmp_path)[0]
+    assert profile[flag]
+    assert not (tmp_path / 'profiles' / 'site.baseline.json').exists()
+
+
+def test_complete_run_is_baseline(run_playbook):
+    tmp_path = run_playbook()
+
+    profile = read_profiles(tmp_path)[0]
+    assert (profile['failed'], profile['unreachable'], profile['limited_by_tags']) == (False, False, False)
+    assert json.loads((tmp_path / 'profiles' / 'site.baseline.json').read_text()) == profile
+
+    # the Prometheus textfile is named after the playbook
+    metrics = (tmp_path / 'textfiles' / 'ocp_kvm_ipi_playbook_site.prom').read_text()
+    assert 'ocp_kvm_ipi_playbook_duration_seconds{playbook="site"}' in metrics
+
+
+def test_incomplete_run_doesnt_replace_baseline(run_playbook):
+    tmp_path = run_playbook()
+    baseline = (tmp_path / 'profiles' / 'site.baseline.json').read_text()
+
+    run_playbook('-e', 'fail=true', TASK_PROFILE_UPDATE_BASELINE='true')
+
+    assert (tmp_path / 'profiles' / 'site.baseline.json').read_text() == baseline